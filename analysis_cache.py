@@ -0,0 +1,90 @@
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from sqlite_store import LocalConnection
+
+logger = logging.getLogger(__name__)
+
+def decode_image(image):
+    """Raw bytes of a base64 image, with any data: URL prefix and whitespace removed"""
+    if ',' in image[:100]:
+        image = image.split(',', 1)[1]
+    try:
+        return base64.b64decode(image, validate=False)
+    except (binascii.Error, ValueError):
+        return image.encode()
+
+def image_set_key(images, salt=''):
+    """SHA-256 over each image's decoded bytes, in upload order, plus a salt (model/prompt)"""
+    digest = hashlib.sha256(salt.encode())
+    for image in images:
+        raw = image if isinstance(image, (bytes, bytearray, memoryview)) else decode_image(image)
+        digest.update(hashlib.sha256(raw).digest())
+    return digest.hexdigest()
+
+class AnalysisCache:
+    """Bounded SQLite cache of vehicle analyses, evicting least recently used rows"""
+
+    def __init__(self, db_path, max_entries=5000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._connect = LocalConnection(db_path)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'bypassed': 0}
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS analyses '
+                         '(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS analyses_last_used ON analyses (last_used)')
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def get(self, key, count=True):
+        try:
+            with self._connect() as conn:
+                row = conn.execute('SELECT value FROM analyses WHERE key = ?', (key,)).fetchone()
+                if row:
+                    conn.execute('UPDATE analyses SET last_used = ? WHERE key = ?', (time.time(), key))
+        except sqlite3.Error as e:
+            logger.warning("Analysis cache read error", extra={'error': str(e)})
+            row = None
+        if count:
+            self.count('hits' if row else 'misses')
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute('INSERT OR REPLACE INTO analyses (key, value, created, last_used) VALUES (?, ?, ?, ?)',
+                             (key, json.dumps(value), now, now))
+                evicted = conn.execute(
+                    'DELETE FROM analyses WHERE key IN (SELECT key FROM analyses ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,)
+                ).rowcount
+        except sqlite3.Error as e:
+            logger.warning("Analysis cache write error", extra={'error': str(e)})
+            return
+        self.count('stores')
+        if evicted:
+            self.count('evictions', evicted)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        try:
+            stats['entries'] = self._connect().execute('SELECT COUNT(*) FROM analyses').fetchone()[0]
+        except sqlite3.Error:
+            stats['entries'] = None
+        stats['max_entries'] = self.max_entries
+        stats['pid'] = os.getpid()
+        return stats
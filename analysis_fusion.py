@@ -0,0 +1,66 @@
+import re
+
+VEHICLE_FIELDS = ('marca', 'model', 'an_fabricatie', 'motor_capacitate', 'combustibil', 'emisii_co2')
+NUMERIC_FIELDS = ('emisii_co2',)
+DEFAULT_CONFIDENCE = 50.0
+
+def analysis_confidence(analysis):
+    """Self-reported 0-100 confidence of one analysis ('85', '85%', 0.85 all work)"""
+    match = re.search(r'\d+(?:\.\d+)?', str(analysis.get('confidence', '')))
+    if not match:
+        return DEFAULT_CONFIDENCE
+    value = float(match.group(0))
+    if value <= 1:
+        value *= 100
+    return min(max(value, 1.0), 100.0)
+
+def _number(value):
+    match = re.search(r'\d+(?:[.,]\d+)?', str(value))
+    return float(match.group(0).replace(',', '.')) if match else None
+
+def fuse_analyses(analyses):
+    """Merge per-image analyses field by field, weighting each answer by its confidence.
+
+    Text fields take the value with the most total weight (compared case-
+    insensitively); numeric fields take the weighted mean. field_confidence is
+    the share of weight that agreed with the chosen value.
+    """
+    if len(analyses) == 1:
+        return dict(analyses[0])
+
+    weights = [analysis_confidence(a) for a in analyses]
+    fused, agreement = {}, {}
+    for field in VEHICLE_FIELDS:
+        answers = [(a[field], w) for a, w in zip(analyses, weights) if a.get(field) not in (None, '', 'Unknown')]
+        if not answers:
+            continue
+        total = sum(w for _, w in answers)
+
+        if field in NUMERIC_FIELDS:
+            numbers = [(_number(v), w) for v, w in answers if _number(v) is not None]
+            if numbers:
+                mean = sum(n * w for n, w in numbers) / sum(w for _, w in numbers)
+                fused[field] = str(round(mean))
+                spread = max(n for n, _ in numbers) - min(n for n, _ in numbers)
+                agreement[field] = round(100 * (1 - min(spread / max(mean, 1), 1)))
+                continue
+
+        votes = {}
+        for value, w in answers:
+            key = str(value).strip().casefold()
+            best = votes.setdefault(key, [0.0, value, 0.0])
+            best[0] += w
+            if w > best[2]:
+                best[1], best[2] = value, w
+        weight, value, _ = max(votes.values(), key=lambda v: v[0])
+        fused[field] = value
+        agreement[field] = round(100 * weight / total)
+
+    # Keep anything else the model returned from the most confident answer
+    most_confident = analyses[max(range(len(analyses)), key=lambda i: weights[i])]
+    for key, value in most_confident.items():
+        fused.setdefault(key, value)
+    fused['confidence'] = str(round(sum(w * w for w in weights) / sum(weights)))
+    fused['field_confidence'] = agreement
+    fused['images_analyzed'] = len(analyses)
+    return fused
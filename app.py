@@ -1,126 +1,226 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
+from concurrent.futures import ThreadPoolExecutor
 import anthropic
 import os
 import json
 import re
+import tempfile
 import base64
-import requests
-import traceback
+import time
+import logging
+import uuid
+from datetime import datetime, timezone
+
+try:
+    from gevent import monkey as gevent_monkey
+    from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+except ImportError:
+    gevent_monkey = None
+from market_cache import MarketEstimateCache, normalize_text, normalize_vehicle_key
+from market_jobs import MarketEstimateJobs
+from rates import ExchangeRateService
+import batch
+import sweep
+from tariffs import DEFAULT_TARIFF_FILE, load_tariffs
+from shipping_planner import plan_shipment
+from shipping_rates import calculate_shipping_cost, shipping_details
+from analysis_cache import AnalysisCache, decode_image, image_set_key
+from image_pipeline import ImageTooLarge, preprocess_image, sniff_media_type
+from analysis_fusion import fuse_analyses
+from stream_parser import IncrementalFieldParser, parse_json_object
+from claude_scheduler import BACKGROUND, INTERACTIVE, ClaudeBusy, ClaudeScheduler, TokenBudget
+from single_flight import SingleFlight
+from price_index import DEFAULT_INDEX_DIR, load_price_index
+from frontend import DEFAULT_INDEX, Frontend
+from quote_store import QuoteStore, decode_cursor, encode_cursor, quote_key, quote_versions
+import telemetry
+from telemetry import stage
+from collections import deque
+
+telemetry.configure_logging(os.environ.get('LOG_LEVEL', 'INFO'), os.environ.get('LOG_FORMAT', 'json'))
+logger = logging.getLogger('app')
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider with response serialization timed as the 'serialize' stage"""
+
+    def dumps(self, obj, **kwargs):
+        with stage('serialize'):
+            return super().dumps(obj, **kwargs)
 
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app)
 
+@app.before_request
+def start_timings():
+    g.telemetry = telemetry.start_request()
+
+@app.after_request
+def add_server_timing(response):
+    header = telemetry.finish_request(g.pop('telemetry', None), request.endpoint, request.method, response.status_code)
+    if header:
+        response.headers['Server-Timing'] = header
+    return response
+
+@app.teardown_request
+def drop_timings(exc):
+    # after_request is skipped for unhandled errors; don't leak this request's timings into the next one
+    token = g.pop('telemetry', None)
+    if token is not None:
+        telemetry.finish_request(token, request.endpoint, request.method, 500)
+
 ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY', '')
-if ANTHROPIC_API_KEY:
-    client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+# Created on first use in each worker: its connection pool must not be shared across a --preload fork
+client = None
+_client_pid = None
+
+def get_client():
+    """This process's Anthropic client (None without an API key); a client assigned to app.client is kept"""
+    global client, _client_pid
+    if ANTHROPIC_API_KEY and (client is None or _client_pid not in (None, os.getpid())):
+        client, _client_pid = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY), os.getpid()
+    return client
+
+# Every Claude call goes through one scheduler: bounded concurrency per worker, a tokens-per-minute
+# budget shared by all workers, interactive analyses ahead of background estimates, 429/529 retries
+claude = ClaudeScheduler(
+    get_client,
+    TokenBudget(
+        os.environ.get('CLAUDE_BUDGET_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'claude_budget.sqlite3')),
+        tokens_per_minute=int(os.environ.get('CLAUDE_TOKENS_PER_MINUTE', 200000))
+    ),
+    max_concurrent=int(os.environ.get('CLAUDE_MAX_CONCURRENT', 8)),
+    max_queue=int(os.environ.get('CLAUDE_MAX_QUEUE', 32)),
+    queue_timeout=int(os.environ.get('CLAUDE_QUEUE_TIMEOUT', 30)),
+    max_retries=int(os.environ.get('CLAUDE_MAX_RETRIES', 4))
+)
+
+# Market estimates run off the request path; /api/calculate-costs only hands out a job id
+MARKET_ESTIMATE_WORKERS = int(os.environ.get('MARKET_ESTIMATE_WORKERS', 4))
+MARKET_ESTIMATE_JOB_TTL = int(os.environ.get('MARKET_ESTIMATE_JOB_TTL', 600))
+market_estimate_pool = ThreadPoolExecutor(max_workers=MARKET_ESTIMATE_WORKERS, thread_name_prefix='market-estimate')
+# Job status is in SQLite so any worker can answer a poll; the futures of this worker's own jobs let its streams wait
+market_estimate_jobs = MarketEstimateJobs(
+    os.environ.get('MARKET_CACHE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'market_estimates.sqlite3')),
+    ttl=MARKET_ESTIMATE_JOB_TTL
+)
+market_estimate_futures = {}
+
+# Dense BPM lookup tables, one per effective-dated schedule in data/bpm_tariffs.json
+bpm_tariffs = load_tariffs(os.environ.get('BPM_TARIFF_FILE', DEFAULT_TARIFF_FILE))
+
+# Phone photos are downscaled, EXIF-stripped and re-encoded before they go to Claude Vision
+IMAGE_PREPROCESS = os.environ.get('IMAGE_PREPROCESS', '1') != '0'
+IMAGE_MAX_EDGE = int(os.environ.get('IMAGE_MAX_EDGE', 1568))
+IMAGE_FORMAT = os.environ.get('IMAGE_FORMAT', 'jpeg').lower()
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', 85))
+
+def cpu_pool(max_workers, thread_name_prefix):
+    """Executor for CPU-bound work: under gevent workers (gunicorn_async.conf.py) threads are greenlets
+    sharing the event loop, so use gevent's native-thread pool there instead"""
+    if gevent_monkey is not None and gevent_monkey.is_module_patched('threading'):
+        return NativeThreadPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+
+image_pool = cpu_pool(int(os.environ.get('IMAGE_WORKERS', 4)), 'image-preprocess')
+
+# Binary uploads (multipart or raw image bodies) are spooled to disk past UPLOAD_SPOOL_BYTES
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 60 * 1024 * 1024))
+UPLOAD_MAX_IMAGE_BYTES = int(os.environ.get('UPLOAD_MAX_IMAGE_BYTES', 20 * 1024 * 1024))
+UPLOAD_SPOOL_BYTES = int(os.environ.get('UPLOAD_SPOOL_BYTES', 1024 * 1024))
+
+# 'parallel' analyzes each photo separately and fuses the answers; 'packed' sends all photos in one call
+ANALYSIS_MODE = os.environ.get('ANALYSIS_MODE', 'parallel').lower()
+analysis_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('ANALYSIS_CONCURRENCY', 8)), thread_name_prefix='vehicle-analysis')
+
+# Recent time-to-first-field / total samples for /api/analyze-vehicle/stream
+stream_first_field_ms = deque(maxlen=1000)
+stream_total_ms = deque(maxlen=1000)
+
+analysis_cache = AnalysisCache(
+    os.environ.get('ANALYSIS_CACHE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'vehicle_analyses.sqlite3')),
+    max_entries=int(os.environ.get('ANALYSIS_CACHE_SIZE', 5000))
+)
+
+BATCH_CHUNK_SIZE = int(os.environ.get('BATCH_CHUNK_SIZE', 2048))
+SWEEP_MAX_CELLS = int(os.environ.get('SWEEP_MAX_CELLS', 2000000))
 
-exchange_rates_cache = {}
+# Identical in-flight Claude calls are collapsed; leases in this table coordinate gunicorn workers
+SINGLE_FLIGHT_DB = os.environ.get('SINGLE_FLIGHT_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'inflight.sqlite3'))
+market_flight = SingleFlight(SINGLE_FLIGHT_DB, 'market_estimate')
+analysis_flight = SingleFlight(SINGLE_FLIGHT_DB, 'vehicle_analysis')
+
+# Comparable sales from our own history answer most estimates locally; Claude is the fallback
+price_index = load_price_index(
+    os.environ.get('PRICE_INDEX_DIR', DEFAULT_INDEX_DIR),
+    min_comparables=int(os.environ.get('PRICE_INDEX_MIN_COMPARABLES', 8))
+)
+
+# Dealers re-quote the same models all day; the SQLite tier is shared by every gunicorn worker
+market_cache = MarketEstimateCache(
+    os.environ.get('MARKET_CACHE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'market_estimates.sqlite3')),
+    max_entries=int(os.environ.get('MARKET_CACHE_SIZE', 1024)),
+    ttl=int(os.environ.get('MARKET_CACHE_TTL', 6 * 3600))
+)
+
+# Every /api/calculate-costs result, keyed by its inputs and pricing versions; identical re-quotes are read back
+quote_store = QuoteStore(
+    os.environ.get('QUOTE_STORE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'quotes.sqlite3'))
+)
+QUOTE_HISTORY_LIMIT = int(os.environ.get('QUOTE_HISTORY_LIMIT', 500))
+
+# Rates are served from memory; a background thread refreshes them from exchangerate-api
+exchange_rate_service = ExchangeRateService(
+    os.environ.get('EXCHANGE_RATES_URL', 'https://api.exchangerate-api.com/v4/latest/EUR'),
+    os.environ.get('EXCHANGE_RATES_SNAPSHOT', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'exchange_rates.json')),
+    currencies=os.environ.get('EXCHANGE_RATE_CURRENCIES', 'EUR,AED,USD,GBP,JPY').split(','),
+    upstream_period=int(os.environ.get('EXCHANGE_RATES_PERIOD', 86400)),
+    retry_interval=int(os.environ.get('EXCHANGE_RATES_RETRY', 300))
+)
+
+# Built at import (once in the master under --preload): hashed CSS/JS assets and gzip/br variants in memory
+frontend = Frontend(os.environ.get('FRONTEND_INDEX', DEFAULT_INDEX))
+
+def warm_caches():
+    """Load the rates snapshot and the newest market estimates from the shared tiers into memory.
+
+    Runs at import, so under gunicorn --preload it happens once in the master and
+    every worker starts with the pages copy-on-write; otherwise each worker warms itself.
+    """
+    rates = exchange_rate_service.load_snapshot()
+    estimates = market_cache.warm(int(os.environ.get('MARKET_CACHE_WARM', 1024)))
+    logger.info("Caches warmed", extra={'rates_snapshot': rates, 'market_estimates': estimates})
+
+if os.environ.get('WARM_CACHES', '1') != '0':
+    warm_caches()
 
 def get_exchange_rates():
-    """Get real-time exchange rates"""
-    global exchange_rates_cache
-    try:
-        response = requests.get('https://api.exchangerate-api.com/v4/latest/EUR', timeout=5)
-        data = response.json()
-        exchange_rates_cache = {
-            'EUR_TO_AED': data['rates']['AED'],
-            'EUR_TO_USD': data['rates']['USD'],
-            'AED_TO_EUR': 1 / data['rates']['AED'],
-            'USD_TO_EUR': 1 / data['rates']['USD'],
-            'AED_TO_USD': data['rates']['USD'] / data['rates']['AED'],
-            'USD_TO_AED': data['rates']['AED'] / data['rates']['USD'],
-            'timestamp': data['time_last_updated']
-        }
-        return exchange_rates_cache
-    except Exception as e:
-        print(f"Exchange rate API error: {e}")
-        return {
-            'EUR_TO_AED': 3.95, 'EUR_TO_USD': 1.09,
-            'AED_TO_EUR': 0.253, 'USD_TO_EUR': 0.917,
-            'AED_TO_USD': 0.272, 'USD_TO_AED': 3.67,
-            'timestamp': 'fallback'
-        }
+    """Get exchange rates (last good rates with a 'stale' flag if upstream is down)"""
+    with stage('rates'):
+        return exchange_rate_service.get()
 
 def detect_image_type(base64_string):
-    """Detect image type from base64"""
+    """Detect image type from the magic bytes of a base64 image"""
+    if ',' in base64_string[:100]:
+        base64_string = base64_string.split(',', 1)[1]
     try:
-        if ',' in base64_string:
-            base64_string = base64_string.split(',')[1]
-        
-        img_data = base64.b64decode(base64_string[:100])
-        if img_data.startswith(b'\xff\xd8\xff'): 
-            return 'image/jpeg'
-        elif img_data.startswith(b'\x89PNG\r\n\x1a\n'): 
-            return 'image/png'
-        elif img_data.startswith(b'GIF87a') or img_data.startswith(b'GIF89a'): 
-            return 'image/gif'
-        elif img_data[0:4] == b'RIFF' and img_data[8:12] == b'WEBP': 
-            return 'image/webp'
-        elif b'ftyp' in img_data[4:12]:
-            if b'avif' in img_data[8:20] or b'avis' in img_data[8:20]: 
-                return 'image/avif'
+        media_type = sniff_media_type(base64.b64decode(base64_string[:64]))
+        if media_type:
+            return media_type
     except Exception as e:
-        print(f"Image type detection error: {e}")
-    
-    if base64_string.startswith('/9j/'): 
-        return 'image/jpeg'
-    elif base64_string.startswith('iVBOR'): 
-        return 'image/png'
-    elif base64_string.startswith('R0lGO'): 
-        return 'image/gif'
-    elif base64_string.startswith('UklGR'): 
-        return 'image/webp'
+        logger.warning("Image type detection error", extra={'error': str(e)})
     
     return 'image/jpeg'
 
 def calculate_bpm(co2, year, fuel_type):
-    """Calculate Dutch BPM tax"""
-    age = 2025 - year
-    if age >= 5: return 0
-    bpm = 400
-    if co2 > 82:
-        bpm += (min(co2,140)-82)*80
-        if co2 > 140: bpm += (min(co2,180)-140)*120
-        if co2 > 180: bpm += (co2-180)*180
-    if fuel_type.lower()=='diesel' and co2>82: bpm += (co2-82)*90
-    return round(bpm * (1 - min(age*0.2, 1.0)), 2)
-
-def calculate_shipping_cost(container_type, vehicle_dimensions):
-    """Calculate detailed shipping costs"""
-    if container_type == 'roro':
-        base_cost = 800
-        if vehicle_dimensions.get('length', 0) > 5: base_cost += 200
-        if vehicle_dimensions.get('height', 0) > 2: base_cost += 150
-        return {
-            'shipping_method': 'RoRo (Roll-on/Roll-off)',
-            'base_shipping': base_cost, 'loading_fee': 150,
-            'unloading_fee': 150, 'securing_fee': 50,
-            'insurance': 100, 'total': base_cost + 450
-        }
-    elif container_type == 'container_20ft':
-        return {
-            'shipping_method': '20ft Container',
-            'base_shipping': 1500, 'loading_fee': 200,
-            'unloading_fee': 200, 'securing_fee': 100,
-            'container_rental': 150, 'insurance': 150, 'total': 2300
-        }
-    elif container_type == 'container_40ft':
-        return {
-            'shipping_method': '40ft Container',
-            'base_shipping': 2200, 'loading_fee': 300,
-            'unloading_fee': 300, 'securing_fee': 150,
-            'container_rental': 200, 'insurance': 250, 'total': 3400
-        }
-    return calculate_shipping_cost('roro', vehicle_dimensions)
+    """Calculate Dutch BPM tax from the schedule in force today"""
+    return bpm_tariffs.bpm(co2, year, fuel_type)
 
-def estimate_market_price_ai(vehicle_data):
-    """Use Claude AI to estimate EU market price"""
-    if not client:
-        return None
-    
-    try:
-        prompt = f"""You are an automotive market analyst. Estimate the current EU market price (in EUR) for this vehicle:
+def _ask_market_estimate(vehicle_data, cache_key):
+    prompt = f"""You are an automotive market analyst. Estimate the current EU market price (in EUR) for this vehicle:
 
 Make: {vehicle_data.get('marca', 'Unknown')}
 Model: {vehicle_data.get('model', 'Unknown')}
@@ -138,111 +238,427 @@ Consider:
 Provide realistic price range and average. Return JSON only:
 {{"min_price": 25000, "max_price": 35000, "avg_price": 30000, "confidence": "high", "notes": "Popular model, strong demand"}}"""
 
-        msg = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=500,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        txt = re.sub(r'^```json\s*|\s*```$', '', msg.content[0].text.strip(), flags=re.MULTILINE)
-        result = json.loads(txt)
+    msg = claude.create(
+        BACKGROUND,
+        model="claude-sonnet-4-20250514",
+        max_tokens=500,
+        messages=[{"role": "user", "content": prompt}]
+    )
+    
+    txt = re.sub(r'^```json\s*|\s*```$', '', msg.content[0].text.strip(), flags=re.MULTILINE)
+    result = json.loads(txt)
+    market_cache.set(cache_key, result)
+    return result
+
+def local_market_estimate(vehicle_data):
+    """Price-index estimate when there are enough comparables, else a cached Claude estimate, else None"""
+    if price_index is not None:
+        result = price_index.estimate(vehicle_data)
+        if result is not None:
+            return result
+    return market_cache.get(normalize_vehicle_key(vehicle_data))
+
+def estimate_market_price_ai(vehicle_data, check_cache=True):
+    """Use Claude AI to estimate EU market price"""
+    cache_key = normalize_vehicle_key(vehicle_data)
+    if check_cache:
+        cached = local_market_estimate(vehicle_data)
+        if cached is not None:
+            return cached
+    
+    if not get_client():
+        return None
+    
+    try:
+        # Identical vehicles quoted at the same time (in any worker) share one Claude call
+        result, _ = market_flight.do(cache_key, lambda: _ask_market_estimate(vehicle_data, cache_key),
+                                     lookup=lambda key: market_cache.get(key, count=False))
         return result
         
-    except Exception as e:
-        print(f"Market estimation error: {e}")
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Market estimation error", extra={'vehicle': cache_key})
         return None
 
+def _run_market_estimate_job(job_id, vehicle_data, quote_id=None):
+    # The caller already missed the price index and cache for this vehicle
+    result = estimate_market_price_ai(vehicle_data, check_cache=False)
+    market_estimate_jobs.finish(job_id, result)
+    if quote_id is not None:
+        quote_store.set_market_estimate(quote_id, result)
+    return result
+
+def submit_market_estimate(vehicle_data, quote_id=None):
+    """Queue a market estimate on the worker pool and return its job handle; a queued job's result is attached to quote_id"""
+    return start_market_estimate(vehicle_data, local_market_estimate(vehicle_data), quote_id)
+
+def start_market_estimate(vehicle_data, cached, quote_id=None):
+    """submit_market_estimate() for a caller that already has local_market_estimate()'s answer (None: a miss)"""
+    job_id = uuid.uuid4().hex
+    if cached is not None:
+        market_estimate_jobs.create(job_id, cached)
+        return {'job_id': job_id, 'status': 'done', 'result': cached,
+                'poll_url': f'/api/market-estimate/{job_id}',
+                'stream_url': f'/api/market-estimate/{job_id}/stream'}
+    
+    if not get_client():
+        return None
+    
+    market_estimate_jobs.create(job_id)
+    future = market_estimate_pool.submit(_run_market_estimate_job, job_id, vehicle_data, quote_id)
+    market_estimate_futures[job_id] = future
+    future.add_done_callback(lambda _: market_estimate_futures.pop(job_id, None))
+    
+    return {
+        'job_id': job_id, 'status': 'pending',
+        'poll_url': f'/api/market-estimate/{job_id}',
+        'stream_url': f'/api/market-estimate/{job_id}/stream'
+    }
+
 @app.route('/')
 def home():
-    return '''<!DOCTYPE html><html><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width,initial-scale=1.0"><title>Vehicle Import Calculator v2.0</title><style>*{margin:0;padding:0;box-sizing:border-box}body{font-family:-apple-system,BlinkMacSystemFont,'Segoe UI',Roboto,sans-serif;background:linear-gradient(135deg,#667eea 0%,#764ba2 100%);min-height:100vh;padding:10px}@media(min-width:768px){body{padding:20px}}.container{max-width:1100px;margin:0 auto;background:white;border-radius:20px;padding:20px;box-shadow:0 20px 60px rgba(0,0,0,0.3)}@media(min-width:768px){.container{padding:40px}}h1{color:#667eea;text-align:center;margin-bottom:10px;font-size:1.5em}@media(min-width:768px){h1{font-size:2em}}.subtitle{text-align:center;color:#666;margin-bottom:20px;font-size:0.9em}@media(min-width:768px){.subtitle{margin-bottom:30px;font-size:1em}}.version{text-align:center;color:#999;font-size:0.75em;margin-bottom:15px}@media(min-width:768px){.version{font-size:0.85em;margin-bottom:20px}}.upload-zone{border:3px dashed #667eea;border-radius:15px;padding:20px;text-align:center;cursor:pointer;transition:all 0.3s;margin-bottom:10px}@media(min-width:768px){.upload-zone{padding:40px;margin-bottom:15px}}.upload-zone:hover{background:#f8f9ff}.upload-zone.dragover{background:#e8ebff;border-color:#764ba2}.upload-zone p{font-size:0.9em}@media(min-width:768px){.upload-zone p{font-size:1em}}.manual-entry-btn{background:linear-gradient(135deg,#28a745 0%,#20c997 100%);color:white;border:none;padding:12px 20px;border-radius:10px;font-size:1em;cursor:pointer;width:100%;margin-bottom:20px;transition:all 0.3s}@media(min-width:768px){.manual-entry-btn{padding:15px 30px;font-size:1.1em;margin-bottom:30px}}.manual-entry-btn:hover{transform:translateY(-2px);box-shadow:0 5px 15px rgba(40,167,69,0.3)}.image-grid{display:grid;grid-template-columns:repeat(2,1fr);gap:10px;margin:15px 0}@media(min-width:768px){.image-grid{grid-template-columns:repeat(auto-fit,minmax(200px,1fr));gap:15px;margin:20px 0}}.image-preview{max-width:100%;height:120px;object-fit:cover;border-radius:10px;border:2px solid #667eea}@media(min-width:768px){.image-preview{height:150px}}.image-slot{position:relative;text-align:center;padding:8px;background:#f8f9ff;border-radius:10px}@media(min-width:768px){.image-slot{padding:10px}}.remove-image{position:absolute;top:3px;right:3px;background:red;color:white;border:none;border-radius:50%;width:20px;height:20px;cursor:pointer;font-weight:bold;font-size:0.8em}@media(min-width:768px){.remove-image{top:5px;right:5px;width:25px;height:25px;font-size:1em}}.loading{text-align:center;padding:20px;display:none}.spinner{border:4px solid #f3f3f3;border-top:4px solid #667eea;border-radius:50%;width:40px;height:40px;animation:spin 1s linear infinite;margin:0 auto 10px}@media(min-width:768px){.spinner{width:50px;height:50px}}@keyframes spin{0%{transform:rotate(0deg)}100%{transform:rotate(360deg)}}.result-grid{display:grid;grid-template-columns:1fr;gap:10px;margin:15px 0}@media(min-width:768px){.result-grid{grid-template-columns:repeat(auto-fit,minmax(200px,1fr));gap:15px;margin:20px 0}}.result-item{background:#f8f9ff;padding:12px;border-radius:10px}@media(min-width:768px){.result-item{padding:15px}}.result-label{font-size:0.8em;color:#666;margin-bottom:5px}@media(min-width:768px){.result-label{font-size:0.85em}}.edit-input{width:100%;padding:8px;border:2px solid #667eea;border-radius:5px;font-size:0.9em;margin-top:5px}@media(min-width:768px){.edit-input{font-size:1em}}button{background:linear-gradient(135deg,#667eea 0%,#764ba2 100%);color:white;border:none;padding:12px 20px;border-radius:10px;font-size:1em;cursor:pointer;width:100%;margin:10px 0}@media(min-width:768px){button{padding:15px 30px;font-size:1.1em}}button:hover{transform:translateY(-2px)}button:disabled{opacity:0.5;cursor:not-allowed}.price-section{background:#f8f9ff;padding:15px;border-radius:10px;margin:15px 0}@media(min-width:768px){.price-section{padding:20px;margin:20px 0}}.price-grid{display:grid;grid-template-columns:1fr;gap:10px;margin-bottom:15px}@media(min-width:768px){.price-grid{grid-template-columns:1fr 1fr 1fr;gap:15px;margin-bottom:20px}}.price-input{width:100%;padding:12px;font-size:1em;border:2px solid #667eea;border-radius:10px}@media(min-width:768px){.price-input{padding:15px;font-size:1.1em}}.shipping-section{background:#fff3cd;padding:15px;border-radius:10px;margin:15px 0}@media(min-width:768px){.shipping-section{padding:20px;margin:20px 0}}.shipping-options{display:grid;grid-template-columns:1fr;gap:10px;margin:10px 0}@media(min-width:768px){.shipping-options{grid-template-columns:repeat(3,1fr);gap:15px;margin:15px 0}}.shipping-option{padding:12px;border:2px solid #ddd;border-radius:10px;cursor:pointer;text-align:center;transition:all 0.3s}@media(min-width:768px){.shipping-option{padding:15px}}.shipping-option:hover,.shipping-option.selected{border-color:#667eea;background:#f8f9ff}.dimension-inputs{display:grid;grid-template-columns:1fr 1fr;gap:8px;margin:10px 0}@media(min-width:768px){.dimension-inputs{grid-template-columns:repeat(4,1fr);gap:10px;margin:15px 0}}.dimension-input{padding:8px;border:2px solid #ddd;border-radius:5px;font-size:0.9em}@media(min-width:768px){.dimension-input{padding:10px;font-size:1em}}.cost-comparison{display:grid;grid-template-columns:1fr;gap:15px;margin:15px 0}@media(min-width:768px){.cost-comparison{grid-template-columns:repeat(3,1fr);gap:20px;margin:20px 0}}.cost-card{background:white;border:2px solid #ddd;border-radius:15px;padding:15px}@media(min-width:768px){.cost-card{padding:20px}}.cost-card.recommended{border-color:#28a745;background:#f0fff4}.cost-card h3{margin-bottom:10px;color:#667eea;font-size:1em}@media(min-width:768px){.cost-card h3{margin-bottom:15px;font-size:1.2em}}.cost-line{display:flex;justify-content:space-between;padding:6px 0;border-bottom:1px solid #eee;font-size:0.85em}@media(min-width:768px){.cost-line{padding:8px 0;font-size:1em}}.cost-total{font-size:1.1em;font-weight:bold;color:#667eea;margin-top:8px}@media(min-width:768px){.cost-total{font-size:1.3em;margin-top:10px}}.recommendation{background:linear-gradient(135deg,#667eea 0%,#764ba2 100%);color:white;padding:15px;border-radius:15px;text-align:center;font-size:1em;margin:15px 0}@media(min-width:768px){.recommendation{padding:20px;font-size:1.2em;margin:20px 0}}.exchange-info{text-align:center;color:#666;font-size:0.75em;margin:8px 0;padding:8px;background:#fff;border-radius:5px}@media(min-width:768px){.exchange-info{font-size:0.85em;margin:10px 0;padding:10px}}.shipping-details{background:#f8f9ff;padding:12px;border-radius:10px;margin:12px 0}@media(min-width:768px){.shipping-details{padding:15px;margin:15px 0}}.shipping-breakdown{display:grid;grid-template-columns:1fr auto;gap:8px;margin:8px 0;font-size:0.8em}@media(min-width:768px){.shipping-breakdown{gap:10px;margin:10px 0;font-size:0.9em}}.alert{padding:12px;border-radius:10px;margin:15px 0;font-size:0.85em}@media(min-width:768px){.alert{padding:15px;margin:20px 0;font-size:1em}}.alert-info{background:#d1ecf1;border:1px solid #bee5eb;color:#0c5460}.profitability-section{margin:20px 0}@media(min-width:768px){.profitability-section{margin:30px 0}}.profitability-card{padding:20px;border-radius:15px;border:3px solid;margin:15px 0}@media(min-width:768px){.profitability-card{padding:25px;margin:20px 0}}.profit-high{background:#d4edda;border-color:#28a745;color:#155724}.profit-medium{background:#fff3cd;border-color:#ffc107;color:#856404}.profit-low{background:#f8d7da;border-color:#dc3545;color:#721c24}.market-estimate{background:#e7f3ff;padding:15px;border-radius:10px;margin:15px 0;border-left:5px solid #667eea}@media(min-width:768px){.market-estimate{padding:20px;margin:20px 0}}.market-sources{display:grid;grid-template-columns:repeat(3,1fr);gap:8px;margin:12px 0}@media(min-width:768px){.market-sources{grid-template-columns:repeat(auto-fit,minmax(150px,1fr));gap:10px;margin:15px 0}}.source-badge{padding:6px;background:#f8f9ff;border-radius:5px;text-align:center;font-size:0.7em;border:1px solid #ddd}@media(min-width:768px){.source-badge{padding:8px;font-size:0.85em}}.profit-breakdown{display:grid;grid-template-columns:1fr auto;gap:10px;margin:10px 0;font-size:0.95em;padding:8px;background:#fff;border-radius:5px}@media(min-width:768px){.profit-breakdown{gap:15px;margin:15px 0;font-size:1.1em;padding:10px}}.profit-percentage{font-size:1.5em;font-weight:bold;text-align:center;margin:15px 0}@media(min-width:768px){.profit-percentage{font-size:2em;margin:20px 0}}.manual-override{background:#fff3cd;padding:12px;border-radius:10px;margin:12px 0;border-left:5px solid #ffc107}@media(min-width:768px){.manual-override{padding:15px;margin:15px 0}}h2,h3,h4{font-size:1.2em;margin-bottom:10px}@media(min-width:768px){h2,h3,h4{font-size:1.5em;margin-bottom:15px}}</style></head><body><div class="container"><h1>🚗 Vehicle Import Calculator</h1><p class="subtitle">Dubai → Rotterdam → EU | AI-Powered Analysis</p><p class="version">v2.0 Phase 2 - Mobile Optimized | Easy Reset</p><div class="upload-zone" id="uploadZone"><p>📸 Upload up to 4 vehicle photos</p><p style="font-size:0.8em;color:#666;margin-top:8px">Click or drag & drop</p><input type="file" id="fileInput" accept="image/*" multiple style="display:none"></div><button class="manual-entry-btn" onclick="resetAnalysis();showManualEntry()">✍️ Add manual vehicle specs</button><div class="image-grid" id="imageGrid"></div><div class="loading" id="loading"><div class="spinner"></div><p>Analyzing with Claude AI...</p></div><div id="vehicleResults" style="display:none"><h2>Vehicle Analysis</h2><div class="result-grid"><div class="result-item"><div class="result-label">Make & Model</div><input type="text" id="edit_marca" class="edit-input" placeholder="Make"><input type="text" id="edit_model" class="edit-input" placeholder="Model" style="margin-top:5px"></div><div class="result-item"><div class="result-label">Year</div><input type="number" id="edit_year" class="edit-input" placeholder="2020"></div><div class="result-item"><div class="result-label">Engine</div><input type="text" id="edit_engine" class="edit-input" placeholder="2.0L"></div><div class="result-item"><div class="result-label">Fuel</div><select id="edit_fuel" class="edit-input"><option value="benzina">Benzina</option><option value="diesel">Diesel</option><option value="hybrid">Hybrid</option><option value="electric">Electric</option></select></div><div class="result-item"><div class="result-label">CO2 (g/km)</div><input type="number" id="edit_co2" class="edit-input" placeholder="180"></div></div><div class="shipping-section"><h3>🚢 Shipping</h3><div class="shipping-options"><div class="shipping-option" data-method="roro" onclick="selectShipping('roro')"><strong>RoRo</strong><p style="font-size:0.75em;margin-top:3px">Cheapest</p></div><div class="shipping-option" data-method="container_20ft" onclick="selectShipping('container_20ft')"><strong>20ft</strong><p style="font-size:0.75em;margin-top:3px">Secure</p></div><div class="shipping-option" data-method="container_40ft" onclick="selectShipping('container_40ft')"><strong>40ft</strong><p style="font-size:0.75em;margin-top:3px">Large</p></div></div><h4 style="margin:10px 0 8px;font-size:1em">Dimensions (Optional)</h4><div class="dimension-inputs"><input type="number" id="dim_length" class="dimension-input" placeholder="Length (m)" step="0.1"><input type="number" id="dim_width" class="dimension-input" placeholder="Width (m)" step="0.1"><input type="number" id="dim_height" class="dimension-input" placeholder="Height (m)" step="0.1"><input type="number" id="dim_weight" class="dimension-input" placeholder="Weight (kg)"></div></div><div class="price-section"><h3>💰 Purchase Price</h3><div class="price-grid"><div><label style="font-size:0.85em;color:#666">AED</label><input type="number" id="priceAED" class="price-input" placeholder="0" oninput="convertCurrency('AED')"></div><div><label style="font-size:0.85em;color:#666">USD</label><input type="number" id="priceUSD" class="price-input" placeholder="0" oninput="convertCurrency('USD')"></div><div><label style="font-size:0.85em;color:#666">EUR</label><input type="number" id="priceEUR" class="price-input" placeholder="0" oninput="convertCurrency('EUR')"></div></div><div class="exchange-info" id="exchangeInfo">Loading...</div><button onclick="calculateCosts()">📊 Calculate Costs</button></div></div><div id="costResults" style="display:none"><h2>💶 Cost Analysis</h2><div class="alert alert-info"><strong>Three scenarios:</strong> FREE ZONE | STANDARD | 🎯 NO BPM</div><div class="cost-comparison"><div class="cost-card" id="freeZoneCard"><h3>🆓 FREE ZONE</h3><div id="freeZoneCosts"></div></div><div class="cost-card" id="standardCard"><h3>📋 STANDARD</h3><div id="standardCosts"></div></div><div class="cost-card" id="noBpmCard"><h3>🎯 NO BPM</h3><div id="noBpmCosts"></div></div></div><div class="shipping-details" id="shippingBreakdown"></div><div class="recommendation" id="recommendation"></div><div class="profitability-section" id="profitabilitySection" style="display:none"><h2>📈 Profitability</h2><div class="market-estimate" id="marketEstimate"></div><div class="manual-override"><h4 style="font-size:1em">💡 Manual Override</h4><p style="font-size:0.85em;margin:8px 0">Know the market price? Enter it:</p><input type="number" id="manualMarketPrice" class="price-input" placeholder="Market price (EUR)" oninput="recalculateProfit()"></div><div id="profitabilityCard"></div></div></div></div><script>let vehicleData={};let uploadedImages=[];let selectedShipping='roro';let exchangeRates={};let marketEstimate=null;let calculatedCosts=null;const MAX_IMAGES=4;const uploadZone=document.getElementById('uploadZone');const fileInput=document.getElementById('fileInput');const imageGrid=document.getElementById('imageGrid');function resetAnalysis(){uploadedImages=[];vehicleData={};marketEstimate=null;calculatedCosts=null;imageGrid.innerHTML='';document.getElementById('vehicleResults').style.display='none';document.getElementById('costResults').style.display='none';document.getElementById('profitabilitySection').style.display='none';document.getElementById('edit_marca').value='';document.getElementById('edit_model').value='';document.getElementById('edit_year').value='';document.getElementById('edit_engine').value='';document.getElementById('edit_fuel').value='benzina';document.getElementById('edit_co2').value='';document.getElementById('priceAED').value='';document.getElementById('priceUSD').value='';document.getElementById('priceEUR').value='';document.getElementById('manualMarketPrice').value='';fileInput.value='';window.scrollTo({top:0,behavior:'smooth'})}uploadZone.onclick=()=>{resetAnalysis();fileInput.click()};uploadZone.ondragover=(e)=>{e.preventDefault();uploadZone.classList.add('dragover')};uploadZone.ondragleave=()=>uploadZone.classList.remove('dragover');uploadZone.ondrop=(e)=>{e.preventDefault();uploadZone.classList.remove('dragover');resetAnalysis();handleFiles(e.dataTransfer.files)};fileInput.onchange=(e)=>handleFiles(e.target.files);function showManualEntry(){document.getElementById('vehicleResults').style.display='block';document.getElementById('edit_marca').focus();document.getElementById('edit_marca').scrollIntoView({behavior:'smooth',block:'center'});selectShipping('roro')}function handleFiles(files){if(uploadedImages.length>=MAX_IMAGES){alert('Maximum 4 images');return}Array.from(files).slice(0,MAX_IMAGES-uploadedImages.length).forEach(file=>{if(!file.type.startsWith('image/')){alert('Only images');return}const reader=new FileReader();reader.onload=(e)=>{uploadedImages.push(e.target.result);displayImages();if(uploadedImages.length===1){analyzeVehicle()}};reader.readAsDataURL(file)})}function displayImages(){imageGrid.innerHTML='';uploadedImages.forEach((img,idx)=>{const slot=document.createElement('div');slot.className='image-slot';slot.innerHTML='<img src="'+img+'" class="image-preview"><button class="remove-image" onclick="removeImage('+idx+')">×</button><p style="font-size:0.7em;margin-top:3px">Photo '+(idx+1)+'</p>';imageGrid.appendChild(slot)})}function removeImage(idx){uploadedImages.splice(idx,1);displayImages()}function selectShipping(method){selectedShipping=method;document.querySelectorAll('.shipping-option').forEach(el=>el.classList.remove('selected'));document.querySelector('[data-method="'+method+'"]').classList.add('selected')}async function loadExchangeRates(){try{const response=await fetch('/api/exchange-rates');exchangeRates=await response.json();document.getElementById('exchangeInfo').innerHTML='💱 1 EUR = '+exchangeRates.EUR_TO_AED.toFixed(2)+' AED | '+exchangeRates.EUR_TO_USD.toFixed(2)+' USD'}catch(e){console.error(e)}}loadExchangeRates();function convertCurrency(from){const aed=parseFloat(document.getElementById('priceAED').value)||0;const usd=parseFloat(document.getElementById('priceUSD').value)||0;const eur=parseFloat(document.getElementById('priceEUR').value)||0;if(from==='AED'&&aed>0){document.getElementById('priceEUR').value=Math.round(aed*exchangeRates.AED_TO_EUR);document.getElementById('priceUSD').value=Math.round(aed*exchangeRates.AED_TO_USD)}else if(from==='USD'&&usd>0){document.getElementById('priceEUR').value=Math.round(usd*exchangeRates.USD_TO_EUR);document.getElementById('priceAED').value=Math.round(usd*exchangeRates.USD_TO_AED)}else if(from==='EUR'&&eur>0){document.getElementById('priceAED').value=Math.round(eur*exchangeRates.EUR_TO_AED);document.getElementById('priceUSD').value=Math.round(eur*exchangeRates.EUR_TO_USD)}}async function analyzeVehicle(){if(uploadedImages.length===0)return;document.getElementById('loading').style.display='block';document.getElementById('vehicleResults').style.display='none';try{const response=await fetch('/api/analyze-vehicle',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({images:uploadedImages})});const data=await response.json();if(!response.ok||data.error){alert('Analysis error: '+(data.error||'Unknown error'));document.getElementById('loading').style.display='none';return}vehicleData=data;document.getElementById('edit_marca').value=data.marca||'';document.getElementById('edit_model').value=data.model||'';document.getElementById('edit_year').value=data.an_fabricatie||'2020';document.getElementById('edit_engine').value=data.motor_capacitate||'2.0L';document.getElementById('edit_fuel').value=data.combustibil||'benzina';document.getElementById('edit_co2').value=data.emisii_co2||'180';document.getElementById('vehicleResults').style.display='block';document.getElementById('vehicleResults').scrollIntoView({behavior:'smooth',block:'start'});selectShipping('roro')}catch(error){alert('Failed: '+error.message)}finally{document.getElementById('loading').style.display='none'}}async function calculateCosts(){const price=parseFloat(document.getElementById('priceEUR').value);if(!price||price<=0){alert('Enter EUR price');return}const marca=document.getElementById('edit_marca').value||'Unknown';const model=document.getElementById('edit_model').value||'Unknown';const year=parseInt(document.getElementById('edit_year').value)||2020;const engine=document.getElementById('edit_engine').value||'2.0L';const fuel=document.getElementById('edit_fuel').value||'benzina';const co2=parseInt(document.getElementById('edit_co2').value)||180;const dimensions={length:parseFloat(document.getElementById('dim_length').value)||4.5,width:parseFloat(document.getElementById('dim_width').value)||1.8,height:parseFloat(document.getElementById('dim_height').value)||1.5,weight:parseFloat(document.getElementById('dim_weight').value)||1500};document.getElementById('loading').style.display='block';try{const response=await fetch('/api/calculate-costs',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({vehicle_price:price,marca:marca,model:model,year:year,engine:engine,fuel_type:fuel,co2:co2,shipping_method:selectedShipping,dimensions:dimensions})});calculatedCosts=await response.json();displayCosts(calculatedCosts);marketEstimate=calculatedCosts.market_estimate;displayProfitability(calculatedCosts);setTimeout(()=>{document.getElementById('costResults').scrollIntoView({behavior:'smooth',block:'start'})},300)}catch(error){alert('Calc failed: '+error.message)}finally{document.getElementById('loading').style.display='none'}}function displayCosts(costs){const fz=costs.free_zone;const std=costs.standard;const nbpm=costs.no_bpm;const ship=costs.shipping_details;document.getElementById('freeZoneCosts').innerHTML='<div class="cost-line"><span>Vehicle:</span><span>€'+fz.vehicle_price.toLocaleString()+'</span></div><div class="cost-line"><span>Shipping:</span><span>€'+fz.shipping.toLocaleString()+'</span></div><div class="cost-line"><span>Fees:</span><span>€'+(fz.port_fees+fz.free_zone_entry+fz.agent+fz.docs_insurance).toLocaleString()+'</span></div><div class="cost-total">€'+fz.total.toLocaleString()+'</div>';document.getElementById('standardCosts').innerHTML='<div class="cost-line"><span>Vehicle:</span><span>€'+std.vehicle_price.toLocaleString()+'</span></div><div class="cost-line"><span>Shipping:</span><span>€'+std.shipping.toLocaleString()+'</span></div><div class="cost-line"><span>Duty+VAT:</span><span>€'+(std.import_duty+std.vat).toLocaleString()+'</span></div><div class="cost-line"><span>BPM:</span><span>€'+std.bpm.toLocaleString()+'</span></div><div class="cost-total">€'+std.total.toLocaleString()+'</div>';document.getElementById('noBpmCosts').innerHTML='<div class="cost-line"><span>Vehicle:</span><span>€'+nbpm.vehicle_price.toLocaleString()+'</span></div><div class="cost-line"><span>Shipping:</span><span>€'+nbpm.shipping.toLocaleString()+'</span></div><div class="cost-line"><span>Duty+VAT:</span><span>€'+(nbpm.import_duty+nbpm.vat).toLocaleString()+'</span></div><div class="cost-line"><span>BPM:</span><span style="color:#28a745">€0</span></div><div class="cost-total" style="border:3px solid #28a745;padding:8px">€'+nbpm.total.toLocaleString()+'</div>';document.getElementById('shippingBreakdown').innerHTML='<h4 style="font-size:1em">'+ship.shipping_method+'</h4><div class="shipping-breakdown"><span>Base:</span><span>€'+ship.base_shipping.toLocaleString()+'</span></div><div class="shipping-breakdown"><span>Loading:</span><span>€'+ship.loading_fee.toLocaleString()+'</span></div><div class="shipping-breakdown"><span>Total:</span><span>€'+ship.total.toLocaleString()+'</span></div>';const best=costs.recommendation;document.querySelectorAll('.cost-card').forEach(c=>c.classList.remove('recommended'));if(best==='FREE ZONE')document.getElementById('freeZoneCard').classList.add('recommended');else if(best==='NO BPM')document.getElementById('noBpmCard').classList.add('recommended');else document.getElementById('standardCard').classList.add('recommended');document.getElementById('recommendation').innerHTML='<strong>'+costs.recommendation_text+'</strong><br><small>'+costs.savings_details+'</small>';document.getElementById('costResults').style.display='block'}function displayProfitability(costs){const est=costs.market_estimate;if(!est){document.getElementById('profitabilitySection').style.display='none';return}const noBpmCost=costs.no_bpm.total;const avgMarket=est.avg_price;const profit=avgMarket-noBpmCost;const profitPct=(profit/noBpmCost)*100;let colorClass='profit-low';if(profitPct>=21)colorClass='profit-high';else if(profitPct>=10)colorClass='profit-medium';document.getElementById('marketEstimate').innerHTML='<h3 style="font-size:1.1em">🤖 AI Market Intelligence</h3><p style="font-size:0.9em"><strong>'+document.getElementById('edit_marca').value+' '+document.getElementById('edit_model').value+'</strong></p><div style="margin:12px 0"><div class="profit-breakdown"><span>Range:</span><span>€'+est.min_price.toLocaleString()+'-'+est.max_price.toLocaleString()+'</span></div><div class="profit-breakdown"><span>Average:</span><span>€'+avgMarket.toLocaleString()+'</span></div></div>';document.getElementById('profitabilityCard').innerHTML='<div class="profitability-card '+colorClass+'"><h3 style="font-size:1.1em">💰 Profit (vs NO BPM)</h3><div class="profit-breakdown"><span>Market:</span><span>€'+avgMarket.toLocaleString()+'</span></div><div class="profit-breakdown"><span>Cost:</span><span>€'+noBpmCost.toLocaleString()+'</span></div><div class="profit-breakdown" style="font-size:1.2em;font-weight:bold;margin-top:12px"><span>Profit:</span><span>€'+profit.toLocaleString()+'</span></div><div class="profit-percentage">'+profitPct.toFixed(1)+'%</div></div>';document.getElementById('profitabilitySection').style.display='block'}function recalculateProfit(){const manual=parseFloat(document.getElementById('manualMarketPrice').value);if(!manual||!calculatedCosts)return;const noBpmCost=calculatedCosts.no_bpm.total;const profit=manual-noBpmCost;const profitPct=(profit/noBpmCost)*100;let colorClass='profit-low';if(profitPct>=21)colorClass='profit-high';else if(profitPct>=10)colorClass='profit-medium';document.getElementById('profitabilityCard').innerHTML='<div class="profitability-card '+colorClass+'"><h3 style="font-size:1.1em">💰 Profit (Manual)</h3><div class="profit-breakdown"><span>Market:</span><span>€'+manual.toLocaleString()+'</span></div><div class="profit-breakdown"><span>Cost:</span><span>€'+noBpmCost.toLocaleString()+'</span></div><div class="profit-breakdown" style="font-size:1.2em;font-weight:bold;margin-top:12px"><span>Profit:</span><span>€'+profit.toLocaleString()+'</span></div><div class="profit-percentage">'+profitPct.toFixed(1)+'%</div></div>'}</script></body></html>'''
+    return frontend.respond(frontend.index, request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding'))
+
+@app.route('/assets/<name>')
+def frontend_asset(name):
+    asset = frontend.assets.get(name)
+    if asset is None:
+        return jsonify({'error': 'Unknown asset'}), 404
+    return frontend.respond(asset, request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding'))
 
 @app.route('/api/exchange-rates')
 def get_rates():
     rates = get_exchange_rates()
     return jsonify(rates)
 
+@app.route('/api/market-estimate/<job_id>')
+def get_market_estimate(job_id):
+    status = market_estimate_jobs.get(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown or expired market estimate job'}), 404
+    return jsonify(status)
+
+@app.route('/api/market-estimate/<job_id>/stream')
+def stream_market_estimate(job_id):
+    """Server-Sent Events: one 'estimate' event once the job settles"""
+    job = market_estimate_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired market estimate job'}), 404
+    
+    def events():
+        # A job running in this worker is waited on; one running in another is polled in the shared table
+        future = market_estimate_futures.get(job_id)
+        while future is not None and not future.done():
+            try:
+                future.result(timeout=15)
+            except Exception:
+                yield ': keep-alive\n\n'
+        status = market_estimate_jobs.get(job_id)
+        waited = 0
+        while status is not None and status['status'] == 'pending':
+            time.sleep(1)
+            waited += 1
+            if waited % 15 == 0:
+                yield ': keep-alive\n\n'
+            status = market_estimate_jobs.get(job_id)
+        yield f"event: estimate\ndata: {json.dumps(status)}\n\n"
+    
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/cache-stats')
+def cache_stats():
+    return jsonify({
+        'market_estimate': market_cache.snapshot(),
+        'vehicle_analysis': analysis_cache.snapshot(),
+        'price_index': price_index.snapshot() if price_index is not None else None,
+        'quotes': quote_store.snapshot(),
+        'market_estimate_jobs': market_estimate_jobs.snapshot(),
+        'single_flight': {'market_estimate': market_flight.snapshot(), 'vehicle_analysis': analysis_flight.snapshot()}
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus histograms summed over every gunicorn worker"""
+    if not telemetry.enabled:
+        return jsonify({'error': 'Metrics are disabled (METRICS_ENABLED=0)'}), 404
+    return Response(telemetry.histograms.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/claude-scheduler')
+def claude_scheduler_stats():
+    return jsonify(claude.snapshot())
+
+VEHICLE_ANALYSIS_MODEL = "claude-sonnet-4-20250514"
+VEHICLE_ANALYSIS_PROMPT = 'Analizează vehiculul din imagini. Returnează DOAR un JSON valid, fără text suplimentar. "confidence" este încrederea ta 0-100. Format: {"marca":"Toyota","model":"Corolla","an_fabricatie":"2018","motor_capacitate":"1.8L","combustibil":"benzina","emisii_co2":"120","confidence":"85"}'
+
+def prepare_image(img_full):
+    """(base64 data, media type) ready for the Messages API; img_full is raw bytes or a base64 string"""
+    with stage('image'):
+        return _prepare_image(img_full)
+
+def _prepare_image(img_full):
+    raw = img_full if isinstance(img_full, bytes) else None
+    if IMAGE_PREPROCESS:
+        data_bytes, media_type, info = preprocess_image(raw if raw is not None else decode_image(img_full),
+                                                        IMAGE_MAX_EDGE, IMAGE_FORMAT, IMAGE_QUALITY)
+        logger.debug("Preprocessed image", extra=info)
+        return base64.b64encode(data_bytes).decode('ascii'), media_type
+    if raw is not None:
+        return base64.b64encode(raw).decode('ascii'), sniff_media_type(raw) or 'image/jpeg'
+    img = img_full.split(',')[1] if ',' in img_full else img_full
+    return img, detect_image_type(img)
+
+def _read_capped(stream):
+    """Copy an upload stream through a spooled temp file, enforcing the per-image cap"""
+    with tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES) as spool:
+        total = 0
+        while True:
+            chunk = stream.read(1 << 16)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > UPLOAD_MAX_IMAGE_BYTES:
+                raise RequestEntityTooLarge(f"Image larger than {UPLOAD_MAX_IMAGE_BYTES} bytes")
+            spool.write(chunk)
+        spool.seek(0)
+        return spool.read()
+
+def _read_part(part):
+    """Bytes of a multipart file part werkzeug has already spooled, enforcing the per-image cap"""
+    stream = part.stream
+    stream.seek(0, os.SEEK_END)
+    if stream.tell() > UPLOAD_MAX_IMAGE_BYTES:
+        raise RequestEntityTooLarge(f"Image larger than {UPLOAD_MAX_IMAGE_BYTES} bytes")
+    stream.seek(0)
+    return stream.read()
+
+def read_upload_images():
+    """(images, refresh) from a JSON, multipart/form-data or raw image body.
+
+    Multipart file parts are already spooled to disk by werkzeug and raw bodies
+    are spooled here, so binary uploads reach prepare_image() as bytes without
+    ever being held as a base64 string.
+    """
+    with stage('parse'):
+        return _read_upload_images()
+
+def _read_upload_images():
+    # Settable per request since Flask 3.1 (hence the pin in requirements.txt)
+    request.max_content_length = UPLOAD_MAX_BYTES
+    refresh = request.args.get('refresh', '').lower() in ('1', 'true', 'yes')
+    if request.mimetype == 'multipart/form-data':
+        files = request.files.getlist('images') or list(request.files.values())
+        refresh = refresh or request.form.get('refresh', '').lower() in ('1', 'true', 'yes')
+        return [_read_part(f) for f in files], refresh
+    if request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream':
+        return [_read_capped(request.stream)], refresh
+    data = request.get_json(silent=True) or {}
+    return data.get('images') or [], refresh or bool(data.get('refresh'))
+
+class UnparsedAnalysis(Exception):
+    """Claude answered, but no reply parsed as a vehicle"""
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    return jsonify({'error': f"Upload too large: {e.description}"}), 413
+
+@app.errorhandler(ImageTooLarge)
+def image_too_large(e):
+    return jsonify({'error': f"Invalid image: {e}"}), 400
+
+@app.errorhandler(UnparsedAnalysis)
+def unparsed_analysis(e):
+    return jsonify({'error': str(e)}), 502
+
+@app.errorhandler(ClaudeBusy)
+def claude_busy(e):
+    return jsonify({'error': str(e), 'retry_after': e.retry_after}), 503, {'Retry-After': str(e.retry_after)}
+
+def parse_vehicle_json(response_text):
+    result = parse_json_object(response_text)
+    if not result or 'marca' not in result:
+        logger.warning("JSON parse failed", extra={'response': response_text[:200]})
+        return None
+    return result
+
+def analyze_images(prepared):
+    """One Claude Vision call over one or more prepared images"""
+    content = [{"type":"image","source":{"type":"base64","media_type":media_type,"data":img}} for img, media_type in prepared]
+    content.append({"type":"text","text":VEHICLE_ANALYSIS_PROMPT})
+    msg = claude.create(
+        INTERACTIVE,
+        model=VEHICLE_ANALYSIS_MODEL, 
+        max_tokens=1000,
+        messages=[{"role":"user", "content":content}]
+    )
+    
+    response_text = msg.content[0].text.strip()
+    logger.debug("Claude response", extra={'response': response_text[:200]})
+    return parse_vehicle_json(response_text)
+
+def _analyze_uncached(images_data, cache_key):
+    """Prepare, analyze and fuse the photos; the fused result is written to the analysis cache"""
+    logger.info("Analyzing vehicle", extra={'images': len(images_data), 'mode': ANALYSIS_MODE})
+    
+    # Pillow releases the GIL while decoding/resizing, so images are prepared in parallel
+    prepared = list(image_pool.map(telemetry.bind(prepare_image), images_data))
+    logger.debug("Detected media types", extra={'media_types': [media_type for _, media_type in prepared]})
+    
+    if ANALYSIS_MODE == 'packed' or len(prepared) == 1:
+        analyses = [analyze_images(prepared)]
+    else:
+        # One call per photo on a shared pool, so wall time is close to a single call
+        futures = [analysis_pool.submit(telemetry.bind(analyze_images), [p]) for p in prepared]
+        analyses, errors = [], []
+        for future in futures:
+            try:
+                analyses.append(future.result())
+            except Exception as e:
+                logger.warning("Per-image analysis error", extra={'error': str(e)})
+                errors.append(e)
+        if len(errors) == len(futures):
+            raise errors[0]
+    
+    analyses = [a for a in analyses if isinstance(a, dict)]
+    if not analyses:
+        # Never make a vehicle up: the user would be quoted for a car that isn't in the photos
+        raise UnparsedAnalysis('Could not parse the vehicle analysis')
+    result = fuse_analyses(analyses)
+    analysis_cache.set(cache_key, result)
+    return result
+
 @app.route('/api/analyze-vehicle', methods=['POST'])
 def analyze_vehicle():
     """Analyze vehicle from images with better error handling"""
-    if not client: 
-        return jsonify({'error':'API Key not configured'}), 500
-    
     try:
-        data = request.get_json()
-        if not data:
-            return jsonify({'error':'No JSON data'}), 400
-            
-        images_data = data.get('images', [])
-        if not images_data or len(images_data) == 0:
+        images_data, refresh = read_upload_images()
+        if not images_data:
             return jsonify({'error':'No images provided'}), 400
         
-        print(f"Analyzing vehicle with {len(images_data)} images...")
-        
-        img_full = images_data[0]
-        
-        if ',' in img_full:
-            img = img_full.split(',')[1]
+        # Same photos (retries, reloads, shared listings) are answered from the content-hash cache
+        cache_key = image_set_key(images_data, salt=VEHICLE_ANALYSIS_MODEL + VEHICLE_ANALYSIS_PROMPT + ANALYSIS_MODE)
+        if refresh:
+            analysis_cache.count('bypassed')
         else:
-            img = img_full
-        
-        media_type = detect_image_type(img)
-        print(f"Detected media type: {media_type}")
+            with stage('cache'):
+                cached = analysis_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Analysis cache hit", extra={'marca': cached.get('marca'), 'model': cached.get('model')})
+                return jsonify(cached), 200, {'X-Analysis-Cache': 'hit'}
         
-        msg = client.messages.create(
-            model="claude-sonnet-4-20250514", 
-            max_tokens=1000,
-            messages=[{
-                "role":"user",
-                "content":[
-                    {"type":"image","source":{"type":"base64","media_type":media_type,"data":img}},
-                    {"type":"text","text":'Analizează vehiculul din imagine. Returnează DOAR un JSON valid, fără text suplimentar. Format: {"marca":"Toyota","model":"Corolla","an_fabricatie":"2018","motor_capacitate":"1.8L","combustibil":"benzina","emisii_co2":"120"}'}
-                ]
-            }]
-        )
+        if not get_client(): 
+            return jsonify({'error':'API Key not configured'}), 500
         
-        response_text = msg.content[0].text.strip()
-        print(f"Claude response: {response_text[:200]}...")
-        
-        json_match = re.search(r'\{[^}]*"marca"[^}]*\}', response_text, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(0)
+        if refresh:
+            result, coalesced = _analyze_uncached(images_data, cache_key), False
         else:
-            json_str = re.sub(r'^```json\s*|\s*```$', '', response_text, flags=re.MULTILINE)
+            # Concurrent uploads of the same photos (in any worker) wait on one analysis
+            result, coalesced = analysis_flight.do(cache_key, lambda: _analyze_uncached(images_data, cache_key),
+                                                   lookup=lambda key: analysis_cache.get(key, count=False))
         
-        json_str = json_str.strip()
+        logger.info("Analyzed vehicle", extra={'marca': result.get('marca'), 'model': result.get('model'),
+                                               'coalesced': coalesced})
+        return jsonify(result), 200, {'X-Analysis-Cache': 'bypass' if refresh else 'coalesced' if coalesced else 'miss'}
         
-        try:
-            result = json.loads(json_str)
-        except json.JSONDecodeError:
-            print(f"JSON parse failed, attempting manual extraction from: {json_str}")
-            result = {
-                'marca': 'Unknown',
-                'model': 'Unknown', 
-                'an_fabricatie': '2020',
-                'motor_capacitate': '2.0L',
-                'combustibil': 'benzina',
-                'emisii_co2': '180'
-            }
+    except (RequestEntityTooLarge, ImageTooLarge, UnparsedAnalysis, ClaudeBusy):
+        raise
+    except Exception as e: 
+        logger.exception("Analysis error")
+        return jsonify({'error': f"Analysis error: {str(e)}"}), 500
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def _percentile(samples, q):
+    ordered = sorted(samples)
+    return round(ordered[min(int(len(ordered) * q), len(ordered) - 1)], 1) if ordered else None
+
+@app.route('/api/analyze-vehicle/stream', methods=['POST'])
+def analyze_vehicle_stream():
+    """Server-Sent Events variant of /api/analyze-vehicle: one 'field' event per parsed field.
+
+    All photos go into a single streamed request (there is nothing to fuse);
+    the final 'done' event carries the full result and time-to-first-field.
+    """
+    started = time.perf_counter()
+    images_data, refresh = read_upload_images()
+    if not images_data:
+        return jsonify({'error':'No images provided'}), 400
+    
+    cache_key = image_set_key(images_data, salt=VEHICLE_ANALYSIS_MODEL + VEHICLE_ANALYSIS_PROMPT + 'packed')
+    cached = None if refresh else analysis_cache.get(cache_key)
+    if cached is None and not get_client():
+        return jsonify({'error':'API Key not configured'}), 500
+    if cached is None and claude.saturated():
+        raise ClaudeBusy('Claude request queue is full', claude.retry_after())
+    # Prepared before the stream starts, so an image that can't be decoded still gets a 400
+    prepared = None if cached is not None else list(image_pool.map(telemetry.bind(prepare_image), images_data))
+    
+    def elapsed_ms():
+        return round((time.perf_counter() - started) * 1000, 1)
+    
+    def events():
+        if cached is not None:
+            for field, value in cached.items():
+                yield _sse('field', {'field': field, 'value': value, 't_ms': elapsed_ms()})
+            yield _sse('done', {'result': cached, 'cached': True, 'first_field_ms': elapsed_ms(), 'total_ms': elapsed_ms()})
+            return
         
-        print(f"Successfully analyzed: {result.get('marca')} {result.get('model')}")
-        return jsonify(result)
+        first_field_ms = None
+        parser = IncrementalFieldParser()
+        try:
+            content = [{"type":"image","source":{"type":"base64","media_type":media_type,"data":img}} for img, media_type in prepared]
+            content.append({"type":"text","text":VEHICLE_ANALYSIS_PROMPT})
+            with claude.stream(INTERACTIVE, model=VEHICLE_ANALYSIS_MODEL, max_tokens=1000,
+                               messages=[{"role":"user", "content":content}]) as stream:
+                for text in stream.text_stream:
+                    for field, value in parser.feed(text):
+                        if first_field_ms is None:
+                            first_field_ms = elapsed_ms()
+                        yield _sse('field', {'field': field, 'value': value, 't_ms': elapsed_ms()})
+        except ClaudeBusy as e:
+            yield _sse('error', {'error': str(e), 'retry_after': e.retry_after})
+            return
+        except Exception as e:
+            logger.exception("Streaming analysis error")
+            yield _sse('error', {'error': f"Analysis error: {str(e)}"})
+            return
         
-    except json.JSONDecodeError as e:
-        error_msg = f"JSON parse error: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
-        return jsonify({'error': error_msg}), 500
-    except Exception as e: 
-        error_msg = f"Analysis error: {str(e)}"
-        print(error_msg)
-        traceback.print_exc()
-        return jsonify({'error': error_msg}), 500
+        result = parser.fields
+        if 'marca' not in result:
+            yield _sse('error', {'error': 'Could not parse the vehicle analysis'})
+            return
+        analysis_cache.set(cache_key, result)
+        total_ms = elapsed_ms()
+        stream_first_field_ms.append(first_field_ms)
+        stream_total_ms.append(total_ms)
+        logger.info("Streamed analysis", extra={'first_field_ms': first_field_ms, 'total_ms': total_ms})
+        yield _sse('done', {'result': result, 'cached': False, 'first_field_ms': first_field_ms, 'total_ms': total_ms})
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/analyze-vehicle/stream/stats')
+def analyze_vehicle_stream_stats():
+    return jsonify({
+        'samples': len(stream_first_field_ms),
+        'first_field_ms': {'p50': _percentile(stream_first_field_ms, 0.5), 'p95': _percentile(stream_first_field_ms, 0.95)},
+        'total_ms': {'p50': _percentile(stream_total_ms, 0.5), 'p95': _percentile(stream_total_ms, 0.95)}
+    })
+
+def market_vehicle_data(d):
+    return {
+        'marca': d.get('marca', 'Unknown'),
+        'model': d.get('model', 'Unknown'),
+        'year': int(d.get('year', 2020)),
+        'engine': d.get('engine', '2.0L'),
+        'fuel_type': d.get('fuel_type', 'benzina'),
+        'co2': int(d.get('co2', 180))
+    }
 
 @app.route('/api/calculate-costs', methods=['POST'])
 def costs():
     try:
-        d = request.json
+        with stage('parse'):
+            d = request.json
         vp = float(d.get('vehicle_price', 0))
         co2 = int(d.get('co2', 180))
         year = int(d.get('year', 2020))
@@ -250,68 +666,213 @@ def costs():
         shipping_method = d.get('shipping_method', 'roro')
         dimensions = d.get('dimensions', {})
         
-        vehicle_data = {
-            'marca': d.get('marca', 'Unknown'),
-            'model': d.get('model', 'Unknown'),
-            'year': year,
-            'engine': d.get('engine', '2.0L'),
-            'fuel_type': fuel,
-            'co2': co2
-        }
-        
-        shipping = calculate_shipping_cost(shipping_method, dimensions)
-        shipping_total = shipping['total']
-        port_fees = 600
+        vehicle_data = market_vehicle_data(d)
+        shipping = d.get('shipping_allocation') or calculate_shipping_cost(shipping_method, dimensions)
         
-        free_zone = {
-            'vehicle_price': vp, 'shipping': shipping_total,
-            'port_fees': port_fees, 'free_zone_entry': 150,
-            'handling': 200, 'agent': 200, 'docs_insurance': 250,
-            'total': round(vp + shipping_total + port_fees + 950, 2)
-        }
-        
-        import_duty = vp * 0.10
-        vat = (vp + shipping_total + import_duty) * 0.21
-        bpm = calculate_bpm(co2, year, fuel)
-        
-        standard = {
-            'vehicle_price': vp, 'shipping': shipping_total,
-            'port_fees': port_fees, 'import_duty': round(import_duty, 2),
-            'vat': round(vat, 2), 'bpm': bpm,
-            'agent': 350, 'docs_insurance': 200,
-            'total': round(vp + shipping_total + port_fees + import_duty + vat + bpm + 550, 2)
-        }
-        
-        no_bpm = {
-            'vehicle_price': vp, 'shipping': shipping_total,
-            'port_fees': port_fees, 'import_duty': round(import_duty, 2),
-            'vat': round(vat, 2), 'bpm': 0,
-            'agent': 350, 'docs_insurance': 200,
-            'total': round(vp + shipping_total + port_fees + import_duty + vat + 550, 2)
-        }
-        
-        totals = {'FREE ZONE': free_zone['total'], 'STANDARD': standard['total'], 'NO BPM': no_bpm['total']}
-        best = min(totals, key=totals.get)
-        worst = max(totals, key=totals.get)
-        savings = totals[worst] - totals[best]
+        # The quote's identity: what the numbers below (and the market estimate) are computed from
+        vehicle_key = normalize_vehicle_key(vehicle_data)
+        inputs = {'vehicle_price': vp, 'co2': co2, 'year': year, 'diesel': str(fuel).lower() == 'diesel',
+                  'shipping': shipping, 'vehicle': vehicle_key}
+        versions = quote_versions(bpm_tariffs)
+        quote_id = quote_key(inputs, versions)
+        refresh = request.args.get('refresh', '').lower() in ('1', 'true', 'yes') or bool(d.get('refresh'))
+        if refresh:
+            quote_store.count('bypassed')
+        else:
+            with stage('quote_store'):
+                stored = quote_store.get(quote_id)
+            if stored is not None:
+                # Its job failed or was never started (no API key then): ask again, usually a cache hit by now
+                if stored['market_estimate'] is None:
+                    with stage('market_estimate'):
+                        estimate = submit_market_estimate(vehicle_data, quote_id)
+                    if estimate and estimate['status'] == 'done':
+                        quote_store.set_market_estimate(quote_id, estimate['result'])
+                    stored['market_estimate'] = estimate
+                return jsonify(stored), 200, {'X-Quote-Store': 'hit'}
         
-        market_estimate = estimate_market_price_ai(vehicle_data)
+        with stage('compute'):
+            shipping_total = shipping['total']
+            port_fees = batch.PORT_FEES
+            bpm = calculate_bpm(co2, year, fuel)
+            # The batch endpoint's arithmetic and rounding, so a vehicle quotes the same either way
+            import_duty, vat, free_zone_total, standard_total, no_bpm_total = (
+                float(value) for value in batch.scenario_totals(vp, shipping_total, bpm))
+            
+            free_zone = {
+                'vehicle_price': vp, 'shipping': shipping_total,
+                'port_fees': port_fees, 'free_zone_entry': 150,
+                'handling': 200, 'agent': 200, 'docs_insurance': 250,
+                'total': free_zone_total
+            }
+            
+            standard = {
+                'vehicle_price': vp, 'shipping': shipping_total,
+                'port_fees': port_fees, 'import_duty': import_duty,
+                'vat': vat, 'bpm': bpm,
+                'agent': 350, 'docs_insurance': 200,
+                'total': standard_total
+            }
+            
+            no_bpm = {
+                'vehicle_price': vp, 'shipping': shipping_total,
+                'port_fees': port_fees, 'import_duty': import_duty,
+                'vat': vat, 'bpm': 0,
+                'agent': 350, 'docs_insurance': 200,
+                'total': no_bpm_total
+            }
+            
+            totals = {'FREE ZONE': free_zone['total'], 'STANDARD': standard['total'], 'NO BPM': no_bpm['total']}
+            best = min(totals, key=totals.get)
+            worst = max(totals, key=totals.get)
+            savings = totals[worst] - totals[best]
         
-        return jsonify({
+        result = {
             'free_zone': free_zone,
             'standard': standard,
             'no_bpm': no_bpm,
             'shipping_details': shipping,
             'recommendation': best,
             'recommendation_text': f"✅ {best} is best",
-            'savings_details': f"Save €{savings:,.0f}",
-            'market_estimate': market_estimate
-        })
+            'savings_details': f"Save €{savings:,.0f}"
+        }
+        
+        with stage('market_estimate'):
+            known = local_market_estimate(vehicle_data)
+        
+        # An estimate already known is stored with the quote. A queued one is attached by its job when it
+        # finishes, so the row has to exist before the job is submitted
+        vehicle = (normalize_text(vehicle_data['marca']), normalize_text(vehicle_data['model']), vehicle_data['year'])
+        with stage('quote_store'):
+            quoted_at = quote_store.put(quote_id, vehicle, inputs, versions, result, known)
+        with stage('market_estimate'):
+            market_estimate = start_market_estimate(vehicle_data, known, quote_id)
+        result['market_estimate'] = market_estimate
+        result['quote_id'] = quote_id
+        result['quoted_at'] = quoted_at
+        
+        return jsonify(result), 200, {'X-Quote-Store': 'bypass' if refresh else 'miss'}
         
     except Exception as e:
-        print(f"Cost calculation error: {e}")
-        traceback.print_exc()
+        logger.exception("Cost calculation error")
         return jsonify({'error': str(e)}), 500
 
+def _parse_time(value):
+    """Epoch seconds from an ISO 8601 date or datetime (UTC unless it says otherwise) or from epoch seconds"""
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+@app.route('/api/quotes')
+def quote_history():
+    """Stored quotes, newest first, filtered by marca/model/year and since/until, one page per cursor"""
+    args = request.args
+    try:
+        limit = min(max(int(args.get('limit', 50)), 1), QUOTE_HISTORY_LIMIT)
+        year = int(args['year']) if args.get('year') else None
+        since = _parse_time(args['since']) if args.get('since') else None
+        until = _parse_time(args['until']) if args.get('until') else None
+        cursor = decode_cursor(args['cursor']) if args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+    marca = normalize_text(args['marca']) if args.get('marca') else None
+    model = normalize_text(args['model']) if args.get('model') else None
+    
+    # One row past the page tells whether there is a next one; rows go out as they are read
+    rows = quote_store.history(marca, model, year, since, until, cursor, limit + 1)
+    
+    def generate():
+        yield '{"quotes":['
+        last = None
+        try:
+            for i, (created, key, item) in enumerate(rows):
+                if i == limit:
+                    yield f'],"next_cursor":"{encode_cursor(*last)}"}}'
+                    return
+                yield item if i == 0 else ',' + item
+                last = created, key
+        finally:
+            rows.close()
+        yield '],"next_cursor":null}'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+@app.route('/api/quotes/<quote_id>')
+def get_quote(quote_id):
+    quote = quote_store.get(quote_id, count=False)
+    if quote is None:
+        return jsonify({'error': 'Unknown quote'}), 404
+    return jsonify(quote)
+
+@app.route('/api/calculate-costs/sweep', methods=['POST'])
+def costs_sweep():
+    """Free zone / standard / no-BPM totals over a price x year x CO2 x shipping grid, plus break-even prices"""
+    with stage('parse'):
+        d = request.get_json(silent=True)
+    if not isinstance(d, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    try:
+        with stage('compute'):
+            result = sweep.sweep(d, bpm_tariffs, max_cells=SWEEP_MAX_CELLS)
+        return jsonify(result)
+    except (TypeError, ValueError, KeyError) as e:
+        return jsonify({'error': f'Invalid sweep: {e}'}), 400
+
+@app.route('/api/shipping-plan', methods=['POST'])
+def shipping_plan():
+    """Consolidate a list of vehicles into RoRo slots and shared containers"""
+    with stage('parse'):
+        d = request.get_json(silent=True)
+    vehicles = d.get('vehicles') if isinstance(d, dict) else d
+    if not isinstance(vehicles, list) or not vehicles:
+        return jsonify({'error': 'Expected a non-empty list of vehicles'}), 400
+    if not all(isinstance(v, dict) for v in vehicles):
+        return jsonify({'error': 'Each vehicle must be an object'}), 400
+    
+    with stage('compute'):
+        plan = plan_shipment([v.get('dimensions') or v for v in vehicles], calculate_shipping_cost)
+    ids = [v.get('id', i) for i, v in enumerate(vehicles)]
+    for container in plan['containers']:
+        container['vehicles'] = [ids[i] for i in container['vehicles']]
+    plan['roro'] = [ids[i] for i in plan['roro']]
+    plan['allocations'] = [{'id': ids[i], 'shipping_allocation': a} for i, a in enumerate(plan['allocations'])]
+    return jsonify(plan)
+
+@app.route('/api/calculate-costs/batch', methods=['POST'])
+def costs_batch():
+    """Quote many vehicles at once: JSON array or NDJSON in, NDJSON out"""
+    chunk_size = BATCH_CHUNK_SIZE
+    ndjson = request.mimetype in ('application/x-ndjson', 'application/jsonl')
+    with_estimate = request.args.get('market_estimate', '').lower() in ('1', 'true', 'yes')
+    estimate = (lambda d: submit_market_estimate(market_vehicle_data(d))) if with_estimate else None
+    
+    if not ndjson:
+        with stage('parse'):
+            data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get('vehicles')
+        if not isinstance(data, list):
+            return jsonify({'error': 'Expected a JSON array of vehicles or an NDJSON body'}), 400
+    
+    def generate():
+        chunk = []
+        for row in (batch.iter_ndjson(request.stream) if ndjson else enumerate(data)):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                with stage('compute'), market_estimate_jobs.transaction():
+                    lines = batch.quote_chunk(chunk, bpm_tariffs, shipping_details, estimate)
+                yield lines
+                chunk = []
+        if chunk:
+            with stage('compute'), market_estimate_jobs.transaction():
+                lines = batch.quote_chunk(chunk, bpm_tariffs, shipping_details, estimate)
+            yield lines
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 if __name__=='__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,153 @@
+import json
+
+import numpy as np
+
+from shipping_rates import LONG_VEHICLE_LENGTH, SHIPPING_RATE_CARD, SHIPPING_RATES, TALL_VEHICLE_HEIGHT
+
+SHIPPING_METHODS = tuple(SHIPPING_RATES)
+# Rate card totals indexed [method code, long, tall]
+SHIPPING_TOTALS = np.array([[[SHIPPING_RATE_CARD[method, long_vehicle, tall_vehicle]['total']
+                              for tall_vehicle in (False, True)]
+                             for long_vehicle in (False, True)]
+                            for method in SHIPPING_METHODS], dtype=np.float64)
+# calculate_shipping_cost() prices unknown methods as RoRo
+DEFAULT_METHOD = SHIPPING_METHODS.index('roro')
+PORT_FEES = 600
+FREE_ZONE_FEES = 950
+STANDARD_FEES = 550
+SCENARIOS = ('FREE ZONE', 'STANDARD', 'NO BPM')
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+def shipping_total_array(method_code, length, height):
+    """calculate_shipping_cost()['total'] over whole columns (codes index SHIPPING_METHODS)"""
+    long_vehicle = (np.asarray(length) > LONG_VEHICLE_LENGTH).astype(np.intp)
+    tall_vehicle = (np.asarray(height) > TALL_VEHICLE_HEIGHT).astype(np.intp)
+    return SHIPPING_TOTALS[np.asarray(method_code), long_vehicle, tall_vehicle]
+
+def round_cents(values):
+    """round(value, 2) elementwise, exactly as Python rounds it (np.round rounds some half cents the other way)"""
+    values = np.asarray(values, dtype=np.float64)
+    scaled = values * 100
+    # The rounding error of that product (Dekker's split): values * 100 == scaled + error exactly
+    split = values * 134217729.0
+    high = split - (split - values)
+    error = (high * 100 - scaled) + (values - high) * 100
+    cents = np.floor(scaled)
+    # Both steps are exact, so this is zero only on a true half cent, which rounds to even
+    above = (scaled - cents - 0.5) + error
+    cents = cents + ((above > 0) | ((above == 0) & (cents % 2 == 1)))
+    return np.copysign(cents / 100, values)
+
+def scenario_totals(vp, shipping, bpm):
+    """Duty, VAT and the free zone / standard / no-BPM totals, rounded to cents; costs() uses it too"""
+    duty = vp * 0.10
+    vat = (vp + shipping + duty) * 0.21
+    free_zone = round_cents(vp + shipping + PORT_FEES + FREE_ZONE_FEES)
+    no_bpm = round_cents(vp + shipping + PORT_FEES + duty + vat + STANDARD_FEES)
+    standard = round_cents(vp + shipping + PORT_FEES + duty + vat + bpm + STANDARD_FEES)
+    return round_cents(duty), round_cents(vat), free_zone, standard, no_bpm
+
+def _column_int(value, name):
+    """int(value), raising OverflowError for values an int32 column can't hold"""
+    value = int(value)
+    if not INT32_MIN <= value <= INT32_MAX:
+        raise OverflowError(f'{name} {value} is out of range')
+    return value
+
+def parse_vehicle(d):
+    """Same defaults as costs(); raises on values that can't be coerced"""
+    if not isinstance(d, dict):
+        raise ValueError('expected a JSON object')
+    dims = d.get('dimensions') or {}
+    if not isinstance(dims, dict):
+        raise ValueError('dimensions must be an object')
+    method = d.get('shipping_method', 'roro')
+    allocation = d.get('shipping_allocation')
+    return (
+        float(d.get('vehicle_price', 0)),
+        _column_int(d.get('co2', 180), 'co2'),
+        _column_int(d.get('year', 2020), 'year'),
+        str(d.get('fuel_type', 'benzina')).lower() == 'diesel',
+        SHIPPING_METHODS.index(method) if method in SHIPPING_METHODS else DEFAULT_METHOD,
+        float(dims.get('length', 0)),
+        float(dims.get('height', 0)),
+        float(allocation['total']) if allocation else np.nan,
+    )
+
+def iter_ndjson(stream, block_size=1 << 16):
+    """Yield (index, object or None) from a binary NDJSON stream, reading in blocks"""
+    index = 0
+    pending = b''
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        lines = (pending + block).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield index, _loads_or_none(line)
+                index += 1
+    if pending.strip():
+        yield index, _loads_or_none(pending)
+
+def _loads_or_none(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+def quote_chunk(vehicles, tariffs, shipping_details, market_estimate=None, on=None):
+    """NDJSON text for a chunk of vehicles; vehicles is [(index, dict)], BPM as of `on` (default today)"""
+    rows, parsed, lines = [], [], []
+    for index, d in vehicles:
+        try:
+            parsed.append(parse_vehicle(d))
+            rows.append((index, d))
+        except (TypeError, ValueError, KeyError, AttributeError, OverflowError) as e:
+            # A bad row gets an error line; it must never abort the rest of the stream
+            lines.append(json.dumps({'index': index, 'error': f'Invalid vehicle: {e}'}) + '\n')
+    if not rows:
+        return ''.join(lines)
+
+    vp, co2, year, diesel, method, length, height, allocated = (np.array(col) for col in zip(*parsed))
+    bpm = tariffs.bpm_array(co2, year, diesel, on=on)
+    # Vehicles priced by /api/shipping-plan carry their share of a consolidated shipment
+    shipping = np.where(np.isnan(allocated), shipping_total_array(method, length, height), allocated)
+    duty, vat, free_zone, standard, no_bpm = scenario_totals(vp, shipping, bpm)
+    stacked = np.stack([free_zone, standard, no_bpm])
+    best = stacked.argmin(axis=0)
+    savings = stacked.max(axis=0) - stacked.min(axis=0)
+
+    columns = (vp.tolist(), shipping.tolist(), bpm.tolist(), duty.tolist(), vat.tolist(),
+               free_zone.tolist(), standard.tolist(), no_bpm.tolist(), best.tolist(), savings.tolist(),
+               method.tolist(), (length > LONG_VEHICLE_LENGTH).tolist(), (height > TALL_VEHICLE_HEIGHT).tolist())
+    for (index, d), (p, ship, b, du, va, fz, std, nb, bi, sv, m, long_, tall) in zip(rows, zip(*columns)):
+        out = {
+            'index': index,
+            'free_zone': {
+                'vehicle_price': p, 'shipping': ship,
+                'port_fees': PORT_FEES, 'free_zone_entry': 150,
+                'handling': 200, 'agent': 200, 'docs_insurance': 250, 'total': fz
+            },
+            'standard': {
+                'vehicle_price': p, 'shipping': ship,
+                'port_fees': PORT_FEES, 'import_duty': du, 'vat': va, 'bpm': b,
+                'agent': 350, 'docs_insurance': 200, 'total': std
+            },
+            'no_bpm': {
+                'vehicle_price': p, 'shipping': ship,
+                'port_fees': PORT_FEES, 'import_duty': du, 'vat': va, 'bpm': 0,
+                'agent': 350, 'docs_insurance': 200, 'total': nb
+            },
+            'shipping_details': d.get('shipping_allocation') or shipping_details(SHIPPING_METHODS[m], long_, tall),
+            'recommendation': SCENARIOS[bi],
+            'recommendation_text': f"✅ {SCENARIOS[bi]} is best",
+            'savings_details': f"Save €{sv:,.0f}",
+        }
+        if 'id' in d:
+            out['id'] = d['id']
+        if market_estimate is not None:
+            out['market_estimate'] = market_estimate(d)
+        lines.append(json.dumps(out, ensure_ascii=False) + '\n')
+    return ''.join(lines)
@@ -0,0 +1,63 @@
+"""Compare the table-driven BPM engine with the old branching calculate_bpm().
+
+    python bench/bench_bpm.py [--n 200000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tariffs import load_tariffs
+
+REFERENCE_DATE = date(2025, 6, 1)
+
+def legacy_calculate_bpm(co2, year, fuel_type):
+    """calculate_bpm() as it was before the tariff engine"""
+    age = 2025 - year
+    if age >= 5: return 0
+    bpm = 400
+    if co2 > 82:
+        bpm += (min(co2,140)-82)*80
+        if co2 > 140: bpm += (min(co2,180)-140)*120
+        if co2 > 180: bpm += (co2-180)*180
+    if fuel_type.lower()=='diesel' and co2>82: bpm += (co2-82)*90
+    return round(bpm * (1 - min(age*0.2, 1.0)), 2)
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n', type=int, default=200000)
+    args = parser.parse_args()
+
+    load_time, engine = timed(load_tariffs)
+
+    rng = random.Random(42)
+    co2 = [rng.randint(0, 400) for _ in range(args.n)]
+    year = [rng.randint(2019, 2025) for _ in range(args.n)]
+    fuel = [rng.choice(('benzina', 'diesel', 'hybrid')) for _ in range(args.n)]
+    co2_col, year_col = np.array(co2), np.array(year)
+    diesel_col = np.array([f == 'diesel' for f in fuel])
+
+    legacy_time, legacy = timed(lambda: [legacy_calculate_bpm(c, y, f) for c, y, f in zip(co2, year, fuel)])
+    scalar_time, scalar = timed(lambda: [engine.bpm(c, y, f, REFERENCE_DATE) for c, y, f in zip(co2, year, fuel)])
+    array_time, array = timed(lambda: engine.bpm_array(co2_col, year_col, diesel_col, REFERENCE_DATE))
+
+    mismatches = sum(1 for a, b, c in zip(legacy, scalar, array.tolist()) if not (a == b == c))
+    print(f"tariff load + table build: {load_time * 1e3:.2f} ms")
+    print(f"legacy branching:  {legacy_time / args.n * 1e9:8.1f} ns/lookup")
+    print(f"engine scalar:     {scalar_time / args.n * 1e9:8.1f} ns/lookup")
+    print(f"engine array:      {array_time / args.n * 1e9:8.1f} ns/lookup")
+    print(f"mismatches vs legacy: {mismatches} / {args.n}")
+    return 1 if mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
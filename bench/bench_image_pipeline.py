@@ -0,0 +1,76 @@
+"""End-to-end /api/analyze-vehicle latency with and without image preprocessing.
+
+Runs against bench/fake_anthropic.py, so no API credits are used. Uploads go
+over a throttled fake uplink (--upload-mbps) so payload size shows up in
+latency the way it does against the real API.
+
+    python bench/bench_image_pipeline.py [--photos 5] [--upload-mbps 20]
+"""
+import argparse
+import base64
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.pop('ANTHROPIC_API_KEY', None)
+_tmp = tempfile.mkdtemp(prefix='bench-image-')
+os.environ.setdefault('ANALYSIS_CACHE_DB', os.path.join(_tmp, 'analyses.sqlite3'))
+os.environ.setdefault('MARKET_CACHE_DB', os.path.join(_tmp, 'market.sqlite3'))
+os.environ.setdefault('EXCHANGE_RATES_SNAPSHOT', os.path.join(_tmp, 'rates.json'))
+
+import anthropic
+from PIL import Image
+
+import app
+from bench.fake_anthropic import FakeAnthropic
+
+def phone_photo(seed, size=(4032, 3024)):
+    """Noisy 12 MP JPEG with an EXIF orientation tag, roughly the size of a phone photo"""
+    img = Image.effect_noise(size, 64 + seed).convert('RGB')
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    out = io.BytesIO()
+    img.save(out, 'JPEG', quality=95, exif=exif)
+    return 'data:image/jpeg;base64,' + base64.b64encode(out.getvalue()).decode()
+
+def run(client, photos, preprocess):
+    app.IMAGE_PREPROCESS = preprocess
+    latencies = []
+    for photo in photos:
+        start = time.perf_counter()
+        response = client.post('/api/analyze-vehicle', json={'images': [photo], 'refresh': True})
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.get_json()
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--photos', type=int, default=5)
+    parser.add_argument('--upload-mbps', type=float, default=20.0)
+    parser.add_argument('--base-latency', type=float, default=0.4)
+    args = parser.parse_args()
+
+    fake = FakeAnthropic(base_latency=args.base_latency, upload_mbps=args.upload_mbps).start()
+    app.client = anthropic.Anthropic(api_key='bench', base_url=fake.url)
+    client = app.app.test_client()
+    photos = [phone_photo(i) for i in range(args.photos)]
+    print(f"{args.photos} photos, avg {statistics.mean(len(p) for p in photos) * 3 / 4 / 1e6:.1f} MB decoded")
+
+    for label, preprocess in (('raw upload (before)', False), ('preprocessed (after)', True)):
+        fake.bytes_received = 0
+        latencies = run(client, photos, preprocess)
+        print(f"{label:22s} p50 {statistics.median(latencies) * 1e3:7.0f} ms  "
+              f"max {max(latencies) * 1e3:7.0f} ms  sent {fake.bytes_received / len(photos) / 1e6:6.2f} MB/request")
+
+    start = time.perf_counter()
+    data, _, info = app.preprocess_image(app.decode_image(photos[0]), app.IMAGE_MAX_EDGE, app.IMAGE_FORMAT)
+    print(f"preprocess alone: {(time.perf_counter() - start) * 1e3:.0f} ms "
+          f"({info['input_size']} -> {info['output_size']}, {info['input_bytes']} -> {info['output_bytes']} bytes)")
+    fake.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Price index build time, cold-start load time and lookup latency.
+
+Builds an index from synthetic sales (--rows) in a temp directory, then times
+opening it and answering random make/model/year/fuel/CO2 queries.
+
+    python bench/bench_price_index.py [--rows 500000] [--queries 20000]
+"""
+import argparse
+import csv
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_index import PriceIndex, build_index
+
+MAKES = {
+    'Toyota': ['Corolla', 'Camry', 'RAV4', 'Land Cruiser', 'Yaris'],
+    'Volkswagen': ['Golf', 'Passat', 'Tiguan', 'Polo', 'Touareg'],
+    'BMW': ['3 Series', '5 Series', 'X5', 'X3', '1 Series'],
+    'Mercedes-Benz': ['C-Class', 'E-Class', 'GLE', 'S-Class', 'A-Class'],
+    'Nissan': ['Patrol', 'Qashqai', 'X-Trail', 'Altima', 'Sunny'],
+}
+FUELS = ['benzina', 'diesel', 'hybrid', 'electric']
+
+def synthetic_sales(path, rows, seed=1):
+    rng = random.Random(seed)
+    models = [(make, model, 15000 + 4000 * i) for make, names in MAKES.items() for i, model in enumerate(names)]
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['marca', 'model', 'year', 'fuel_type', 'co2', 'price'])
+        for _ in range(rows):
+            make, model, base = rng.choice(models)
+            year = rng.randint(2005, 2025)
+            fuel = rng.choices(FUELS, weights=[6, 3, 2, 1])[0]
+            co2 = 0 if fuel == 'electric' else rng.randint(90, 320)
+            price = base * 0.9 ** (2025 - year) * rng.uniform(0.8, 1.2)
+            writer.writerow([make, model, year, fuel, co2, round(price)])
+
+def random_query(rng):
+    make = rng.choice(list(MAKES) + ['Lada'])
+    model = rng.choice(MAKES.get(make, ['Niva']))
+    return {'marca': make, 'model': model, 'year': rng.randint(2000, 2025),
+            'fuel_type': rng.choice(FUELS), 'co2': rng.randint(90, 320)}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--queries', type=int, default=20000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench-price-index-')
+    source, out_dir = os.path.join(tmp, 'sales.csv'), os.path.join(tmp, 'index')
+    synthetic_sales(source, args.rows)
+
+    start = time.perf_counter()
+    build_index(source, out_dir)
+    print(f"build: {args.rows} rows in {time.perf_counter() - start:.2f}s, "
+          f"{sum(os.path.getsize(os.path.join(out_dir, f)) for f in os.listdir(out_dir)) / 1e6:.1f} MB on disk")
+
+    start = time.perf_counter()
+    index = PriceIndex(out_dir)
+    print(f"cold load: {(time.perf_counter() - start) * 1e3:.2f} ms")
+
+    rng = random.Random(2)
+    queries = [random_query(rng) for _ in range(args.queries)]
+    start = time.perf_counter()
+    index.estimate(queries[0])
+    print(f"first lookup (page faults): {(time.perf_counter() - start) * 1e3:.2f} ms")
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.estimate(query)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    stats = index.snapshot()
+    print(f"lookup: p50 {statistics.median(latencies):.0f} us  p99 {latencies[int(len(latencies) * 0.99)]:.0f} us  "
+          f"max {latencies[-1]:.0f} us  answered locally {stats['hits'] / (stats['hits'] + stats['misses']):.0%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""App import time, time to N ready gunicorn workers, and their memory, per startup mode.
+
+'procfile' runs gunicorn as the Procfile does (each worker imports app);
+'preload' uses gunicorn_preload.conf.py (the master imports once and forks).
+A worker counts as ready when gunicorn's post_worker_init hook fires, i.e.
+after it has app loaded. PSS from /proc/<pid>/smaps_rollup splits shared
+pages between the processes mapping them, so the sum shows what the pool
+really costs.
+
+    python bench/bench_startup.py [--workers 4] [--runs 3] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.run_benchmarks import free_port
+
+MODES = {
+    'procfile': 'threads = 8\n',
+    'preload': f"exec(open({os.path.join(ROOT, 'gunicorn_preload.conf.py')!r}).read())\n",
+}
+READY_HOOK = '''
+import time as _time
+
+def post_worker_init(worker):
+    with open({path!r}, 'a') as f:
+        f.write(f'{{worker.pid}} {{_time.time()}}\\n')
+'''
+
+def bench_env(workdir):
+    env = dict(os.environ, LOG_LEVEL='WARNING', METRICS_DIR=os.path.join(workdir, 'metrics'))
+    env.pop('ANTHROPIC_API_KEY', None)
+    for name, filename in (('ANALYSIS_CACHE_DB', 'analyses.sqlite3'), ('MARKET_CACHE_DB', 'market.sqlite3'),
+                           ('EXCHANGE_RATES_SNAPSHOT', 'rates.json'), ('CLAUDE_BUDGET_DB', 'budget.sqlite3'),
+                           ('SINGLE_FLIGHT_DB', 'inflight.sqlite3'), ('QUOTE_STORE_DB', 'quotes.sqlite3')):
+        env[name] = os.path.join(workdir, filename)
+    return env
+
+def import_time(env):
+    code = 'import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)'
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def slowest_imports(env, top=8):
+    """(module, cumulative seconds) of the most expensive imports, from -X importtime"""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            name = parts[2][1:].rstrip()
+            # Direct imports of a top-level module (app's own imports); deeper ones are in their cumulative time
+            if len(name) - len(name.lstrip()) == 2:
+                rows.append((name.strip(), int(parts[1]) / 1e6))
+    return sorted(rows, key=lambda row: -row[1])[:top]
+
+def pss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+def start_workers(mode, workers, env, workdir):
+    ready_file = os.path.join(workdir, f'ready-{mode}-{time.time_ns()}')
+    config = os.path.join(workdir, f'{mode}.conf.py')
+    with open(config, 'w') as f:
+        f.write(MODES[mode] + READY_HOOK.format(path=ready_file))
+    port = free_port()
+    started = time.time()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--config', config, '--workers', str(workers),
+                               '--bind', f'127.0.0.1:{port}', 'app:app'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 120
+    ready = []
+    while len(ready) < workers:
+        if time.monotonic() > deadline or server.poll() is not None:
+            server.kill()
+            raise RuntimeError(f'{mode}: only {len(ready)}/{workers} workers became ready')
+        time.sleep(0.01)
+        if os.path.exists(ready_file):
+            with open(ready_file) as f:
+                ready = [line.split() for line in f if line.strip()]
+    times = sorted(float(t) - started for _, t in ready)
+    return server, port, [int(pid) for pid, _ in ready], times
+
+def run_mode(mode, workers, env, workdir):
+    server, port, pids, times = start_workers(mode, workers, env, workdir)
+    try:
+        start = time.perf_counter()
+        requests.get(f'http://127.0.0.1:{port}/', timeout=30)
+        first_request = time.perf_counter() - start
+        time.sleep(0.5)
+        pss = {'master': pss_kb(server.pid), 'workers': sum(pss_kb(pid) for pid in pids)}
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return {'first_worker_ready_s': round(times[0], 3), 'all_workers_ready_s': round(times[-1], 3),
+            'first_request_s': round(first_request, 4), 'pss_master_mb': round(pss['master'] / 1024, 1),
+            'pss_workers_mb': round(pss['workers'] / 1024, 1),
+            'pss_total_mb': round((pss['master'] + pss['workers']) / 1024, 1)}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-startup-')
+    env = bench_env(workdir)
+    imports = [import_time(env) for _ in range(args.runs)]
+    results = {'workers': args.workers, 'import_app_s': round(statistics.median(imports), 3),
+               'slowest_imports': slowest_imports(env), 'modes': {}}
+    print(f"import app: {results['import_app_s'] * 1e3:.0f} ms (median of {args.runs})")
+    for name, seconds in results['slowest_imports']:
+        print(f"    {name:30s} {seconds * 1e3:7.1f} ms")
+
+    for mode in MODES:
+        runs = [run_mode(mode, args.workers, env, workdir) for _ in range(args.runs)]
+        summary = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+        results['modes'][mode] = summary
+        print(f"{mode:9s} first worker {summary['first_worker_ready_s']:.2f}s  all {args.workers} "
+              f"{summary['all_workers_ready_s']:.2f}s  first request {summary['first_request_s'] * 1e3:.0f} ms  "
+              f"PSS {summary['pss_total_mb']:.0f} MB (master {summary['pss_master_mb']:.0f} MB)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
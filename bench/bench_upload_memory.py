@@ -0,0 +1,76 @@
+"""Peak Python heap per /api/analyze-vehicle request: base64 JSON vs multipart vs raw body.
+
+Request bodies are built before tracing starts, so the numbers cover only what
+the server side allocates while handling the upload. Runs against
+bench/fake_anthropic.py, so no API credits are used.
+
+    python bench/bench_upload_memory.py [--photos 4]
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.pop('ANTHROPIC_API_KEY', None)
+_tmp = tempfile.mkdtemp(prefix='bench-upload-')
+os.environ.setdefault('ANALYSIS_CACHE_DB', os.path.join(_tmp, 'analyses.sqlite3'))
+os.environ.setdefault('MARKET_CACHE_DB', os.path.join(_tmp, 'market.sqlite3'))
+os.environ.setdefault('EXCHANGE_RATES_SNAPSHOT', os.path.join(_tmp, 'rates.json'))
+
+import anthropic
+from PIL import Image
+from werkzeug.test import EnvironBuilder
+
+import app
+from bench.fake_anthropic import FakeAnthropic
+
+def phone_photo(seed, size=(4032, 3024)):
+    img = Image.effect_noise(size, 64 + seed).convert('RGB')
+    out = io.BytesIO()
+    img.save(out, 'JPEG', quality=95)
+    return out.getvalue()
+
+def environ_for(kind, photos):
+    path = '/api/analyze-vehicle?refresh=1'
+    if kind == 'json':
+        body = json.dumps({'images': ['data:image/jpeg;base64,' + base64.b64encode(p).decode() for p in photos]})
+        return EnvironBuilder(path=path, method='POST', data=body, content_type='application/json').get_environ()
+    if kind == 'multipart':
+        files = [(io.BytesIO(p), f'photo{i}.jpg', 'image/jpeg') for i, p in enumerate(photos)]
+        return EnvironBuilder(path=path, method='POST', data={'images': files}).get_environ()
+    return EnvironBuilder(path=path, method='POST', data=photos[0], content_type='image/jpeg').get_environ()
+
+def measure(environ):
+    status = []
+    tracemalloc.start()
+    body = b''.join(app.app.wsgi_app(environ, lambda s, h: status.append(s)))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert status[0].startswith('200'), body
+    return peak
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--photos', type=int, default=4)
+    args = parser.parse_args()
+
+    fake = FakeAnthropic(base_latency=0, upload_mbps=0).start()
+    app.client = anthropic.Anthropic(api_key='bench', base_url=fake.url)
+    photos = [phone_photo(i) for i in range(args.photos)]
+    upload = sum(len(p) for p in photos)
+    print(f"{args.photos} photos, {upload / 1e6:.1f} MB of JPEG")
+
+    for label, kind, size in (('base64 JSON (before)', 'json', upload),
+                              ('multipart (after)', 'multipart', upload),
+                              ('raw body, 1 photo', 'raw', len(photos[0]))):
+        peak = measure(environ_for(kind, photos))
+        print(f"{label:22s} peak {peak / 1e6:7.1f} MB  ({peak / size:4.1f}x upload)")
+    fake.stop()
+
+if __name__ == '__main__':
+    main()
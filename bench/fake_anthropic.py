@@ -0,0 +1,167 @@
+"""Local stand-in for the Anthropic Messages API.
+
+Latency is modelled as a fixed base plus time to push the request over a
+throttled uplink plus a per-input-token cost, with image tokens estimated as
+width * height / 750 like the real API.
+
+    python bench/fake_anthropic.py --port 8765
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 python app.py
+"""
+import argparse
+import base64
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+VEHICLE_REPLY = {'marca': 'Toyota', 'model': 'Corolla', 'an_fabricatie': '2019', 'motor_capacitate': '1.8L',
+                 'combustibil': 'hybrid', 'emisii_co2': '101'}
+MARKET_REPLY = {'min_price': 17000, 'max_price': 21000, 'avg_price': 19000, 'confidence': 'medium',
+                'notes': 'fake estimate'}
+
+def image_tokens(data):
+    if Image is None:
+        return len(data) // 1000
+    try:
+        with Image.open(io.BytesIO(base64.b64decode(data))) as img:
+            width, height = img.size
+    except Exception:
+        return 1600
+    return width * height // 750
+
+class FakeAnthropic:
+    def __init__(self, port=0, base_latency=0.4, upload_mbps=20.0, ms_per_1k_tokens=15.0, ms_per_output_chunk=25.0,
+                 rate_limit_rate=0.0, retry_after=None, seed=None):
+        self.base_latency = base_latency
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.rate_limited = 0
+        self.ms_per_output_chunk = ms_per_output_chunk
+        self.upload_mbps = upload_mbps
+        self.ms_per_1k_tokens = ms_per_1k_tokens
+        self.requests = 0
+        self.bytes_received = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                request = json.loads(body)
+                status, payload = fake.handle(request, len(body))
+                if request.get('stream') and status == 200:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.send_header('Connection', 'close')
+                    self.end_headers()
+                    for event in fake.stream_events(payload):
+                        self.wfile.write(event)
+                        self.wfile.flush()
+                    self.close_connection = True
+                    return
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                if status == 429 and fake.retry_after is not None:
+                    self.send_header('retry-after', str(fake.retry_after))
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def snapshot(self):
+        with self._lock:
+            return {'requests': self.requests, 'rate_limited': self.rate_limited, 'bytes_received': self.bytes_received}
+
+    def handle(self, request, body_size):
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += body_size
+            limited = self._random.random() < self.rate_limit_rate
+            if limited:
+                self.rate_limited += 1
+        if limited:
+            return 429, {'type': 'error', 'error': {'type': 'rate_limit_error', 'message': 'fake rate limit'}}
+
+        tokens, has_image = 0, False
+        for message in request.get('messages', []):
+            content = message['content']
+            for block in content if isinstance(content, list) else [{'type': 'text', 'text': content}]:
+                if block['type'] == 'image':
+                    has_image = True
+                    tokens += image_tokens(block['source']['data'])
+                elif block['type'] == 'text':
+                    tokens += len(block['text']) // 4
+
+        upload = body_size * 8 / (self.upload_mbps * 1e6) if self.upload_mbps else 0
+        time.sleep(self.base_latency + upload + tokens / 1000 * self.ms_per_1k_tokens / 1000)
+        reply = VEHICLE_REPLY if has_image else MARKET_REPLY
+        return 200, {
+            'id': f'msg_fake_{self.requests}', 'type': 'message', 'role': 'assistant',
+            'model': request.get('model'), 'stop_reason': 'end_turn', 'stop_sequence': None,
+            'content': [{'type': 'text', 'text': json.dumps(reply)}],
+            'usage': {'input_tokens': tokens, 'output_tokens': 60},
+        }
+
+    def stream_events(self, message):
+        """Messages API SSE frames for a finished message, with the text split into small deltas"""
+        def frame(event, data):
+            return f'event: {event}\ndata: {json.dumps(data)}\n\n'.encode()
+
+        text = message['content'][0]['text']
+        start = dict(message, content=[], stop_reason=None, usage=dict(message['usage'], output_tokens=1))
+        yield frame('message_start', {'type': 'message_start', 'message': start})
+        yield frame('content_block_start', {'type': 'content_block_start', 'index': 0,
+                                            'content_block': {'type': 'text', 'text': ''}})
+        for i in range(0, len(text), 12):
+            time.sleep(self.ms_per_output_chunk / 1000)
+            yield frame('content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                                'delta': {'type': 'text_delta', 'text': text[i:i + 12]}})
+        yield frame('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+        yield frame('message_delta', {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                                      'usage': {'output_tokens': message['usage']['output_tokens']}})
+        yield frame('message_stop', {'type': 'message_stop'})
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--base-latency', type=float, default=0.4)
+    parser.add_argument('--upload-mbps', type=float, default=20.0)
+    parser.add_argument('--ms-per-1k-tokens', type=float, default=15.0)
+    parser.add_argument('--ms-per-output-chunk', type=float, default=25.0, help='delay between streamed text deltas')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='fraction of requests answered with 429')
+    parser.add_argument('--retry-after', type=float, help='retry-after header (seconds) sent with 429s')
+    args = parser.parse_args()
+    fake = FakeAnthropic(args.port, args.base_latency, args.upload_mbps, args.ms_per_1k_tokens, args.ms_per_output_chunk,
+                         rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after)
+    print(f"Fake Anthropic API on {fake.url}")
+    fake.server.serve_forever()
+
+if __name__ == '__main__':
+    main()
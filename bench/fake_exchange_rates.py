@@ -0,0 +1,98 @@
+"""Local stand-in for exchangerate-api's /v4/latest/<base> endpoint.
+
+Answers with the same JSON shape as the real API: fixed rates, a configurable
+delay, and a configurable fraction of 503s to exercise the stale-rate path.
+
+    python bench/fake_exchange_rates.py --port 8766
+    EXCHANGE_RATES_URL=http://127.0.0.1:8766/v4/latest/EUR python app.py
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EUR_RATES = {'EUR': 1.0, 'AED': 3.97, 'USD': 1.08, 'GBP': 0.85, 'JPY': 162.4, 'CHF': 0.96, 'CNY': 7.81,
+             'SAR': 4.05, 'TRY': 35.1, 'RON': 4.97, 'PLN': 4.31}
+
+class FakeExchangeRates:
+    def __init__(self, port=0, latency=0.15, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status, payload = fake.handle(self.path)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_port}/v4/latest/EUR'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def snapshot(self):
+        with self._lock:
+            return {'requests': self.requests, 'errors': self.errors}
+
+    def handle(self, path):
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        time.sleep(self.latency)
+        match = re.fullmatch(r'/v4/latest/([A-Z]{3})', path.split('?', 1)[0])
+        if failed:
+            return 503, {'result': 'error', 'error-type': 'service-unavailable'}
+        if not match or match.group(1) not in EUR_RATES:
+            return 404, {'result': 'error', 'error-type': 'unsupported-code'}
+        base = EUR_RATES[match.group(1)]
+        now = datetime.now(timezone.utc)
+        return 200, {
+            'provider': 'https://www.exchangerate-api.com',
+            'terms': 'https://www.exchangerate-api.com/terms',
+            'base': match.group(1),
+            'date': now.strftime('%Y-%m-%d'),
+            'time_last_updated': int(now.replace(hour=0, minute=0, second=1, microsecond=0).timestamp()),
+            'rates': {code: round(rate / base, 6) for code, rate in EUR_RATES.items()},
+        }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency', type=float, default=0.15)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    args = parser.parse_args()
+    fake = FakeExchangeRates(args.port, args.latency, args.error_rate)
+    print(f"Fake exchangerate-api on {fake.url}")
+    fake.server.serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+"""Reproducible micro-benchmarks and load scenarios, written out as JSON.
+
+Micro-benchmarks time calculate_bpm(), calculate_shipping_cost() and
+detect_image_type() in-process. Load scenarios start gunicorn the way the
+Procfile does and point it at the local fakes, so no API credits are used
+and results don't depend on the network:
+bench/fake_anthropic.py stands in for the Messages API and
+bench/fake_exchange_rates.py for exchangerate-api. Each scenario reports
+p50/p95/p99 latency and throughput. Inputs and the fakes' 429s are seeded,
+and the JSON records the commit and settings of the run. --compare flags
+regressions against an earlier results file.
+
+    python bench/run_benchmarks.py [--only micro|load] [--scenario calculate-costs ...]
+    python bench/run_benchmarks.py --compare bench/results/baseline.json
+"""
+import argparse
+import base64
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.fake_anthropic import FakeAnthropic
+from bench.fake_exchange_rates import FakeExchangeRates
+
+FUELS = ('benzina', 'diesel', 'hybrid', 'electric')
+VEHICLES = [('Toyota', 'Land Cruiser'), ('Toyota', 'Corolla'), ('Nissan', 'Patrol'), ('BMW', 'X5'),
+            ('Mercedes-Benz', 'GLE'), ('Volkswagen', 'Golf'), ('Lexus', 'LX 600'), ('Porsche', 'Cayenne')]
+# Distinct payloads in the calculate-costs-requote scenario; at most --warmup so all are stored before measuring
+REQUOTES = 16
+# Compared by --compare: metric -> True if higher is better
+TRACKED = {'ns_per_op': False, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False, 'throughput_rps': True}
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list"""
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)] if ordered else None
+
+def test_photo(seed, size=(2000, 1500)):
+    from PIL import Image
+    out = io.BytesIO()
+    Image.effect_noise(size, 40 + seed).convert('RGB').save(out, 'JPEG', quality=90)
+    return out.getvalue()
+
+def cost_payloads(rng, n):
+    # A fixed set of vehicles so background market estimates settle into the cache like real traffic
+    vehicles = [(make, model, year, rng.choice(FUELS)) for make, model in VEHICLES for year in (2019, 2021, 2023)]
+    payloads = []
+    for _ in range(n):
+        make, model, year, fuel = rng.choice(vehicles)
+        payloads.append({'vehicle_price': rng.randrange(8000, 120000, 500), 'co2': rng.randint(90, 320), 'year': year,
+                         'fuel_type': fuel, 'marca': make, 'model': model,
+                         'shipping_method': rng.choice(('roro', 'container_20ft', 'container_40ft')),
+                         'dimensions': {'length': rng.uniform(4, 5.5), 'height': rng.uniform(1.4, 2.1)}})
+    return payloads
+
+def time_calls(fn, inputs, repeats):
+    """ns per call: median and best of `repeats` passes over inputs"""
+    runs = []
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        for args in inputs:
+            fn(*args)
+        runs.append((time.perf_counter_ns() - start) / len(inputs))
+    runs.sort()
+    median = runs[len(runs) // 2]
+    return {'ns_per_op': round(median, 1), 'best_ns_per_op': round(runs[0], 1),
+            'ops_per_sec': round(1e9 / median), 'calls': len(inputs), 'repeats': repeats}
+
+def run_micro(args):
+    import app
+
+    rng = random.Random(args.seed)
+    n = args.micro_calls
+    bpm_inputs = [(rng.randint(0, 400), rng.randint(2018, 2026), rng.choice(FUELS)) for _ in range(n)]
+    shipping_inputs = [(rng.choice(('roro', 'container_20ft', 'container_40ft', 'air')),
+                        {'length': rng.uniform(3.5, 6), 'height': rng.uniform(1.3, 2.5)}) for _ in range(n)]
+    png = b'\x89PNG\r\n\x1a\n' + bytes(56)
+    webp = b'RIFF\x00\x00\x00\x00WEBPVP8 ' + bytes(48)
+    jpeg = test_photo(0, (64, 64))
+    encoded = [base64.b64encode(data).decode() for data in (jpeg, png, webp)]
+    image_inputs = [(rng.choice(('data:image/jpeg;base64,', '')) + rng.choice(encoded),) for _ in range(n)]
+
+    return {
+        'calculate_bpm': time_calls(app.calculate_bpm, bpm_inputs, args.repeats),
+        'calculate_shipping_cost': time_calls(app.calculate_shipping_cost, shipping_inputs, args.repeats),
+        'detect_image_type': time_calls(app.detect_image_type, image_inputs, args.repeats),
+    }
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(args, claude_url, rates_url, workdir):
+    """gunicorn as in the Procfile (or with --gunicorn-config), wired to the fakes and to throwaway caches"""
+    port = free_port()
+    env = dict(os.environ,
+               ANTHROPIC_API_KEY='bench', ANTHROPIC_BASE_URL=claude_url, EXCHANGE_RATES_URL=rates_url,
+               LOG_LEVEL='WARNING', METRICS_DIR=os.path.join(workdir, 'metrics'),
+               CLAUDE_TOKENS_PER_MINUTE=str(args.claude_tokens_per_minute),
+               PRICE_INDEX_DIR=os.path.join(workdir, 'price_index'))
+    for name, filename in (('ANALYSIS_CACHE_DB', 'analyses.sqlite3'), ('MARKET_CACHE_DB', 'market.sqlite3'),
+                           ('EXCHANGE_RATES_SNAPSHOT', 'rates.json'), ('CLAUDE_BUDGET_DB', 'budget.sqlite3'),
+                           ('SINGLE_FLIGHT_DB', 'inflight.sqlite3'), ('QUOTE_STORE_DB', 'quotes.sqlite3')):
+        env[name] = os.path.join(workdir, filename)
+    command = [sys.executable, '-m', 'gunicorn', 'app:app', '--workers', str(args.workers), '--bind', f'127.0.0.1:{port}']
+    command += ['--config', args.gunicorn_config] if args.gunicorn_config else ['--threads', str(args.threads)]
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited: {server.stderr.read().decode()[-2000:]}')
+        try:
+            if requests.get(base_url + '/api/exchange-rates', timeout=10).ok:
+                return server, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('gunicorn did not become ready within 60s')
+
+def warm_up(base_url, send, count):
+    with requests.Session() as session:
+        for i in range(count):
+            send(session, base_url, i)
+
+def load(base_url, send, total, concurrency):
+    """Run send(session, base_url, i) for i in range(total) from `concurrency` threads"""
+    results = [None] * total
+    counter = itertools.count()
+
+    def worker():
+        with requests.Session() as session:
+            while True:
+                i = next(counter)
+                if i >= total:
+                    return
+                start = time.perf_counter()
+                try:
+                    status = send(session, base_url, i).status_code
+                except requests.RequestException:
+                    status = 0
+                results[i] = (time.perf_counter() - start, status)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(seconds * 1000 for seconds, status in results if 200 <= status < 400)
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': total, 'concurrency': concurrency, 'ok': len(latencies), 'errors': total - len(latencies),
+        'statuses': statuses, 'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else None,
+        **{f'p{int(q * 100)}_ms': round(percentile(latencies, q), 2) if latencies else None for q in (0.5, 0.95, 0.99)},
+        'max_ms': round(latencies[-1], 2) if latencies else None,
+    }
+
+def start_background(base_url, send, concurrency, stop):
+    """Threads calling send() back to back until stop is set"""
+    def worker():
+        with requests.Session() as session:
+            for i in itertools.count():
+                if stop.is_set():
+                    return
+                try:
+                    send(session, base_url, i)
+                except requests.RequestException:
+                    pass
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def scenarios(args):
+    """name -> (send(session, base_url, i), request count, concurrency, background send or None)"""
+    rng = random.Random(args.seed)
+    payloads = cost_payloads(rng, args.requests)
+    photos = [test_photo(i, args.photo_size) for i in range(4)]
+
+    def costs(session, base_url, i):
+        # refresh=1: every request is a new quote (computed and written to the quote store)
+        return session.post(base_url + '/api/calculate-costs?refresh=1', json=payloads[i % len(payloads)], timeout=30)
+
+    def requote(session, base_url, i):
+        # The warm-up quotes these, so every measured request is read back from the quote store
+        return session.post(base_url + '/api/calculate-costs', json=payloads[i % REQUOTES], timeout=30)
+
+    def rates(session, base_url, i):
+        return session.get(base_url + '/api/exchange-rates', timeout=30)
+
+    def home(session, base_url, i):
+        return session.get(base_url + '/', headers={'Accept-Encoding': 'br, gzip'}, timeout=30)
+
+    etag = {}
+
+    def home_revalidate(session, base_url, i):
+        if 'value' not in etag:
+            etag['value'] = home(session, base_url, i).headers.get('ETag', '')
+        return session.get(base_url + '/', headers={'Accept-Encoding': 'br, gzip', 'If-None-Match': etag['value']},
+                           timeout=30)
+
+    def analyze(session, base_url, i):
+        # refresh=1 skips the analysis cache, so every request does preprocessing and a (fake) Claude call
+        return session.post(base_url + '/api/analyze-vehicle?refresh=1', timeout=120,
+                            files={'images': (f'photo{i}.jpg', photos[i % len(photos)], 'image/jpeg')})
+
+    def analyze_cached(session, base_url, i):
+        return session.post(base_url + '/api/analyze-vehicle', timeout=120,
+                            files={'images': ('photo.jpg', photos[0], 'image/jpeg')})
+
+    return {
+        'calculate-costs': (costs, args.requests, args.concurrency, None),
+        'calculate-costs-requote': (requote, args.requests, args.concurrency, None),
+        'exchange-rates': (rates, args.requests, args.concurrency, None),
+        'home': (home, args.requests, args.concurrency, None),
+        'home-revalidate': (home_revalidate, args.requests, args.concurrency, None),
+        'analyze-vehicle': (analyze, args.analyze_requests, args.analyze_concurrency, None),
+        'analyze-vehicle-cached': (analyze_cached, args.requests, args.concurrency, None),
+        # Quotes while photo analyses hold the server's upstream slots
+        'calculate-costs-during-analysis': (costs, args.requests, args.concurrency, analyze),
+    }
+
+def run_load(args, workdir):
+    claude = FakeAnthropic(base_latency=args.claude_latency, upload_mbps=args.upload_mbps,
+                           rate_limit_rate=args.rate_limit_rate, retry_after=0.2 if args.rate_limit_rate else None,
+                           seed=args.seed).start()
+    rates = FakeExchangeRates(latency=args.rates_latency, seed=args.seed).start()
+    server, base_url = (None, args.target) if args.target else start_server(args, claude.url, rates.url, workdir)
+    results = {}
+    try:
+        for name, (send, total, concurrency, background) in scenarios(args).items():
+            if args.scenario and name not in args.scenario:
+                continue
+            warm_up(base_url, send, min(args.warmup, total))
+            stop = threading.Event()
+            if background:
+                start_background(base_url, background, args.background_concurrency, stop)
+                time.sleep(args.background_ramp)
+            before = claude.snapshot(), rates.snapshot()
+            result = load(base_url, send, total, concurrency)
+            after = claude.snapshot(), rates.snapshot()
+            stop.set()
+            if background:
+                result['background_concurrency'] = args.background_concurrency
+            result['upstream'] = {'anthropic': {k: after[0][k] - before[0][k] for k in after[0]},
+                                  'exchange_rates': {k: after[1][k] - before[1][k] for k in after[1]}}
+            results[name] = result
+            print(f"{name:32s} {result['throughput_rps']:8.1f} req/s  p50 {result['p50_ms']} ms  "
+                  f"p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms  errors {result['errors']}", flush=True)
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                # Workers drain queued market-estimate jobs before exiting; results are already in hand
+                server.kill()
+                server.wait()
+        claude.stop()
+        rates.stop()
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, tolerance):
+    """Regressions (metric worse than baseline by more than tolerance), printing every tracked change"""
+    regressions = []
+    for section in ('micro', 'load'):
+        for name, metrics in results.get(section, {}).items():
+            old = baseline.get(section, {}).get(name)
+            if not old:
+                continue
+            for metric, higher_is_better in TRACKED.items():
+                if not metrics.get(metric) or not old.get(metric):
+                    continue
+                change = metrics[metric] / old[metric] - 1
+                worse = -change if higher_is_better else change
+                flag = 'REGRESSION' if worse > tolerance else ''
+                print(f"{section}/{name:24s} {metric:15s} {old[metric]:>12} -> {metrics[metric]:>12} {change:+7.1%} {flag}")
+                if flag:
+                    regressions.append(f'{section}/{name}/{metric}')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', choices=('micro', 'load'))
+    parser.add_argument('--scenario', action='append', help='load scenario to run (repeatable; default all)')
+    parser.add_argument('--output', help='results file (default bench/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='earlier results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative slowdown for --compare')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--micro-calls', type=int, default=20000)
+    parser.add_argument('--repeats', type=int, default=7)
+    parser.add_argument('--target', help='benchmark an already running server instead of starting gunicorn')
+    parser.add_argument('--gunicorn-config', help='gunicorn config file, e.g. gunicorn_async.conf.py (replaces --threads)')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--analyze-requests', type=int, default=200)
+    parser.add_argument('--analyze-concurrency', type=int, default=64)
+    parser.add_argument('--photo-size', type=lambda v: tuple(map(int, v.split('x'))), default=(2000, 1500),
+                        help='WIDTHxHEIGHT of the uploaded test photos')
+    parser.add_argument('--background-concurrency', type=int, default=48,
+                        help='analyses kept in flight during calculate-costs-during-analysis')
+    parser.add_argument('--background-ramp', type=float, default=2.0, help='seconds to let background load build up')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--claude-latency', type=float, default=0.4)
+    parser.add_argument('--upload-mbps', type=float, default=20.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='fraction of fake Claude calls answered 429')
+    parser.add_argument('--rates-latency', type=float, default=0.15)
+    parser.add_argument('--claude-tokens-per-minute', type=int, default=100_000_000,
+                        help='scheduler budget for the server (default: effectively unlimited)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-run-')
+    # Set before app is imported for the micro-benchmarks, so nothing touches the real caches
+    os.environ.pop('ANTHROPIC_API_KEY', None)
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('METRICS_ENABLED', '0')
+    for name, filename in (('ANALYSIS_CACHE_DB', 'analyses.sqlite3'), ('MARKET_CACHE_DB', 'market.sqlite3'),
+                           ('EXCHANGE_RATES_SNAPSHOT', 'rates.json'), ('CLAUDE_BUDGET_DB', 'budget.sqlite3'),
+                           ('SINGLE_FLIGHT_DB', 'inflight.sqlite3'), ('QUOTE_STORE_DB', 'quotes.sqlite3')):
+        os.environ.setdefault(name, os.path.join(workdir, 'micro', filename))
+
+    started = datetime.now(timezone.utc)
+    results = {'meta': {'started': started.isoformat(timespec='seconds'), 'commit': git_commit(),
+                        'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count(), 'settings': vars(args)}}
+    if args.only != 'load':
+        results['micro'] = run_micro(args)
+        for name, result in results['micro'].items():
+            print(f"{name:24s} {result['ns_per_op']:10.1f} ns/op  (best {result['best_ns_per_op']:.1f})", flush=True)
+    if args.only != 'micro':
+        results['load'] = run_load(args, workdir)
+
+    output = args.output or os.path.join(ROOT, 'bench', 'results', started.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
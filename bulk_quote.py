@@ -0,0 +1,241 @@
+"""Offline bulk quoting: the /api/calculate-costs math over large CSV or NDJSON vehicle lists.
+
+    python bulk_quote.py stock.csv -o stock.quotes.ndjson [--workers 4] [--market-estimates]
+
+The input is read as a stream and cut into chunks of --chunk-size vehicles.
+A process pool quotes the chunks with batch.quote_chunk(), using the same BPM
+tables and shipping rate card as costs(). Output lines are the batch
+endpoint's NDJSON: the row's 0-based index, its id if it has one, and the
+costs() result, or an error for rows that can't be quoted (listed first
+within their chunk, except in a chunk that had to be quoted row by row). At most two chunks per worker are in flight, and chunks
+are written in input order as they finish, so memory stays flat however
+long the input is.
+
+After every chunk the output is synced and <output>.checkpoint.json records
+the rows done and the output's size. Running the same command after an
+interruption drops anything written past the checkpoint and carries on from
+the next row. The whole run uses the quote date and prices it started with,
+and a checkpoint is refused if the input, tariffs or shipping rates have
+changed since. --restart starts over.
+
+--market-estimates adds each vehicle's market estimate from the local tiers
+only (the price index, then the shared market-estimate cache), never from
+Claude. Vehicles with neither get null.
+
+CSV columns, all optional with the same defaults as costs(): vehicle_price,
+co2, year, fuel_type, shipping_method, length, height, marca, model, engine,
+id. NDJSON lines are costs() request bodies.
+"""
+import argparse
+import csv
+import fcntl
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import batch
+from market_cache import MarketEstimateCache, normalize_vehicle_key
+from price_index import DEFAULT_INDEX_DIR, load_price_index
+from quote_store import quote_versions
+from shipping_rates import shipping_details
+from tariffs import DEFAULT_TARIFF_FILE, load_tariffs
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# quote_chunk() writes rejected rows as {"index": n, "error": ...}
+ERROR_LINE = re.compile(r'^\{"index": \d+, "error": ', re.M)
+
+# Per worker process, set by _init_worker()
+_tariffs = None
+_estimate = None
+
+def csv_vehicle(row):
+    """A costs() request body from a CSV row; empty cells fall back to the defaults"""
+    d = {key: value for key, value in row.items() if key and value not in (None, '')}
+    dimensions = {key: d.pop(key) for key in ('length', 'height') if key in d}
+    if dimensions:
+        d['dimensions'] = dimensions
+    return d
+
+def read_vehicles(path, fmt):
+    """Yield (index, vehicle or None) from a CSV or NDJSON file, a line at a time"""
+    if fmt == 'ndjson':
+        with open(path, 'rb') as f:
+            yield from batch.iter_ndjson(f)
+        return
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for index, row in enumerate(csv.DictReader(f)):
+            yield index, csv_vehicle(row)
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _exit_with_parent(parent):
+    # A killed run leaves its workers blocked on the task queue; don't let them linger
+    while os.getppid() == parent:
+        time.sleep(1)
+    os._exit(1)
+
+def _init_worker(tariff_file, market_estimates, price_index_dir, market_cache_db):
+    global _tariffs, _estimate
+    threading.Thread(target=_exit_with_parent, args=(os.getppid(),), daemon=True).start()
+    _tariffs = load_tariffs(tariff_file)
+    if market_estimates:
+        index = load_price_index(price_index_dir)
+        cache = MarketEstimateCache(market_cache_db)
+
+        def estimate(d):
+            result = index.estimate(d) if index is not None else None
+            return result if result is not None else cache.get(normalize_vehicle_key(d), count=False)
+        _estimate = estimate
+
+def _quote(chunk, on):
+    """(NDJSON bytes, rows, rejected rows) for one chunk, in a worker process"""
+    try:
+        text = batch.quote_chunk(chunk, _tariffs, shipping_details, _estimate, on=on)
+    except Exception:
+        # A row quote_chunk() didn't anticipate; alone it becomes an error line, so resuming can't stall here
+        text = ''.join(_quote_row(row, on) for row in chunk)
+    return text.encode(), len(chunk), len(ERROR_LINE.findall(text))
+
+def _quote_row(row, on):
+    try:
+        return batch.quote_chunk([row], _tariffs, shipping_details, _estimate, on=on)
+    except Exception as e:
+        return json.dumps({'index': row[0], 'error': f'Invalid vehicle: {e}'}) + '\n'
+
+def input_identity(path):
+    st = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def save_checkpoint(path, state):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+def load_checkpoint(path, args, tariffs):
+    """The checkpoint to resume from, None to start fresh; raises SystemExit if it doesn't match this run"""
+    if args.restart or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    if state['input'] != input_identity(args.input):
+        sys.exit(f"{args.input} has changed since {path} was written; use --restart to quote it from the start")
+    if state['market_estimates'] != args.market_estimates:
+        sys.exit(f"{path} was written {'with' if state['market_estimates'] else 'without'} --market-estimates; "
+                 f"run the same way or use --restart")
+    if state['versions'] != quote_versions(tariffs, date.fromisoformat(state['quote_date'])):
+        sys.exit(f"Tariffs or shipping rates have changed since {path} was written; use --restart")
+    if not state['done'] and (not os.path.exists(args.output) or os.path.getsize(args.output) < state['output_bytes']):
+        sys.exit(f"{args.output} is shorter than {path} records; use --restart")
+    return state
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='vehicles as .csv or .ndjson/.jsonl')
+    parser.add_argument('-o', '--output', required=True, help='NDJSON quotes')
+    parser.add_argument('--format', choices=('csv', 'ndjson'), help='input format (default: from the extension)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=int(os.environ.get('BATCH_CHUNK_SIZE', 2048)))
+    parser.add_argument('--market-estimates', action='store_true',
+                        help='add price-index / cached market estimates (no Claude calls)')
+    parser.add_argument('--checkpoint', help='default: <output>.checkpoint.json')
+    parser.add_argument('--restart', action='store_true', help='ignore an existing checkpoint and start over')
+    parser.add_argument('--tariff-file', default=os.environ.get('BPM_TARIFF_FILE', DEFAULT_TARIFF_FILE))
+    parser.add_argument('--price-index', default=os.environ.get('PRICE_INDEX_DIR', DEFAULT_INDEX_DIR))
+    parser.add_argument('--market-cache-db', default=os.environ.get(
+        'MARKET_CACHE_DB', os.path.join(ROOT, 'cache', 'market_estimates.sqlite3')))
+    args = parser.parse_args()
+    fmt = args.format or ('csv' if args.input.lower().endswith('.csv') else 'ndjson')
+    checkpoint = args.checkpoint or args.output + '.checkpoint.json'
+
+    # One run per output: a second one would interleave its chunks with ours. A POSIX lock (unlike flock)
+    # isn't inherited by the pool's processes, so it goes away with this one
+    lock_file = open(checkpoint + '.lock', 'w')
+    try:
+        fcntl.lockf(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        sys.exit(f"Another bulk_quote run is writing {args.output}")
+
+    tariffs = load_tariffs(args.tariff_file)
+    state = load_checkpoint(checkpoint, args, tariffs)
+    if state is not None and state['done']:
+        print(f"{args.output} is already complete ({state['rows']} rows); use --restart to quote again", file=sys.stderr)
+        return 0
+    if state is None:
+        today = date.today()
+        state = {'input': input_identity(args.input), 'format': fmt, 'market_estimates': args.market_estimates,
+                 'quote_date': today.isoformat(), 'versions': quote_versions(tariffs, today),
+                 'rows': 0, 'errors': 0, 'output_bytes': 0, 'done': False}
+        open(args.output, 'wb').close()
+        save_checkpoint(checkpoint, state)
+    else:
+        print(f"Resuming {args.input} after {state['rows']} rows", file=sys.stderr)
+    on = date.fromisoformat(state['quote_date'])
+
+    start = time.perf_counter()
+    resumed_rows = state['rows']
+    last_report = start
+    pool = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                               initargs=(args.tariff_file, args.market_estimates, args.price_index,
+                                         args.market_cache_db))
+    in_flight = deque()
+    try:
+        with open(args.output, 'r+b') as out:
+            # Anything past the checkpoint is from chunks that were never recorded
+            out.truncate(state['output_bytes'])
+            out.seek(state['output_bytes'])
+
+            def write(future):
+                nonlocal last_report
+                body, rows, errors = future.result()
+                out.write(body)
+                out.flush()
+                os.fsync(out.fileno())
+                state['rows'] += rows
+                state['errors'] += errors
+                state['output_bytes'] += len(body)
+                save_checkpoint(checkpoint, state)
+                now = time.perf_counter()
+                if now - last_report >= 5:
+                    last_report = now
+                    print(f"{state['rows']} rows, {(state['rows'] - resumed_rows) / (now - start):,.0f} rows/s",
+                          file=sys.stderr)
+
+            rows = itertools.islice(read_vehicles(args.input, fmt), state['rows'], None)
+            for chunk in chunked(rows, args.chunk_size):
+                in_flight.append(pool.submit(_quote, chunk, on))
+                if len(in_flight) >= 2 * args.workers:
+                    write(in_flight.popleft())
+            while in_flight:
+                write(in_flight.popleft())
+    except KeyboardInterrupt:
+        pool.shutdown(wait=False, cancel_futures=True)
+        print(f"Interrupted after {state['rows']} rows; run the same command again to resume", file=sys.stderr)
+        return 130
+    pool.shutdown()
+
+    state['done'] = True
+    save_checkpoint(checkpoint, state)
+    elapsed = time.perf_counter() - start
+    print(f"Quoted {state['rows'] - resumed_rows} rows in {elapsed:.1f}s "
+          f"({(state['rows'] - resumed_rows) / elapsed:,.0f} rows/s); {state['rows']} in {args.output}, "
+          f"{state['errors']} rejected", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,271 @@
+import heapq
+import logging
+import itertools
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+import anthropic
+
+import telemetry
+from telemetry import stage
+from sqlite_store import LocalConnection
+
+INTERACTIVE = 0
+BACKGROUND = 1
+RETRY_STATUSES = (429, 529)
+# Claude scales images to ~1.15 MP before tokenizing, which caps an image at ~1600 tokens
+IMAGE_TOKENS = 1600
+logger = logging.getLogger(__name__)
+
+class ClaudeBusy(Exception):
+    """Raised instead of queueing when the scheduler is saturated or Anthropic keeps rate limiting"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+def estimate_tokens(kwargs):
+    """Rough input + output token count for a messages.create(**kwargs) call"""
+    tokens = kwargs.get('max_tokens', 1024)
+    for message in kwargs.get('messages', []):
+        content = message['content']
+        for block in content if isinstance(content, list) else [{'type': 'text', 'text': content}]:
+            if block['type'] == 'image':
+                tokens += IMAGE_TOKENS
+            elif block['type'] == 'text':
+                tokens += len(block['text']) // 4
+    return tokens
+
+class TokenBudget:
+    """Sliding one-minute token budget in a SQLite table shared by all gunicorn workers"""
+
+    def __init__(self, db_path, tokens_per_minute):
+        self.db_path = db_path
+        self.tokens_per_minute = tokens_per_minute
+        self._connect = LocalConnection(db_path, autocommit=True)
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS token_usage '
+                         '(id INTEGER PRIMARY KEY, ts REAL NOT NULL, tokens INTEGER NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS token_usage_ts ON token_usage (ts)')
+
+    def reserve(self, tokens):
+        """(reservation id, 0) if tokens fit in the last minute's budget, else (None, seconds to wait)"""
+        if not self.tokens_per_minute:
+            return None, 0
+        # A single call bigger than the whole budget would otherwise never fit
+        tokens = min(tokens, self.tokens_per_minute)
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM token_usage WHERE ts <= ?', (now - 60,))
+            used = conn.execute('SELECT COALESCE(SUM(tokens), 0) FROM token_usage').fetchone()[0]
+            if used + tokens > self.tokens_per_minute:
+                # Wait until enough of the oldest usage has aged out of the window
+                freed, wait = used + tokens - self.tokens_per_minute, 1.0
+                for ts, n in conn.execute('SELECT ts, tokens FROM token_usage ORDER BY ts'):
+                    freed -= n
+                    if freed <= 0:
+                        wait = ts + 60 - now
+                        break
+                conn.execute('COMMIT')
+                return None, max(wait, 0.05)
+            reservation = conn.execute('INSERT INTO token_usage (ts, tokens) VALUES (?, ?)', (now, tokens)).lastrowid
+            conn.execute('COMMIT')
+            return reservation, 0
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def settle(self, reservation, tokens):
+        """Replace a reservation's estimate with the tokens the call actually used"""
+        if reservation is None or tokens is None:
+            return
+        try:
+            self._connect().execute('UPDATE token_usage SET tokens = ? WHERE id = ?', (tokens, reservation))
+        except sqlite3.Error as e:
+            logger.warning("Token budget update error", extra={'error': str(e)})
+
+    def used(self):
+        if not self.tokens_per_minute:
+            return None
+        return self._connect().execute('SELECT COALESCE(SUM(tokens), 0) FROM token_usage WHERE ts > ?',
+                                       (time.time() - 60,)).fetchone()[0]
+
+class ClaudeScheduler:
+    """Single entry point for Claude calls.
+
+    At most max_concurrent calls run per process, waiting callers are served
+    by priority (INTERACTIVE before BACKGROUND) then arrival, every call is
+    charged against the shared TokenBudget, and 429/529 responses are retried
+    with full-jitter exponential backoff. When max_queue callers are already
+    waiting, or a call can't start within queue_timeout, ClaudeBusy is raised
+    with a Retry-After estimate instead.
+    """
+
+    def __init__(self, get_client, budget, max_concurrent=8, max_queue=32, queue_timeout=30,
+                 max_retries=4, backoff_base=0.5, backoff_cap=20):
+        self.get_client = get_client
+        self.budget = budget
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._avg_call_s = 2.0
+        self.stats = {'calls': 0, 'failed': 0, 'retries': 0, 'rate_limited': 0, 'rejected': 0,
+                      'budget_waits': 0, 'queue_peak': 0, 'tokens_estimated': 0, 'tokens_used': 0}
+
+    def _count(self, name, n=1):
+        with self._cond:
+            self.stats[name] += n
+
+    def retry_after(self):
+        """Seconds until a slot is likely free, from queue depth and average call time"""
+        with self._cond:
+            return (len(self._waiting) / self.max_concurrent + 1) * self._avg_call_s
+
+    def saturated(self):
+        with self._cond:
+            return len(self._waiting) >= self.max_queue
+
+    def _acquire(self, priority, tokens):
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            if len(self._waiting) >= self.max_queue:
+                self.stats['rejected'] += 1
+                raise ClaudeBusy('Claude request queue is full',
+                                 (len(self._waiting) / self.max_concurrent + 1) * self._avg_call_s)
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            self.stats['queue_peak'] = max(self.stats['queue_peak'], len(self._waiting))
+        try:
+            while True:
+                with self._cond:
+                    while self._waiting[0] != ticket or self._active >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.stats['rejected'] += 1
+                            raise ClaudeBusy('Timed out waiting for a Claude slot', self._avg_call_s)
+                        self._cond.wait(remaining)
+                    # Head of the queue with a free slot: hold the slot while the token budget decides
+                    self._active += 1
+                # reserve() can wait seconds on another worker's SQLite lock; don't hold up this process meanwhile
+                try:
+                    reservation, wait = self.budget.reserve(tokens)
+                except BaseException:
+                    with self._cond:
+                        self._active -= 1
+                    raise
+                with self._cond:
+                    if not wait:
+                        self.stats['tokens_estimated'] += tokens
+                        return reservation
+                    self._active -= 1
+                    self.stats['budget_waits'] += 1
+                    if time.monotonic() + wait > deadline:
+                        self.stats['rejected'] += 1
+                        raise ClaudeBusy('Claude token budget exhausted', wait)
+                    self._cond.wait(wait)
+        finally:
+            with self._cond:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def _release(self, reservation, started, usage):
+        used = usage.input_tokens + usage.output_tokens if usage is not None else None
+        if usage is not None:
+            telemetry.count('claude', input_tokens=usage.input_tokens, output_tokens=usage.output_tokens)
+            telemetry.observe('claude_tokens', usage.input_tokens, telemetry.TOKEN_BUCKETS, direction='input')
+            telemetry.observe('claude_tokens', usage.output_tokens, telemetry.TOKEN_BUCKETS, direction='output')
+        self.budget.settle(reservation, used)
+        with self._cond:
+            self._active -= 1
+            self._avg_call_s = 0.8 * self._avg_call_s + 0.2 * (time.monotonic() - started)
+            if used is not None:
+                self.stats['tokens_used'] += used
+            self._cond.notify_all()
+
+    def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        try:
+            delay = max(delay, float(error.response.headers.get('retry-after', 0)))
+        except (AttributeError, TypeError, ValueError):
+            pass
+        return delay
+
+    def _with_retries(self, call):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return call()
+            except anthropic.APIStatusError as e:
+                if e.status_code not in RETRY_STATUSES:
+                    raise
+                self._count('rate_limited')
+                delay = self._backoff(attempt, e)
+                if attempt == self.max_retries:
+                    raise ClaudeBusy(f'Anthropic API still returning {e.status_code} after {attempt + 1} attempts', delay) from e
+                self._count('retries')
+                logger.warning("Claude API rate limited, retrying",
+                               extra={'status': e.status_code, 'delay_s': round(delay, 2), 'attempt': attempt + 1})
+                time.sleep(delay)
+
+    def create(self, priority=INTERACTIVE, **kwargs):
+        """client.messages.create(**kwargs) through the scheduler"""
+        client = self.get_client().with_options(max_retries=0)
+        with stage('claude_queue'):
+            reservation = self._acquire(priority, estimate_tokens(kwargs))
+        started, msg = time.monotonic(), None
+        try:
+            with stage('claude'):
+                msg = self._with_retries(lambda: client.messages.create(**kwargs))
+            self._count('calls')
+            return msg
+        except Exception:
+            self._count('failed')
+            raise
+        finally:
+            self._release(reservation, started, getattr(msg, 'usage', None))
+
+    @contextmanager
+    def stream(self, priority=INTERACTIVE, **kwargs):
+        """client.messages.stream(**kwargs) through the scheduler; only opening the stream is retried"""
+        client = self.get_client().with_options(max_retries=0)
+        with stage('claude_queue'):
+            reservation = self._acquire(priority, estimate_tokens(kwargs))
+        started, stream = time.monotonic(), None
+        try:
+            with stage('claude'), ExitStack() as stack:
+                stream = self._with_retries(lambda: stack.enter_context(client.messages.stream(**kwargs)))
+                self._count('calls')
+                yield stream
+        except Exception:
+            self._count('failed')
+            raise
+        finally:
+            try:
+                usage = stream.current_message_snapshot.usage
+            except Exception:
+                usage = None
+            self._release(reservation, started, usage)
+
+    def snapshot(self):
+        with self._cond:
+            stats = dict(self.stats, active=self._active, waiting=len(self._waiting),
+                         avg_call_s=round(self._avg_call_s, 3))
+        stats.update(max_concurrent=self.max_concurrent, max_queue=self.max_queue,
+                     tokens_per_minute=self.budget.tokens_per_minute, tokens_last_minute=self.budget.used(),
+                     pid=os.getpid())
+        return stats
@@ -0,0 +1,113 @@
+"""The single-page frontend, built once into hashed, precompressed assets.
+
+templates/index.html is the only source. At startup its inline <style> and
+<script> blocks move to /assets/app.<hash>.css and .js. The content hash is
+in the name, so those are cached for a year. The remaining HTML shell is
+small and is revalidated on every visit against a strong ETag. Each asset
+is stored identity-, gzip- and, when the brotli package is installed,
+br-encoded. respond() picks the encoding from Accept-Encoding and answers
+a matching If-None-Match with 304.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import re
+
+from werkzeug.http import parse_etags
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'index.html')
+ASSET_PREFIX = '/assets/'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+# Preferred first; identity is always available
+ENCODINGS = ('br', 'gzip')
+logger = logging.getLogger(__name__)
+
+class Asset:
+    """One file in every encoding that is smaller than the original, each with its own strong ETag"""
+
+    def __init__(self, body, content_type, cache_control):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {'identity': (body, self.digest)}
+        encoded = {'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            encoded['br'] = brotli.compress(body, quality=11)
+        for encoding, data in encoded.items():
+            if len(data) < len(body):
+                self.variants[encoding] = (data, f'{self.digest}-{encoding}')
+        self.etags = {etag for _, etag in self.variants.values()}
+
+    def sizes(self):
+        return {encoding: len(data) for encoding, (data, _) in self.variants.items()}
+
+def _quality(accept_encoding):
+    """{coding: q} from an Accept-Encoding header"""
+    qualities = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        qualities[coding.strip().lower()] = q
+    return qualities
+
+def choose_encoding(asset, accept_encoding):
+    qualities = _quality(accept_encoding)
+    wildcard = qualities.get('*', 0.0)
+    for encoding in ENCODINGS:
+        if encoding in asset.variants and qualities.get(encoding, wildcard) > 0:
+            return encoding
+    return 'identity'
+
+class Frontend:
+    """The built page: the HTML shell at / plus its hashed assets, all held in memory"""
+
+    def __init__(self, index_path=DEFAULT_INDEX):
+        with open(index_path, encoding='utf-8') as f:
+            html = f.read()
+        self.assets = {}
+
+        def extract(extension, content_type, reference):
+            def replace(match):
+                asset = Asset(match.group(1).encode(), content_type, IMMUTABLE)
+                name = f'app.{asset.digest}.{extension}'
+                self.assets[name] = asset
+                return reference.format(url=ASSET_PREFIX + name)
+            return replace
+
+        # Only attribute-less blocks are inline code; <script src=...> tags stay as they are
+        html = re.sub(r'<style>(.*?)</style>', extract('css', 'text/css; charset=utf-8',
+                                                      '<link rel="stylesheet" href="{url}">'), html, flags=re.S)
+        html = re.sub(r'<script>(.*?)</script>', extract('js', 'text/javascript; charset=utf-8',
+                                                        '<script src="{url}"></script>'), html, flags=re.S)
+        self.index = Asset(html.encode(), 'text/html; charset=utf-8', REVALIDATE)
+        logger.info('Frontend built', extra={'index': self.index.sizes(),
+                                             'assets': {name: a.sizes() for name, a in self.assets.items()}})
+
+    def respond(self, asset, if_none_match=None, accept_encoding=None):
+        """(body, status, headers) for asset, 304 if the client already has any of its representations"""
+        encoding = choose_encoding(asset, accept_encoding)
+        body, etag = asset.variants[encoding]
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': asset.cache_control, 'Vary': 'Accept-Encoding'}
+        if if_none_match:
+            tags = parse_etags(if_none_match)
+            if tags.star_tag or any(tags.contains_weak(tag) for tag in asset.etags):
+                return b'', 304, headers
+        headers['Content-Type'] = asset.content_type
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return body, 200, headers
@@ -0,0 +1,40 @@
+"""gunicorn settings for fork-friendly preloading (gthread workers, as in the Procfile).
+
+    gunicorn -c gunicorn_preload.conf.py app:app
+
+The master imports app once. Module-level work therefore happens a single
+time and is shared copy-on-write with every worker: the anthropic/numpy/PIL
+imports, the BPM tariff tables, the shipping rate card, the built frontend,
+the price-index maps, and the warmed rates snapshot and market-estimate LRU.
+Everything that must not cross a fork is created lazily per pid:
+- the Anthropic client and its connection pool (app.get_client);
+- the rates requests.Session;
+- SQLite connections;
+- single-flight lease owners;
+- pool and background threads.
+gc.freeze() moves the preloaded objects out of the collector's reach. Without
+it, a worker's first collections write to those pages and un-share them.
+
+New workers (scale-out, max_requests recycling, crashes) fork from a warm
+master instead of importing from scratch. Code changes need a full restart
+(not HUP) to be picked up. Don't combine with gunicorn_async.conf.py: gevent
+must patch before app is imported.
+
+bench/bench_startup.py measures import time, time to N ready workers and
+their combined PSS for both modes. With 4 workers on a 1-CPU VM (importing
+app takes 2.3 s, 1.5 s of it in anthropic):
+
+    mode                       all workers ready    PSS master + workers
+    Procfile (no preload)      10.9 s               326 MB
+    gunicorn_preload.conf.py    2.6 s               108 MB
+"""
+import gc
+import os
+
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+def when_ready(server):
+    # app has been imported in this (master) process; keep its objects' pages shared after fork
+    gc.freeze()
@@ -0,0 +1,64 @@
+import io
+import logging
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Claude downsizes anything with a long edge above ~1568 px, so sending more only costs bandwidth
+DEFAULT_MAX_EDGE = 1568
+DEFAULT_QUALITY = 85
+OUTPUT_FORMATS = {'jpeg': ('JPEG', 'image/jpeg'), 'webp': ('WEBP', 'image/webp'), 'png': ('PNG', 'image/png')}
+logger = logging.getLogger(__name__)
+
+class ImageTooLarge(ValueError):
+    """The image's pixel count is past Pillow's decompression-bomb limit (Image.MAX_IMAGE_PIXELS)"""
+
+def sniff_media_type(raw):
+    """Media type from the file's magic bytes, or None if unrecognised"""
+    head = bytes(raw[:32])
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head.startswith(b'GIF87a') or head.startswith(b'GIF89a'):
+        return 'image/gif'
+    if head[0:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:8] == b'ftyp':
+        brand = head[8:12]
+        if brand in (b'avif', b'avis'):
+            return 'image/avif'
+        if brand in (b'heic', b'heix', b'hevc', b'heim', b'heis', b'mif1', b'msf1'):
+            return 'image/heic'
+    return None
+
+def preprocess_image(raw, max_edge=DEFAULT_MAX_EDGE, output_format='jpeg', quality=DEFAULT_QUALITY):
+    """Apply EXIF orientation, drop metadata, downscale and re-encode.
+
+    Returns (bytes, media_type, info). Images Pillow can't decode are passed
+    through unchanged with their sniffed media type; ones too large to decode
+    safely raise ImageTooLarge.
+    """
+    sniffed = sniff_media_type(raw)
+    info = {'input_bytes': len(raw), 'input_type': sniffed}
+    try:
+        with Image.open(io.BytesIO(raw)) as img:
+            info['input_size'] = img.size
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when that still covers max_edge
+            img.draft('RGB', (max_edge, max_edge))
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGBA' if output_format == 'png' else 'RGB')
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            pil_format, media_type = OUTPUT_FORMATS[output_format]
+            out = io.BytesIO()
+            img.save(out, pil_format, quality=quality, optimize=True)
+            data = out.getvalue()
+            info['output_size'] = img.size
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e)) from e
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        logger.info("Image preprocessing skipped", extra={'error': str(e)})
+        return raw, sniffed or 'image/jpeg', dict(info, output_bytes=len(raw), passthrough=True)
+
+    info['output_bytes'] = len(data)
+    return data, media_type, info
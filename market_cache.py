@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_store import LocalConnection
+
+FUEL_ALIASES = {
+    'petrol': 'benzina', 'gasoline': 'benzina', 'gas': 'benzina', 'benzin': 'benzina', 'benzine': 'benzina',
+    'diesel': 'diesel', 'motorina': 'diesel',
+    'hybrid': 'hybrid', 'hibrid': 'hybrid', 'phev': 'hybrid',
+    'electric': 'electric', 'electric/ev': 'electric', 'ev': 'electric', 'electrica': 'electric',
+}
+logger = logging.getLogger(__name__)
+
+def normalize_engine(engine):
+    """'2.0T', '2.0L', '2.0 tdi', '1998cc' -> '2.0'"""
+    text = str(engine or '').strip().casefold()
+    match = re.search(r'\d+(?:[.,]\d+)?', text)
+    if not match:
+        return re.sub(r'\s+', ' ', text)
+    size = float(match.group(0).replace(',', '.'))
+    if size >= 100:
+        size = size / 1000
+    return f'{size:.1f}'
+
+def normalize_text(value):
+    """'  Mercedes-Benz ' -> 'mercedes benz'"""
+    return re.sub(r'[\s\-_]+', ' ', str(value or '').strip().casefold())
+
+def normalize_vehicle_key(vehicle_data):
+    """Canonical make|model|year|engine|fuel|co2 string for a market estimate"""
+    fuel = normalize_text(vehicle_data.get('fuel_type', 'benzina'))
+    try:
+        year = int(vehicle_data.get('year', 2020))
+    except (TypeError, ValueError):
+        year = 2020
+    try:
+        co2 = int(float(vehicle_data.get('co2', 180)))
+    except (TypeError, ValueError):
+        co2 = 180
+
+    return '|'.join([
+        normalize_text(vehicle_data.get('marca', 'Unknown')),
+        normalize_text(vehicle_data.get('model', 'Unknown')),
+        str(year),
+        normalize_engine(vehicle_data.get('engine', '2.0L')),
+        FUEL_ALIASES.get(fuel, fuel),
+        str(co2),
+    ])
+
+class MarketEstimateCache:
+    """In-process LRU with TTL in front of a SQLite table shared by all workers.
+
+    Expired rows are deleted on write, at most once per purge_interval per process.
+    """
+
+    def __init__(self, db_path, max_entries=1024, ttl=6 * 3600, purge_interval=600):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._connect = LocalConnection(db_path)
+        self._next_purge = 0
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'purged': 0}
+
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS market_estimates '
+                             '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)')
+                conn.execute('CREATE INDEX IF NOT EXISTS market_estimates_expires ON market_estimates (expires)')
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get(self, key, count=True):
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._lru.move_to_end(key)
+                    if count:
+                        self.stats['memory_hits'] += 1
+                    return entry[0]
+                del self._lru[key]
+
+        if self.db_path:
+            try:
+                row = self._connect().execute(
+                    'SELECT value, expires FROM market_estimates WHERE key = ? AND expires > ?', (key, now)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning("Market cache read error", extra={'error': str(e)})
+                row = None
+            if row:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                if count:
+                    self._count('disk_hits')
+                return value
+
+        if count:
+            self._count('misses')
+        return None
+
+    def set(self, key, value):
+        now = time.time()
+        expires = now + self.ttl
+        self._remember(key, value, expires)
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute('INSERT OR REPLACE INTO market_estimates (key, value, expires) VALUES (?, ?, ?)',
+                                 (key, json.dumps(value), expires))
+            except sqlite3.Error as e:
+                logger.warning("Market cache write error", extra={'error': str(e)})
+            self.purge(now)
+        self._count('stores')
+
+    def purge(self, now=None):
+        """Delete expired rows from SQLite (only if purge_interval has passed since this process last did)"""
+        now = now or time.time()
+        with self._lock:
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_interval
+        try:
+            with self._connect() as conn:
+                deleted = conn.execute('DELETE FROM market_estimates WHERE expires <= ?', (now,)).rowcount
+        except sqlite3.Error as e:
+            logger.warning("Market cache purge error", extra={'error': str(e)})
+            return
+        with self._lock:
+            self.stats['purged'] += deleted
+
+    def _remember(self, key, value, expires):
+        with self._lock:
+            self._lru[key] = (value, expires)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def warm(self, limit=None):
+        """Fill the LRU with the newest unexpired rows from SQLite; returns how many were loaded"""
+        if not self.db_path:
+            return 0
+        limit = min(limit or self.max_entries, self.max_entries)
+        try:
+            rows = self._connect().execute(
+                'SELECT key, value, expires FROM market_estimates WHERE expires > ? ORDER BY expires DESC LIMIT ?',
+                (time.time(), limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Market cache warm-up error", extra={'error': str(e)})
+            return 0
+        # Oldest first, so the newest rows end up most recently used
+        for key, value, expires in reversed(rows):
+            self._remember(key, json.loads(value), expires)
+        return len(rows)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._lru)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        if self.db_path:
+            try:
+                stats['disk_entries'] = self._connect().execute(
+                    'SELECT COUNT(*) FROM market_estimates WHERE expires > ?', (time.time(),)
+                ).fetchone()[0]
+            except sqlite3.Error:
+                stats['disk_entries'] = None
+        stats['pid'] = os.getpid()
+        return stats
@@ -0,0 +1,117 @@
+"""Market-estimate jobs, visible to every gunicorn worker.
+
+/api/calculate-costs hands out a job id and a thread in that worker fills in
+the estimate, but the client's polls can land on any worker. Job state
+therefore lives in a SQLite table (next to the market-estimate cache) rather
+than in process memory. Jobs are readable for ttl seconds; older rows are
+deleted as new jobs come in, at most once per purge_interval.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlite_store import LocalConnection
+
+logger = logging.getLogger(__name__)
+
+class MarketEstimateJobs:
+    """Status ('pending', 'done', 'failed') and result of each market-estimate job, by job id"""
+
+    def __init__(self, db_path, ttl=600, purge_interval=60):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._connect = LocalConnection(db_path, autocommit=True)
+        self._lock = threading.Lock()
+        self._next_purge = 0
+        self.stats = {'created': 0, 'finished': 0, 'purged': 0}
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS market_estimate_jobs '
+                         '(job_id TEXT PRIMARY KEY, status TEXT NOT NULL, result TEXT, created REAL NOT NULL, '
+                         'finished REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS market_estimate_jobs_created ON market_estimate_jobs (created)')
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def create(self, job_id, result=None):
+        """Record a new job: pending, or already done when its result is known"""
+        now = time.time()
+        self.purge(now)
+        try:
+            self._connect().execute(
+                'INSERT OR REPLACE INTO market_estimate_jobs (job_id, status, result, created, finished) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (job_id, 'pending' if result is None else 'done', None if result is None else json.dumps(result),
+                 now, None if result is None else now))
+        except sqlite3.Error as e:
+            logger.warning("Market estimate job write error", extra={'error': str(e)})
+            return
+        self.count('created')
+
+    @contextmanager
+    def transaction(self):
+        """Commit the jobs created inside the block together (the batch endpoint creates one per vehicle)"""
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            yield
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def finish(self, job_id, result):
+        """Settle a pending job: done with its result, or failed if there is none"""
+        try:
+            self._connect().execute(
+                'UPDATE market_estimate_jobs SET status = ?, result = ?, finished = ? WHERE job_id = ?',
+                ('done' if result else 'failed', json.dumps(result) if result else None, time.time(), job_id))
+        except sqlite3.Error as e:
+            logger.warning("Market estimate job write error", extra={'error': str(e)})
+            return
+        self.count('finished')
+
+    def get(self, job_id):
+        """{'job_id', 'status', 'result'}, or None for an unknown or expired job"""
+        try:
+            row = self._connect().execute(
+                'SELECT status, result FROM market_estimate_jobs WHERE job_id = ? AND created > ?',
+                (job_id, time.time() - self.ttl)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Market estimate job read error", extra={'error': str(e)})
+            return None
+        if row is None:
+            return None
+        return {'job_id': job_id, 'status': row[0], 'result': json.loads(row[1]) if row[1] else None}
+
+    def purge(self, now=None):
+        """Delete jobs past the TTL (only if purge_interval has passed since this process last did)"""
+        now = now or time.time()
+        with self._lock:
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_interval
+        try:
+            deleted = self._connect().execute('DELETE FROM market_estimate_jobs WHERE created <= ?',
+                                              (now - self.ttl,)).rowcount
+        except sqlite3.Error as e:
+            logger.warning("Market estimate job purge error", extra={'error': str(e)})
+            return
+        self.count('purged', deleted)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        try:
+            stats['stored'] = self._connect().execute('SELECT COUNT(*) FROM market_estimate_jobs').fetchone()[0]
+        except sqlite3.Error:
+            stats['stored'] = None
+        stats['pid'] = os.getpid()
+        return stats
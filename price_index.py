@@ -0,0 +1,194 @@
+"""Comparable-sales price index built from our own historic sales.
+
+Sales are stored column by column as .npy files, sorted by make/model so each
+model's comparables are one contiguous slice, and opened memory-mapped:
+loading costs a few file opens and pages are faulted in on first use.
+
+    python price_index.py build sales.csv [data/price_index]
+
+Input columns: marca, model, year, fuel_type, co2, price (CSV, or Parquet
+when pyarrow is installed).
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from array import array
+
+import numpy as np
+
+from market_cache import FUEL_ALIASES, normalize_text
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'price_index')
+FUELS = ('benzina', 'diesel', 'hybrid', 'electric')
+COLUMNS = {'year': np.int16, 'fuel': np.int8, 'co2': np.int16, 'price': np.float32}
+
+def _fuel(value):
+    fuel = normalize_text(value)
+    fuel = FUEL_ALIASES.get(fuel, fuel)
+    return FUELS.index(fuel) if fuel in FUELS else 0
+
+def _int(value, default):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError, OverflowError):
+        return default
+
+def _clamp(value, dtype):
+    """value limited to dtype's range; numpy 2 won't mix an out-of-range Python int with that column"""
+    info = np.iinfo(dtype)
+    return min(max(value, int(info.min)), int(info.max))
+
+def _read_rows(path):
+    if path.endswith('.parquet'):
+        if pq is None:
+            raise RuntimeError('Reading Parquet needs pyarrow (pip install pyarrow)')
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=65536):
+            yield from batch.to_pylist()
+        return
+    with open(path, newline='', encoding='utf-8') as f:
+        yield from csv.DictReader(f)
+
+def build_index(source, out_dir=DEFAULT_INDEX_DIR):
+    """Read sales from source and write the columnar index to out_dir; returns the row count"""
+    groups, keys = {}, array('i')
+    columns = {name: array('d') for name in COLUMNS}
+    for row in _read_rows(source):
+        price = _int(row.get('price'), 0)
+        if price <= 0:
+            continue
+        key = f"{normalize_text(row.get('marca'))}|{normalize_text(row.get('model'))}"
+        keys.append(groups.setdefault(key, len(groups)))
+        columns['year'].append(_int(row.get('year'), 0))
+        columns['fuel'].append(_fuel(row.get('fuel_type')))
+        columns['co2'].append(_int(row.get('co2'), 0))
+        columns['price'].append(price)
+
+    names = sorted(groups)
+    rank_of_group = np.empty(len(groups), dtype=np.int32)
+    rank_of_group[[groups[name] for name in names]] = np.arange(len(names), dtype=np.int32)
+    ranks = rank_of_group[np.frombuffer(keys, dtype=np.int32)]
+    # Sort by model then year so every model's sales are one contiguous slice
+    order = np.lexsort((np.frombuffer(columns['year'], dtype=np.float64), ranks))
+    ranks = ranks[order]
+    starts = np.searchsorted(ranks, np.arange(len(names)), side='left')
+    ends = np.searchsorted(ranks, np.arange(len(names)), side='right')
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, dtype in COLUMNS.items():
+        np.save(os.path.join(out_dir, f'{name}.npy'), np.frombuffer(columns[name], dtype=np.float64)[order].astype(dtype))
+    meta = {'rows': int(len(order)), 'built': time.time(), 'source': os.path.basename(source),
+            'groups': {key: [int(starts[i]), int(ends[i])] for i, key in enumerate(names)}}
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return meta['rows']
+
+def _quantile(values, q):
+    """Linearly interpolated quantile of a short array (np.percentile's overhead dominates at this size)"""
+    ordered = sorted(values.tolist())
+    pos = (len(ordered) - 1) * q
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+class PriceIndex:
+    """Nearest-neighbour comparables over one memory-mapped make/model slice.
+
+    Distance is years apart + fuel mismatch penalty + CO2 difference / co2_scale;
+    the k nearest sales within max_distance are used and at least
+    min_comparables are required, otherwise estimate() returns None.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_DIR, k=25, min_comparables=8, max_distance=4.0,
+                 fuel_penalty=3.0, co2_scale=40.0):
+        self.path = path
+        self.k = k
+        self.min_comparables = min_comparables
+        self.max_distance = max_distance
+        self.fuel_penalty = np.float32(fuel_penalty)
+        self.co2_scale = np.float32(co2_scale)
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.rows = meta['rows']
+        self.groups = meta['groups']
+        self.version = f"{meta.get('source', '')}@{int(meta.get('built', 0))}"
+        # Plain ndarray views of the maps; np.memmap's subclass hooks cost more than the arithmetic on a slice
+        self.columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r').view(np.ndarray)
+                        for name in COLUMNS}
+        self.stats = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def comparables(self, vehicle_data):
+        """(prices, distances) of the nearest sales for vehicle_data, nearest first"""
+        span = self.groups.get(f"{normalize_text(vehicle_data.get('marca'))}|{normalize_text(vehicle_data.get('model'))}")
+        if span is None:
+            return np.empty(0, np.float32), np.empty(0)
+        start, end = span
+        year = _clamp(_int(vehicle_data.get('year'), 2020), COLUMNS['year'])
+        co2 = _clamp(_int(vehicle_data.get('co2'), 180), COLUMNS['co2'])
+        # Sales are sorted by year within a model, so the usable years are a sub-slice
+        years = self.columns['year'][start:end]
+        start, end = (start + int(np.searchsorted(years, year - self.max_distance, 'left')),
+                      start + int(np.searchsorted(years, year + self.max_distance, 'right')))
+        distance = (np.abs(self.columns['year'][start:end] - year)
+                    + self.fuel_penalty * (self.columns['fuel'][start:end] != _fuel(vehicle_data.get('fuel_type')))
+                    + np.abs(self.columns['co2'][start:end] - co2) / self.co2_scale)
+        near = np.flatnonzero(distance <= self.max_distance)
+        if len(near) > self.k:
+            near = near[np.argpartition(distance[near], self.k)[:self.k]]
+        near = near[np.argsort(distance[near], kind='stable')]
+        return self.columns['price'][start:end][near], distance[near]
+
+    def estimate(self, vehicle_data):
+        """min/max/avg price in the same shape as the Claude estimate, or None without enough comparables"""
+        prices, distance = self.comparables(vehicle_data)
+        if len(prices) < self.min_comparables:
+            self._count('misses')
+            return None
+        self._count('hits')
+        low, avg, high = (_quantile(prices, q) for q in (0.1, 0.5, 0.9))
+        close = float(np.mean(distance))
+        return {
+            'min_price': int(round(low, -2)), 'max_price': int(round(high, -2)), 'avg_price': int(round(avg, -2)),
+            'confidence': 'high' if len(prices) >= self.k and close <= 1.5 else 'medium',
+            'notes': f'{len(prices)} comparable sales (mean distance {close:.1f})',
+            'source': 'price_index', 'comparables': int(len(prices))
+        }
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        return dict(stats, rows=self.rows, models=len(self.groups), version=self.version)
+
+def load_price_index(path=DEFAULT_INDEX_DIR, **options):
+    """PriceIndex at path, or None if no index has been built there"""
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+    return PriceIndex(path, **options)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='build the index from a sales CSV/Parquet file')
+    build.add_argument('source')
+    build.add_argument('out_dir', nargs='?', default=DEFAULT_INDEX_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = build_index(args.source, args.out_dir)
+    print(f"Indexed {rows} sales into {args.out_dir} in {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""Persisted /api/calculate-costs quotes.
+
+A quote's key is a SHA-256 of its normalized inputs plus the pricing
+versions it was computed with. An identical re-quote is therefore a
+primary-key lookup, and any tariff or rate change yields a new quote rather
+than a stale one. Rows live in a WAL-mode SQLite table shared by all gunicorn
+workers and are indexed for history by vehicle and by time. history() walks
+an index with a keyset cursor and yields one row at a time, so a page is never
+held in memory. The stored inputs and result are spliced into the output as
+raw JSON text rather than parsed.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from shipping_rates import SHIPPING_RATES_VERSION
+from sqlite_store import LocalConnection
+
+logger = logging.getLogger(__name__)
+
+def quote_key(inputs, versions):
+    """SHA-256 hex of the canonical JSON of inputs and pricing versions"""
+    payload = json.dumps({'inputs': inputs, 'versions': versions}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def quote_versions(tariffs, on=None):
+    """Everything besides the inputs that a quote's numbers depend on"""
+    on = on or date.today()
+    return {
+        'bpm_tariffs': tariffs.version,
+        'bpm_schedule': tariffs.schedule_for(on).effective_from.isoformat(),
+        # BPM depends on the vehicle's age, so a quote is only valid for the year it was made in
+        'tax_year': on.year,
+        'shipping_rates': SHIPPING_RATES_VERSION
+    }
+
+def encode_cursor(created, key):
+    return base64.urlsafe_b64encode(f'{created!r}|{key}'.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """(created, key) from encode_cursor(); raises ValueError for anything else"""
+    try:
+        created, key = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split('|', 1)
+        return float(created), key
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError('invalid cursor') from e
+
+class QuoteStore:
+    """Every computed quote, keyed by quote_key(), with history by make/model/year and creation time"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._connect = LocalConnection(db_path)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'estimates_attached': 0, 'bypassed': 0}
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS quotes '
+                         '(key TEXT PRIMARY KEY, created REAL NOT NULL, marca TEXT NOT NULL, model TEXT NOT NULL, '
+                         'year INTEGER NOT NULL, inputs TEXT NOT NULL, versions TEXT NOT NULL, result TEXT NOT NULL, '
+                         'market_estimate TEXT)')
+            conn.execute('CREATE INDEX IF NOT EXISTS quotes_vehicle ON quotes (marca, model, year, created, key)')
+            conn.execute('CREATE INDEX IF NOT EXISTS quotes_created ON quotes (created, key)')
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def get(self, key, count=True):
+        """The stored response for key (market_estimate as a finished job, or None), or None if not stored"""
+        try:
+            row = self._connect().execute('SELECT created, result, market_estimate FROM quotes WHERE key = ?',
+                                          (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Quote store read error", extra={'error': str(e)})
+            row = None
+        if count:
+            self.count('misses' if row is None else 'hits')
+        if row is None:
+            return None
+        result = json.loads(row[1])
+        result['market_estimate'] = {'status': 'done', 'result': json.loads(row[2])} if row[2] else None
+        result['quote_id'] = key
+        result['quoted_at'] = row[0]
+        return result
+
+    def put(self, key, vehicle, inputs, versions, result, market_estimate=None):
+        """Store (or, on a forced re-quote, replace) a quote; vehicle is the normalized (marca, model, year)"""
+        created = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute('INSERT OR REPLACE INTO quotes (key, created, marca, model, year, inputs, versions, result, '
+                             'market_estimate) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             (key, created, *vehicle, json.dumps(inputs), json.dumps(versions), json.dumps(result),
+                              json.dumps(market_estimate) if market_estimate else None))
+        except sqlite3.Error as e:
+            logger.warning("Quote store write error", extra={'error': str(e)})
+            return None
+        self.count('stores')
+        return created
+
+    def set_market_estimate(self, key, estimate):
+        """Attach a market estimate that finished after the quote was stored"""
+        if not estimate:
+            return
+        try:
+            with self._connect() as conn:
+                updated = conn.execute('UPDATE quotes SET market_estimate = ? WHERE key = ?',
+                                       (json.dumps(estimate), key)).rowcount
+        except sqlite3.Error as e:
+            logger.warning("Quote store write error", extra={'error': str(e)})
+            return
+        if updated:
+            self.count('estimates_attached')
+
+    def history(self, marca=None, model=None, year=None, since=None, until=None, cursor=None, limit=50):
+        """Yield (created, key, item JSON text) newest first, at most limit rows after cursor.
+
+        Filters are exact matches on the normalized make/model/year; since and
+        until bound the creation time (epoch seconds, since inclusive).
+        """
+        where, params = [], []
+        for column, value in (('marca', marca), ('model', model), ('year', year)):
+            if value is not None:
+                where.append(f'{column} = ?')
+                params.append(value)
+        if since is not None:
+            where.append('created >= ?')
+            params.append(since)
+        if until is not None:
+            where.append('created < ?')
+            params.append(until)
+        if cursor is not None:
+            where.append('(created, key) < (?, ?)')
+            params.extend(cursor)
+        sql = ('SELECT created, key, marca, model, year, inputs, result, market_estimate FROM quotes'
+               + (' WHERE ' + ' AND '.join(where) if where else '')
+               + ' ORDER BY created DESC, key DESC LIMIT ?')
+        rows = self._connect().execute(sql, (*params, limit))
+        try:
+            for created, key, row_marca, row_model, row_year, inputs, result, estimate in rows:
+                yield created, key, (f'{{"quote_id":"{key}","quoted_at":{created!r},'
+                                     f'"vehicle":{json.dumps({"marca": row_marca, "model": row_model, "year": row_year})},'
+                                     f'"inputs":{inputs},"result":{result},"market_estimate":{estimate or "null"}}}')
+        finally:
+            rows.close()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        try:
+            stats['stored'] = self._connect().execute('SELECT COUNT(*) FROM quotes').fetchone()[0]
+        except sqlite3.Error:
+            stats['stored'] = None
+        stats['pid'] = os.getpid()
+        return stats
@@ -0,0 +1,183 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+# Only used until the first successful fetch has been written to the snapshot file
+BOOTSTRAP_RATES = {'EUR': 1.0, 'AED': 3.95, 'USD': 1.09}
+logger = logging.getLogger(__name__)
+
+def _lock_exclusive(lock_file, poll_interval=0.05):
+    """flock that polls instead of blocking, so a gevent worker keeps serving while another process holds it"""
+    while True:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            time.sleep(poll_interval)
+
+def build_rate_matrix(eur_rates, currencies):
+    """Full cross-rate matrix {from: {to: rate}} derived from EUR-based quotes"""
+    base = {c: float(eur_rates[c]) for c in currencies if eur_rates.get(c)}
+    return {a: {b: base[b] / base[a] for b in base} for a in base}
+
+def legacy_rate_keys(matrix):
+    """EUR_TO_AED style keys the frontend already reads"""
+    pairs = [('EUR', 'AED'), ('EUR', 'USD'), ('AED', 'EUR'), ('USD', 'EUR'), ('AED', 'USD'), ('USD', 'AED')]
+    return {f'{a}_TO_{b}': matrix[a][b] for a, b in pairs if a in matrix and b in matrix[a]}
+
+class ExchangeRateService:
+    """Serves rates from memory and refreshes them off the request path.
+
+    A snapshot file plus an flock'd lock file let gunicorn workers share one
+    upstream fetch: whoever takes the lock fetches, the rest re-read the file.
+    """
+
+    def __init__(self, url, snapshot_path, currencies=('EUR', 'AED', 'USD'),
+                 upstream_period=86400, retry_interval=300, stale_grace=3600, timeout=5):
+        self.url = url
+        self.snapshot_path = snapshot_path
+        self.lock_path = snapshot_path + '.lock'
+        self.currencies = tuple(currencies)
+        self.upstream_period = upstream_period
+        self.retry_interval = retry_interval
+        self.stale_grace = stale_grace
+        self.timeout = timeout
+        self.stats = {'upstream_fetches': 0, 'upstream_errors': 0, 'shared_reloads': 0}
+        self._state = None
+        self._last_attempt = 0.0
+        self._last_error = None
+        self._refresh_lock = threading.Lock()
+        self._scheduler = None
+        self._scheduler_pid = None
+        self._wake = threading.Event()
+        self._http = None
+        self._http_pid = None
+        os.makedirs(os.path.dirname(os.path.abspath(snapshot_path)), exist_ok=True)
+
+    def _next_due(self, state):
+        due = state['time_last_updated'] + self.upstream_period
+        return max(due, self._last_attempt + self.retry_interval)
+
+    def _build_state(self, data):
+        matrix = build_rate_matrix(data['rates'], self.currencies)
+        return {
+            'time_last_updated': float(data.get('time_last_updated') or time.time()),
+            'fetched_at': time.time(),
+            'matrix': matrix,
+            'legacy': legacy_rate_keys(matrix),
+        }
+
+    def _read_snapshot(self):
+        try:
+            with open(self.snapshot_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_snapshot(self, state):
+        tmp_path = f'{self.snapshot_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _session(self):
+        # Pooled keep-alive connections, one session per process: sockets don't survive a fork
+        if self._http_pid != os.getpid():
+            self._http, self._http_pid = requests.Session(), os.getpid()
+        return self._http
+
+    def _adopt(self, state):
+        if state and (self._state is None or state['time_last_updated'] >= self._state['time_last_updated']):
+            self._state = state
+            # Another worker fetched successfully after our last failed attempt: its error no longer applies
+            if state['fetched_at'] > self._last_attempt:
+                self._last_error = None
+            return True
+        return False
+
+    def load_snapshot(self):
+        """Adopt the shared snapshot file without touching upstream or starting the refresh thread"""
+        return self._adopt(self._read_snapshot())
+
+    def refresh(self, force=False):
+        """Fetch upstream unless another thread or worker already refreshed"""
+        with self._refresh_lock:
+            with open(self.lock_path, 'a') as lock_file:
+                _lock_exclusive(lock_file)
+                try:
+                    shared = self._read_snapshot()
+                    if self._adopt(shared):
+                        self.stats['shared_reloads'] += 1
+                    now = time.time()
+                    if not force and self._state and (now < self._state['time_last_updated'] + self.upstream_period
+                                                      or now - self._state['fetched_at'] < self.retry_interval):
+                        return self._state
+
+                    self._last_attempt = time.time()
+                    try:
+                        response = self._session().get(self.url, timeout=self.timeout)
+                        response.raise_for_status()
+                        state = self._build_state(response.json())
+                    except Exception as e:
+                        self.stats['upstream_errors'] += 1
+                        self._last_error = str(e)
+                        logger.warning("Exchange rate API error", extra={'error': str(e)})
+                        return self._state
+                    self.stats['upstream_fetches'] += 1
+                    self._last_error = None
+                    self._state = state
+                    self._write_snapshot(state)
+                    return state
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _run_scheduler(self):
+        while True:
+            state = self._state
+            delay = self._next_due(state) - time.time() if state else self.retry_interval
+            self._wake.wait(max(delay, 1.0))
+            self._wake.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("Exchange rate refresh error", extra={'error': str(e)})
+
+    def _ensure_scheduler(self):
+        # Started lazily so each forked worker gets its own thread
+        if self._scheduler_pid == os.getpid() and self._scheduler.is_alive():
+            return
+        self._scheduler_pid = os.getpid()
+        self._scheduler = threading.Thread(target=self._run_scheduler, name='exchange-rates', daemon=True)
+        self._scheduler.start()
+
+    def get(self):
+        """Current rates, never blocking on upstream once anything has been loaded"""
+        if self._state is None:
+            if not self._adopt(self._read_snapshot()) and time.time() - self._last_attempt >= self.retry_interval:
+                self.refresh()
+        self._ensure_scheduler()
+
+        state = self._state
+        now = time.time()
+        if state is None:
+            matrix = build_rate_matrix(BOOTSTRAP_RATES, self.currencies)
+            result = legacy_rate_keys(matrix)
+            result.update({'timestamp': 'fallback', 'stale': True, 'matrix': matrix, 'error': self._last_error})
+            return result
+
+        if now >= self._next_due(state):
+            self._wake.set()
+
+        result = dict(state['legacy'])
+        result.update({
+            'timestamp': int(state['time_last_updated']),
+            'fetched_at': int(state['fetched_at']),
+            'stale': self._last_error is not None or now > state['time_last_updated'] + self.upstream_period + self.stale_grace,
+            'matrix': state['matrix'],
+        })
+        return result
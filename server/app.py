@@ -6,9 +6,14 @@ import base64
 import json
 import re
 
+# tariffs.py lives in the repository root: run this from there, as python -m server.app
+from tariffs import load_tariffs
+
 app = Flask(__name__, template_folder='../templates')
 CORS(app)
 
+bpm_tariffs = load_tariffs()
+
 # API Key - Replit va adăuga asta în Secrets
 ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY', '')
 
@@ -18,37 +23,9 @@ if ANTHROPIC_API_KEY:
     def calculate_bpm(co2, year, fuel_type):
         """
         Calculate BPM (Dutch vehicle registration tax)
-        BPM = base + progressive rates based on CO2 + diesel surcharge
-        Depreciation: 20% per year, 100% after 5 years
+        Rates and depreciation come from the shared schedule in data/bpm_tariffs.json
         """
-        current_year = 2025
-        age = current_year - year
-
-        # 100% depreciation after 5 years = 0 BPM
-        if age >= 5:
-            return 0
-
-        # Base BPM
-        bpm_gross = 400
-
-        # Progressive rates per gram CO2 above 82 g/km
-        if co2 > 82:
-            if co2 <= 140:
-                bpm_gross += (co2 - 82) * 80
-            elif co2 <= 180:
-                bpm_gross += (140 - 82) * 80 + (co2 - 140) * 120
-            else:
-                bpm_gross += (140 - 82) * 80 + (180 - 140) * 120 + (co2 - 180) * 180
-
-        # Diesel surcharge
-        if fuel_type.lower() == 'diesel' and co2 > 82:
-            bpm_gross += (co2 - 82) * 90
-
-        # Apply depreciation
-        depreciation = min(age * 0.20, 1.0)
-        bpm_net = bpm_gross * (1 - depreciation)
-
-        return round(bpm_net, 2)
+        return bpm_tariffs.bpm(co2, year, fuel_type)
         @app.route('/api/analyze-vehicle', methods=['POST'])
         def analyze_vehicle():
             """Analyze vehicle from uploaded photo using Claude Vision API"""
@@ -255,4 +232,4 @@ if ANTHROPIC_API_KEY:
 
 
                         if __name__ == '__main__':
-                            app.run(host='0.0.0.0', port=5000, debug=True
\ No newline at end of file
+                            app.run(host='0.0.0.0', port=5000, debug=True)
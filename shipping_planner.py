@@ -0,0 +1,148 @@
+"""Consolidate several vehicles into RoRo slots and 20ft/40ft containers.
+
+Cars can't sit side by side in an ISO container, so packing is one-dimensional
+along the container length, bounded by door height, width and payload.
+"""
+
+DEFAULT_DIMENSIONS = {'length': 4.5, 'width': 1.8, 'height': 1.5, 'weight': 1500}
+LENGTH_CLEARANCE = 0.15
+WIDTH_CLEARANCE = 0.2
+
+# Usable interior: length, width, door height (m) and payload (kg)
+CONTAINER_SPECS = {
+    'container_20ft': {'length': 5.9, 'width': 2.35, 'height': 2.28, 'payload': 25000},
+    'container_40ft': {'length': 12.03, 'width': 2.35, 'height': 2.28, 'payload': 26500},
+}
+
+def vehicle_dimensions(dims):
+    out = dict(DEFAULT_DIMENSIONS)
+    for key in out:
+        try:
+            value = float((dims or {}).get(key) or 0)
+        except (TypeError, ValueError):
+            value = 0
+        if value > 0:
+            out[key] = value
+    return out
+
+def fits(spec, dims):
+    return (dims['length'] + LENGTH_CLEARANCE <= spec['length']
+            and dims['width'] + WIDTH_CLEARANCE <= spec['width']
+            and dims['height'] <= spec['height']
+            and dims['weight'] <= spec['payload'])
+
+class _Bin:
+    __slots__ = ('items', 'length', 'weight', 'choice', 'cost')
+
+    def __init__(self):
+        self.items, self.length, self.weight = [], 0.0, 0.0
+        self.choice, self.cost = None, 0.0
+
+    def can_take(self, spec, dims):
+        return (self.length + dims['length'] + LENGTH_CLEARANCE <= spec['length']
+                and self.weight + dims['weight'] <= spec['payload'])
+
+    def add(self, i, dims):
+        self.items.append(i)
+        self.length += dims['length'] + LENGTH_CLEARANCE
+        self.weight += dims['weight']
+
+def _split(breakdown, shares, method_label):
+    """Split a rate-card breakdown across vehicles by share, keeping totals exact"""
+    keys = [k for k, v in breakdown.items() if k not in ('shipping_method', 'total') and isinstance(v, (int, float))]
+    allocations = [{'shipping_method': method_label} for _ in shares]
+    for key in keys + ['total']:
+        remaining = round(float(breakdown[key]), 2)
+        for n, share in enumerate(shares):
+            part = remaining if n == len(shares) - 1 else round(breakdown[key] * share, 2)
+            allocations[n][key] = part
+            remaining = round(remaining - part, 2)
+    return allocations
+
+def plan_shipment(vehicles, price_fn, container_specs=CONTAINER_SPECS):
+    """Cheapest mix of RoRo and containers for a list of vehicle dimension dicts.
+
+    price_fn(method, dims) must return a calculate_shipping_cost() breakdown.
+    Returns containers, RoRo indexes and a per-vehicle shipping_allocation in
+    the same shape as calculate_shipping_cost().
+    """
+    dims = [vehicle_dimensions(d) for d in vehicles]
+    roro = [price_fn('roro', d) for d in dims]
+    container_price = {name: price_fn(name, DEFAULT_DIMENSIONS) for name in container_specs}
+    by_size = sorted(container_specs, key=lambda n: container_specs[n]['length'])
+    largest = container_specs[by_size[-1]]
+
+    # First-fit decreasing into the largest container, then price each bin
+    eligible = sorted((i for i, d in enumerate(dims) if fits(largest, d)), key=lambda i: -dims[i]['length'])
+    bins = []
+    for i in eligible:
+        for b in bins:
+            if b.can_take(largest, dims[i]):
+                b.add(i, dims[i])
+                break
+        else:
+            b = _Bin()
+            b.add(i, dims[i])
+            bins.append(b)
+
+    def price_bin(b):
+        options = [('roro', sum(roro[i]['total'] for i in b.items))]
+        for name in by_size:
+            if b.length <= container_specs[name]['length'] and b.weight <= container_specs[name]['payload'] \
+                    and all(fits(container_specs[name], dims[i]) for i in b.items):
+                options.append((name, container_price[name]['total']))
+        b.choice, b.cost = min(options, key=lambda o: o[1])
+
+    # Vehicles in bins that are cheaper to RoRo get offered to containers with spare room
+    for b in bins:
+        price_bin(b)
+    changed = True
+    while changed:
+        changed = False
+        shipped = [b for b in bins if b.choice != 'roro']
+        for b in [b for b in bins if b.choice == 'roro' and b.items]:
+            for i in list(b.items):
+                for target in shipped:
+                    if target.can_take(container_specs[target.choice], dims[i]) and fits(container_specs[target.choice], dims[i]):
+                        target.add(i, dims[i])
+                        b.items.remove(i)
+                        b.length -= dims[i]['length'] + LENGTH_CLEARANCE
+                        b.weight -= dims[i]['weight']
+                        changed = True
+                        break
+            if b.items:
+                price_bin(b)
+    bins = [b for b in bins if b.items]
+
+    allocations = [None] * len(dims)
+    containers = []
+    roro_indexes = [i for i in range(len(dims)) if not fits(largest, dims[i])]
+    for b in bins:
+        if b.choice == 'roro':
+            roro_indexes.extend(b.items)
+            continue
+        shares = [(dims[i]['length'] + LENGTH_CLEARANCE) / b.length for i in b.items]
+        label = f"{container_price[b.choice]['shipping_method']} (shared, {len(b.items)} vehicles)"
+        for i, allocation in zip(b.items, _split(container_price[b.choice], shares, label)):
+            allocations[i] = allocation
+        containers.append({
+            'type': b.choice, 'vehicles': sorted(b.items),
+            'used_length': round(b.length, 2), 'weight': round(b.weight, 1),
+            'total': container_price[b.choice]['total']
+        })
+    for i in roro_indexes:
+        allocations[i] = roro[i]
+
+    standalone = 0.0
+    for i, d in enumerate(dims):
+        options = [roro[i]['total']] + [container_price[n]['total'] for n in by_size if fits(container_specs[n], d)]
+        standalone += min(options)
+    total = round(sum(a['total'] for a in allocations), 2)
+    return {
+        'containers': containers,
+        'roro': sorted(roro_indexes),
+        'allocations': allocations,
+        'total_cost': total,
+        'standalone_cost': round(standalone, 2),
+        'savings': round(standalone - total, 2),
+    }
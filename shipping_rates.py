@@ -0,0 +1,52 @@
+"""Shipping prices per method, with the RoRo surcharges for long and tall vehicles.
+
+Every breakdown calculate_shipping_cost() can return is precomputed into a
+rate card. SHIPPING_RATES_VERSION changes whenever any price does, so stored
+quotes made under other rates are never served again.
+"""
+import hashlib
+import json
+
+SHIPPING_RATES = {
+    'roro': {'shipping_method': 'RoRo (Roll-on/Roll-off)', 'base_shipping': 800, 'loading_fee': 150,
+             'unloading_fee': 150, 'securing_fee': 50, 'insurance': 100},
+    'container_20ft': {'shipping_method': '20ft Container', 'base_shipping': 1500, 'loading_fee': 200,
+                       'unloading_fee': 200, 'securing_fee': 100, 'container_rental': 150, 'insurance': 150},
+    'container_40ft': {'shipping_method': '40ft Container', 'base_shipping': 2200, 'loading_fee': 300,
+                       'unloading_fee': 300, 'securing_fee': 150, 'container_rental': 200, 'insurance': 250},
+}
+RORO_LONG_SURCHARGE = 200
+RORO_TALL_SURCHARGE = 150
+# Metres; strictly above these a vehicle is long / tall
+LONG_VEHICLE_LENGTH = 5
+TALL_VEHICLE_HEIGHT = 2
+
+def build_shipping_rate_card(rates=SHIPPING_RATES):
+    """Every calculate_shipping_cost() breakdown keyed (method, long, tall), totals included"""
+    card = {}
+    for method, fees in rates.items():
+        for long_vehicle in (False, True):
+            for tall_vehicle in (False, True):
+                entry = dict(fees)
+                if method == 'roro':
+                    entry['base_shipping'] += RORO_LONG_SURCHARGE * long_vehicle + RORO_TALL_SURCHARGE * tall_vehicle
+                entry['total'] = sum(v for k, v in entry.items() if k != 'shipping_method')
+                card[method, long_vehicle, tall_vehicle] = entry
+    return card
+
+# Built at import, i.e. once in the gunicorn master under --preload and once per bulk_quote worker
+SHIPPING_RATE_CARD = build_shipping_rate_card()
+SHIPPING_RATES_VERSION = hashlib.sha256(json.dumps([SHIPPING_RATES, RORO_LONG_SURCHARGE, RORO_TALL_SURCHARGE,
+                                                    LONG_VEHICLE_LENGTH, TALL_VEHICLE_HEIGHT],
+                                                   sort_keys=True).encode()).hexdigest()[:12]
+
+def shipping_details(method, long_vehicle, tall_vehicle):
+    """Rate card breakdown for a vehicle already classed as long/tall (batch quoting); shared, so don't modify it"""
+    return SHIPPING_RATE_CARD[method, long_vehicle, tall_vehicle]
+
+def calculate_shipping_cost(container_type, vehicle_dimensions):
+    """Calculate detailed shipping costs (unknown methods are priced as RoRo)"""
+    if container_type not in SHIPPING_RATES:
+        container_type = 'roro'
+    return dict(SHIPPING_RATE_CARD[container_type, vehicle_dimensions.get('length', 0) > LONG_VEHICLE_LENGTH,
+                                   vehicle_dimensions.get('height', 0) > TALL_VEHICLE_HEIGHT])
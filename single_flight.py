@@ -0,0 +1,151 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from sqlite_store import LocalConnection
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Collapse concurrent identical calls into one upstream call.
+
+    Within a process, callers with the same key wait on the first caller's
+    result. Across gunicorn workers, the first caller takes a lease row in a
+    shared SQLite table; callers in other workers poll until the lease is
+    released and then read the result from lookup(key) (the shared cache the
+    leader writes to), running fn themselves only if nothing was stored.
+    """
+
+    def __init__(self, db_path, namespace, lease_ttl=120, poll_interval=0.1):
+        self.db_path = db_path
+        self.namespace = namespace
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self._owner = None
+        self._owner_pid = None
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._connect = LocalConnection(db_path, autocommit=True)
+        self.stats = {'leaders': 0, 'collapsed_local': 0, 'collapsed_remote': 0, 'remote_waits': 0,
+                      'remote_misses': 0, 'lease_errors': 0}
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS inflight '
+                         '(key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)')
+
+    @property
+    def owner(self):
+        # Per process, so forked workers sharing this object don't release each other's leases
+        if self._owner_pid != os.getpid():
+            self._owner, self._owner_pid = f'{os.getpid()}:{uuid.uuid4().hex[:8]}', os.getpid()
+        return self._owner
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def _try_lease(self, key):
+        """True if this process now holds the lease; also True if the store is unusable"""
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT expires FROM inflight WHERE key = ?', (key,)).fetchone()
+                if row and row[0] > now:
+                    conn.execute('COMMIT')
+                    return False
+                conn.execute('INSERT OR REPLACE INTO inflight (key, owner, expires) VALUES (?, ?, ?)',
+                             (key, self.owner, now + self.lease_ttl))
+                conn.execute('COMMIT')
+                return True
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            logger.warning("Single-flight lease error", extra={'error': str(e)})
+            self._count('lease_errors')
+            return True
+
+    def _release(self, key):
+        try:
+            self._connect().execute('DELETE FROM inflight WHERE key = ? AND owner = ?', (key, self.owner))
+        except sqlite3.Error as e:
+            logger.warning("Single-flight release error", extra={'error': str(e)})
+            self._count('lease_errors')
+
+    def _wait_remote(self, key):
+        deadline = time.monotonic() + self.lease_ttl
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            try:
+                row = self._connect().execute('SELECT 1 FROM inflight WHERE key = ? AND expires > ?',
+                                              (key, time.time())).fetchone()
+            except sqlite3.Error:
+                return
+            if row is None:
+                return
+
+    def _lead(self, key, fn, lookup):
+        lease_key = f'{self.namespace}:{key}'
+        while not self._try_lease(lease_key):
+            # Another worker is making this call; its result lands in the shared cache
+            self._count('remote_waits')
+            self._wait_remote(lease_key)
+            result = lookup(key) if lookup else None
+            if result is not None:
+                self._count('collapsed_remote')
+                return result, True
+            self._count('remote_misses')
+        try:
+            # The other worker may have finished between our cache miss and taking the lease
+            result = lookup(key) if lookup else None
+            if result is not None:
+                self._count('collapsed_remote')
+                return result, True
+            self._count('leaders')
+            return fn(), False
+        finally:
+            self._release(lease_key)
+
+    def do(self, key, fn, lookup=None):
+        """(result, shared): fn() runs once for all concurrent callers of key; shared is False only for the caller that ran it"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.stats['collapsed_local'] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, shared = self._lead(key, fn, lookup)
+            return call.result, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats, inflight=len(self._calls))
+        stats['collapsed'] = stats['collapsed_local'] + stats['collapsed_remote']
+        stats['pid'] = os.getpid()
+        return stats
@@ -0,0 +1,29 @@
+"""Connections to the SQLite files shared by gunicorn workers.
+
+Every store (market estimates, analyses, the token budget, single-flight
+leases, quotes) uses one WAL-mode connection per thread. A connection is also
+reopened in a new process: under --preload the master opens some while
+warming caches, and a handle must never be used on both sides of a fork.
+"""
+import os
+import sqlite3
+import threading
+
+class LocalConnection:
+    """Callable returning this thread's (and this process's) connection to db_path"""
+
+    def __init__(self, db_path, timeout=5, autocommit=False):
+        self.db_path = db_path
+        self.timeout = timeout
+        # isolation_level=None: every statement commits on its own unless the caller issues BEGIN
+        self.isolation_level = None if autocommit else ''
+        self._local = threading.local()
+
+    def __call__(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=self.isolation_level)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
@@ -0,0 +1,121 @@
+import json
+
+class IncrementalFieldParser:
+    """Pulls complete top-level "key": value pairs out of a JSON object as text arrives.
+
+    Anything before the first '{' (prose, a ```json fence) is skipped. Nested
+    objects and arrays are returned whole once their closing bracket arrives.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0
+        self.started = False
+        self.finished = False
+        self.fields = {}
+
+    def feed(self, text):
+        """Add text and return the [(key, value)] pairs completed by it"""
+        self.buffer += text
+        found = []
+        while not self.finished:
+            pair = self._next_pair()
+            if pair is None:
+                break
+            self.fields[pair[0]] = pair[1]
+            found.append(pair)
+        return found
+
+    def _skip(self, i, chars=' \t\r\n'):
+        while i < len(self.buffer) and self.buffer[i] in chars:
+            i += 1
+        return i
+
+    def _scan_string(self, i):
+        """Index just past the string starting at buffer[i] == '"', or None if incomplete"""
+        i += 1
+        while i < len(self.buffer):
+            ch = self.buffer[i]
+            if ch == '\\':
+                i += 2
+                continue
+            if ch == '"':
+                return i + 1
+            i += 1
+        return None
+
+    def _scan_value(self, i):
+        """Index just past the JSON value starting at i, or None if it may still grow"""
+        if i >= len(self.buffer):
+            return None
+        ch = self.buffer[i]
+        if ch == '"':
+            return self._scan_string(i)
+        if ch in '{[':
+            depth = 0
+            while i < len(self.buffer):
+                ch = self.buffer[i]
+                if ch == '"':
+                    end = self._scan_string(i)
+                    if end is None:
+                        return None
+                    i = end
+                    continue
+                if ch in '{[':
+                    depth += 1
+                elif ch in '}]':
+                    depth -= 1
+                    if depth == 0:
+                        return i + 1
+                i += 1
+            return None
+        # number / true / false / null: complete once a delimiter follows
+        j = i
+        while j < len(self.buffer) and self.buffer[j] not in ',}] \t\r\n':
+            j += 1
+        return j if j < len(self.buffer) else None
+
+    def _next_pair(self):
+        i = self.pos
+        if not self.started:
+            start = self.buffer.find('{', i)
+            if start < 0:
+                self.pos = len(self.buffer)
+                return None
+            self.started = True
+            i = self.pos = start + 1
+
+        i = self._skip(i, ' \t\r\n,')
+        if i < len(self.buffer) and self.buffer[i] == '}':
+            self.finished = True
+            self.pos = i + 1
+            return None
+        if i >= len(self.buffer) or self.buffer[i] != '"':
+            return None
+        key_end = self._scan_string(i)
+        if key_end is None:
+            return None
+        colon = self._skip(key_end)
+        if colon >= len(self.buffer) or self.buffer[colon] != ':':
+            return None
+        value_start = self._skip(colon + 1)
+        value_end = self._scan_value(value_start)
+        if value_end is None:
+            return None
+        try:
+            key = json.loads(self.buffer[i:key_end])
+            value = json.loads(self.buffer[value_start:value_end])
+        except ValueError:
+            self.finished = True
+            return None
+        self.pos = value_end
+        return key, value
+
+def parse_json_object(text):
+    """First JSON object in text, tolerating prose or code fences around it; None if there is none"""
+    parser = IncrementalFieldParser()
+    parser.feed(text)
+    if not parser.finished:
+        # Closing brace missing (truncated reply); keep whatever fields were complete
+        parser.feed('\n}')
+    return parser.fields or None
@@ -0,0 +1,130 @@
+import base64
+import math
+
+import numpy as np
+
+from batch import SCENARIOS, SHIPPING_METHODS, scenario_totals, shipping_total_array
+
+def axis_values(spec, default, integer=False, max_length=None):
+    """A sweep axis from a list, a scalar, or {"min", "max", "steps" | "step"}; at most max_length values"""
+    if spec is None:
+        spec = default
+    if isinstance(spec, dict):
+        lo = float(spec['min'])
+        hi = float(spec.get('max', lo))
+        if not (math.isfinite(lo) and math.isfinite(hi)):
+            raise ValueError('min and max must be finite')
+        if 'step' in spec:
+            step = float(spec['step'])
+            if step <= 0:
+                raise ValueError('step must be positive')
+            length = (hi + step / 2 - lo) / step  # np.arange's length, before rounding up
+        else:
+            length = max(int(spec.get('steps', hi - lo + 1 if integer else 50)), 1)
+        # Checked before allocating: a huge steps or a tiny step would otherwise exhaust memory
+        if max_length is not None and not length <= max_length:
+            raise ValueError(f'Axis of {length:.0f} values exceeds the limit of {max_length}')
+        values = np.arange(lo, hi + step / 2, step) if 'step' in spec else np.linspace(lo, hi, length)
+    elif isinstance(spec, (list, tuple)):
+        values = np.asarray(spec, dtype=np.float64)
+    else:
+        values = np.array([float(spec)])
+    if values.size == 0:
+        raise ValueError('empty axis')
+    return np.unique(np.round(values)).astype(np.int64) if integer else values
+
+def linear_terms(shipping, bpm):
+    """(slope, intercept) of each scenario total as a function of vehicle price.
+
+    Every total is linear in the price, so two evaluations of scenario_totals()
+    give the exact coefficients without restating the fee and tax rules here.
+    """
+    _, _, fz0, std0, nb0 = scenario_totals(0.0, shipping, bpm)
+    _, _, fz1, std1, nb1 = scenario_totals(1000.0, shipping, bpm)
+    intercepts = np.broadcast_arrays(fz0, std0, nb0)
+    slopes = [(one - zero) / 1000.0 for zero, one in zip(intercepts, np.broadcast_arrays(fz1, std1, nb1))]
+    return np.stack(slopes), np.stack(intercepts)
+
+def break_even_prices(slopes, intercepts):
+    """Vehicle prices where the cheapest scenario changes, per scenario pair (NaN where that pair never flips)"""
+    flips = {}
+    for i in range(len(SCENARIOS)):
+        for j in range(i + 1, len(SCENARIOS)):
+            k = 3 - i - j
+            with np.errstate(divide='ignore', invalid='ignore'):
+                price = (intercepts[j] - intercepts[i]) / (slopes[i] - slopes[j])
+            at = slopes[i] * price + intercepts[i]
+            # Only a flip if both lines are the cheapest option where they cross
+            valid = np.isfinite(price) & (price >= 0) & (at <= slopes[k] * price + intercepts[k] + 0.005)
+            flips[f'{SCENARIOS[i]}|{SCENARIOS[j]}'] = np.where(valid, np.round(price, 2), np.nan)
+    return flips
+
+def encode(array, encoding, dtype='<f8'):
+    """Nested lists (NaN as null), or base64 of the little-endian C-order buffer"""
+    if encoding == 'base64':
+        return base64.b64encode(np.ascontiguousarray(array, dtype=dtype).tobytes()).decode()
+    if array.dtype.kind == 'f' and np.isnan(array).any():
+        return np.where(np.isnan(array), None, array).tolist()
+    return array.tolist()
+
+def sweep(spec, tariffs, max_cells=2_000_000):
+    """Scenario totals over the (shipping_method, vehicle_price, year, co2) grid.
+
+    Arrays keep only the axes they depend on: free_zone and no_bpm are
+    [method][price], bpm is [year][co2], standard and recommendation are the
+    full grid, and break_even is [method][year][co2]. With the default base64
+    encoding each array is its C-order float64 (recommendation: int8) buffer,
+    which is far cheaper to produce and parse than JSON numbers.
+    """
+    methods = spec.get('shipping_method') or list(SHIPPING_METHODS)
+    if isinstance(methods, str):
+        methods = [methods]
+    unknown = [m for m in methods if m not in SHIPPING_METHODS]
+    if unknown:
+        raise ValueError(f'Unknown shipping_method {unknown}; expected {list(SHIPPING_METHODS)}')
+    prices = axis_values(spec.get('vehicle_price'), {'min': 5000, 'max': 100000, 'steps': 100},
+                         max_length=max_cells)
+    years = axis_values(spec.get('year'), {'min': 2015, 'max': 2024}, integer=True, max_length=max_cells)
+    co2 = axis_values(spec.get('co2'), {'min': 100, 'max': 345, 'steps': 50}, integer=True,
+                      max_length=max_cells)
+    shape = (len(methods), len(prices), len(years), len(co2))
+    if math.prod(shape) > max_cells:
+        raise ValueError(f'Grid of {math.prod(shape)} cells exceeds the limit of {max_cells}')
+    encoding = spec.get('encoding', 'base64')
+    if encoding not in ('json', 'base64'):
+        raise ValueError("encoding must be 'json' or 'base64'")
+
+    dims = spec.get('dimensions') or {}
+    codes = np.array([SHIPPING_METHODS.index(m) for m in methods])
+    shipping = shipping_total_array(codes, np.full(len(codes), float(dims.get('length', 0))),
+                                    np.full(len(codes), float(dims.get('height', 0))))
+    diesel = str(spec.get('fuel_type', 'benzina')).lower() == 'diesel'
+    bpm = tariffs.bpm_array(co2[None, :], years[:, None], np.full((len(years), len(co2)), diesel))
+
+    # Broadcast to (method, price, year, co2); only STANDARD depends on year and CO2
+    _, _, free_zone, standard, no_bpm = scenario_totals(prices[None, :, None, None], shipping[:, None, None, None],
+                                                        bpm[None, None, :, :])
+    # Same tie-break as costs(): first of FREE ZONE, STANDARD, NO BPM. Comparing the broadcast
+    # operands directly avoids materialising the (3, ...) stack that argmin would need
+    recommendation = np.where(free_zone <= np.minimum(standard, no_bpm), np.int8(0),
+                              np.where(standard <= no_bpm, np.int8(1), np.int8(2)))
+
+    slopes, intercepts = linear_terms(shipping[:, None, None], bpm[None, :, :])
+    flips = break_even_prices(slopes, intercepts)
+
+    return {
+        'axes': {'shipping_method': list(methods), 'vehicle_price': prices.tolist(),
+                 'year': years.tolist(), 'co2': co2.tolist()},
+        'shape': list(shape),
+        'fuel_type': spec.get('fuel_type', 'benzina'),
+        'encoding': encoding,
+        'dtypes': {'totals': 'float64', 'recommendation': 'int8'},
+        'scenarios': list(SCENARIOS),
+        'shipping': shipping.tolist(),
+        'bpm': encode(bpm, encoding),
+        'free_zone': encode(free_zone[:, :, 0, 0], encoding),
+        'no_bpm': encode(no_bpm[:, :, 0, 0], encoding),
+        'standard': encode(standard, encoding),
+        'recommendation': encode(recommendation, encoding, dtype='i1'),
+        'break_even': {pair: encode(prices_, encoding) for pair, prices_ in flips.items()},
+    }
@@ -0,0 +1,94 @@
+import bisect
+import hashlib
+import json
+import os
+from datetime import date
+
+import numpy as np
+
+DEFAULT_TARIFF_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'bpm_tariffs.json')
+CO2_TABLE_MAX = 600
+
+class BpmSchedule:
+    """One effective-dated BPM schedule with its dense (fuel, age, co2) table"""
+
+    def __init__(self, spec, co2_max=CO2_TABLE_MAX):
+        self.effective_from = date.fromisoformat(spec['effective_from'])
+        self.base = float(spec['base'])
+        self.bands = [(float(b['from']), float('inf') if b.get('to') is None else float(b['to']), float(b['rate']))
+                      for b in spec['co2_bands']]
+        surcharge = spec.get('diesel_surcharge') or {'from': 0, 'rate': 0}
+        self.diesel_from = float(surcharge['from'])
+        self.diesel_rate = float(surcharge['rate'])
+        self.depreciation = float(spec['depreciation_per_year'])
+        self.max_age = int(spec['max_age'])
+        self.co2_max = co2_max
+
+        co2 = np.arange(co2_max + 1, dtype=np.float64)
+        age = np.arange(self.max_age, dtype=np.float64)
+        gross = np.stack([self.gross(co2, False), self.gross(co2, True)])
+        factor = 1 - np.minimum(age * self.depreciation, 1.0)
+        # table[fuel, age, co2]; ages >= max_age are always 0 and are not stored
+        self.table = np.round(gross[:, None, :] * factor[None, :, None], 2)
+        self.table.setflags(write=False)
+        # Plain nested lists for scalar lookups; indexing a numpy array one element at a time is slower
+        self.rows = self.table.tolist()
+
+    def gross(self, co2, diesel):
+        co2 = np.asarray(co2, dtype=np.float64)
+        total = np.full(co2.shape, self.base)
+        for lower, upper, rate in self.bands:
+            total = total + (np.clip(co2, lower, upper) - lower) * rate
+        return total + np.where(diesel, np.maximum(co2 - self.diesel_from, 0) * self.diesel_rate, 0)
+
+    def bpm(self, co2, age, diesel):
+        if age >= self.max_age:
+            return 0
+        age = max(age, 0)
+        co2 = max(int(co2), 0)
+        if co2 <= self.co2_max:
+            return self.rows[int(diesel)][age][co2]
+        net = self.gross(co2, bool(diesel)) * (1 - min(age * self.depreciation, 1.0))
+        return round(float(net), 2)
+
+    def bpm_array(self, co2, age, diesel):
+        co2 = np.maximum(np.asarray(co2, dtype=np.int64), 0)
+        age = np.asarray(age, dtype=np.int64)
+        fuel = np.asarray(diesel, dtype=np.int64)
+        in_table = co2 <= self.co2_max
+        clipped_age = np.clip(age, 0, self.max_age - 1)
+        result = self.table[fuel, clipped_age, np.minimum(co2, self.co2_max)]
+        if not in_table.all():
+            net = self.gross(co2, fuel.astype(bool)) * (1 - np.minimum(clipped_age * self.depreciation, 1.0))
+            result = np.where(in_table, result, np.round(net, 2))
+        return np.where(age >= self.max_age, 0.0, result)
+
+class BpmTariffEngine:
+    """Picks the schedule in force on a date and answers BPM from its table"""
+
+    def __init__(self, schedules, version=None):
+        self.schedules = sorted(schedules, key=lambda s: s.effective_from)
+        self._starts = [s.effective_from for s in self.schedules]
+        self.version = version
+
+    def schedule_for(self, on=None):
+        on = on or date.today()
+        i = bisect.bisect_right(self._starts, on) - 1
+        if i < 0:
+            raise ValueError(f"No BPM schedule in force on {on.isoformat()}")
+        return self.schedules[i]
+
+    def bpm(self, co2, year, fuel_type, on=None):
+        on = on or date.today()
+        return self.schedule_for(on).bpm(co2, on.year - int(year), str(fuel_type).lower() == 'diesel')
+
+    def bpm_array(self, co2, year, is_diesel, on=None):
+        on = on or date.today()
+        return self.schedule_for(on).bpm_array(co2, on.year - np.asarray(year, dtype=np.int64), is_diesel)
+
+def load_tariffs(path=DEFAULT_TARIFF_FILE, co2_max=CO2_TABLE_MAX):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    spec = json.loads(raw)
+    return BpmTariffEngine([BpmSchedule(s, co2_max) for s in spec['schedules']],
+                           version=hashlib.sha256(raw).hexdigest()[:12])
@@ -0,0 +1,245 @@
+"""Stage timings, Prometheus histograms and structured logs.
+
+stage('name') times a block. The duration goes into a per-process histogram
+and into the current request's Server-Timing entries. Each worker
+periodically writes its histograms to METRICS_DIR/metrics-<pid>.json, and
+/metrics sums every worker's file, in the same way prometheus_client's
+multiprocess mode works. Wipe the directory on deploy. With metrics disabled,
+stage() is a shared no-op context manager and nothing is recorded, written
+or sent.
+"""
+import bisect
+import contextvars
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+PREFIX = 'vehicle_import'
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+HELP = {
+    'stage_duration_seconds': 'Time spent in one stage of request handling',
+    'request_duration_seconds': 'Time from request start until the response (headers) is returned',
+    'claude_tokens': 'Tokens per Claude call',
+}
+_NOOP = nullcontext()
+_request = contextvars.ContextVar('telemetry_request', default=None)
+
+class RequestTimings:
+    """Stage durations and counters for one request, summed per stage (parallel calls add up)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            total, count = self.stages.get(name, (0.0, 0))
+            self.stages[name] = (total + seconds, count + 1)
+
+    def count(self, name, counts):
+        with self._lock:
+            counters = self.counters.setdefault(name, {})
+            for key, n in counts.items():
+                counters[key] = counters.get(key, 0) + n
+
+    def server_timing(self):
+        with self._lock:
+            parts = []
+            for name, (seconds, count) in self.stages.items():
+                desc = ' '.join(f'{k}={v}' for k, v in self.counters.get(name, {}).items())
+                if count > 1:
+                    desc = f'calls={count} {desc}'.strip()
+                parts.append(f'{name};dur={seconds * 1000:.1f}' + (f';desc="{desc}"' if desc else ''))
+        parts.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.1f}')
+        return ', '.join(parts)
+
+class Histograms:
+    """Cumulative histograms keyed by (name, labels), flushed to a per-pid file for cross-worker /metrics"""
+
+    def __init__(self, directory, flush_interval=5):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._series = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flusher = None
+        self._flusher_pid = None
+
+    def observe(self, name, value, buckets=STAGE_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'buckets': list(buckets), 'counts': [0] * (len(buckets) + 1), 'sum': 0.0}
+            series['counts'][index] += 1
+            series['sum'] += value
+            self._dirty = True
+        if self._flusher_pid != os.getpid():
+            self._start_flusher()
+
+    def _start_flusher(self):
+        with self._lock:
+            # Started lazily and per pid: threads don't survive a gunicorn fork, and fork-inherited
+            # series belong to the parent's file
+            if self._flusher_pid == os.getpid():
+                return
+            if self._flusher_pid is not None:
+                self._series = {}
+            self._flusher_pid = os.getpid()
+            self._flusher = threading.Thread(target=self._run_flusher, name='metrics-flush', daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                logging.getLogger(__name__).warning('Metrics flush failed', extra={'error': str(e)})
+
+    def _path(self, pid=None):
+        return os.path.join(self.directory, f'metrics-{pid or os.getpid()}.json')
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = [{'name': name, 'labels': dict(labels), **series} for (name, labels), series in self._series.items()]
+            self._dirty = False
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path())
+
+    def collect(self):
+        """Series summed over every worker's file (this process is flushed first)"""
+        self.flush()
+        merged = {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for series in data:
+                key = (series['name'], tuple(sorted(series['labels'].items())))
+                total = merged.get(key)
+                if total is None or total['buckets'] != series['buckets']:
+                    merged[key] = {'buckets': series['buckets'], 'counts': list(series['counts']), 'sum': series['sum']}
+                else:
+                    total['counts'] = [a + b for a, b in zip(total['counts'], series['counts'])]
+                    total['sum'] += series['sum']
+        return merged
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines, seen = [], set()
+        for (name, labels), series in sorted(self.collect().items()):
+            metric = f'{PREFIX}_{name}'
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# HELP {metric} {HELP.get(name, name)}')
+                lines.append(f'# TYPE {metric} histogram')
+            label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+            prefix = label_text + ',' if label_text else ''
+            cumulative = 0
+            for bound, count in zip(series['buckets'] + ['+Inf'], series['counts']):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{{label_text}}} {series["sum"]}')
+            lines.append(f'{metric}_count{{{label_text}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+enabled = os.environ.get('METRICS_ENABLED', '1') != '0'
+histograms = Histograms(
+    os.environ.get('METRICS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'metrics')),
+    flush_interval=float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+)
+
+@contextmanager
+def _timed(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        histograms.observe('stage_duration_seconds', seconds, stage=name)
+        timings = _request.get()
+        if timings is not None:
+            timings.add(name, seconds)
+
+def stage(name):
+    """Context manager timing one stage of the current request"""
+    return _timed(name) if enabled else _NOOP
+
+def count(name, **counts):
+    """Add counters (e.g. token usage) to a stage's Server-Timing description for the current request"""
+    timings = _request.get()
+    if timings is not None:
+        timings.count(name, counts)
+
+def observe(name, value, buckets=STAGE_BUCKETS, **labels):
+    if enabled:
+        histograms.observe(name, value, buckets, **labels)
+
+def start_request():
+    """Begin collecting timings for the request handled by this thread; returns the context token"""
+    return _request.set(RequestTimings()) if enabled else None
+
+def finish_request(token, endpoint, method, status):
+    """Server-Timing header value for the request (None when disabled), recording its duration"""
+    if token is None:
+        return None
+    timings = _request.get()
+    _request.reset(token)
+    observe('request_duration_seconds', time.perf_counter() - timings.started,
+            endpoint=endpoint or 'unknown', method=method, status=str(status))
+    return timings.server_timing()
+
+def bind(fn):
+    """fn wrapped to record into the calling request's timings when run on a pool thread"""
+    timings = _request.get()
+    if timings is None:
+        return fn
+
+    def run(*args, **kwargs):
+        token = _request.set(timings)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _request.reset(token)
+    return run
+
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg plus any extra={} fields"""
+
+    def format(self, record):
+        entry = {'ts': round(record.created, 3), 'level': record.levelname, 'logger': record.name,
+                 'msg': record.getMessage(), 'pid': record.process}
+        entry.update((k, v) for k, v in vars(record).items() if k not in _RECORD_FIELDS)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+def configure_logging(level='INFO', fmt='json'):
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else
+                         logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    # The Anthropic SDK's HTTP client logs every request at INFO; the claude stage already covers those
+    for name in ('httpx', 'httpx2', 'httpcore'):
+        logging.getLogger(name).setLevel(logging.WARNING)
@@ -0,0 +1,21 @@
+import os
+
+import pytest
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """app imported with throwaway stores and no API key (market estimates come back as None)"""
+    workdir = tmp_path_factory.mktemp('app')
+    os.environ.pop('ANTHROPIC_API_KEY', None)
+    os.environ.update({'LOG_LEVEL': 'WARNING', 'METRICS_DIR': str(workdir / 'metrics'), 'WARM_CACHES': '0',
+                       'PRICE_INDEX_DIR': str(workdir / 'price_index')})
+    for name, filename in (('ANALYSIS_CACHE_DB', 'analyses.sqlite3'), ('MARKET_CACHE_DB', 'market.sqlite3'),
+                           ('EXCHANGE_RATES_SNAPSHOT', 'rates.json'), ('CLAUDE_BUDGET_DB', 'budget.sqlite3'),
+                           ('SINGLE_FLIGHT_DB', 'inflight.sqlite3'), ('QUOTE_STORE_DB', 'quotes.sqlite3')):
+        os.environ[name] = str(workdir / filename)
+    import app
+    return app
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
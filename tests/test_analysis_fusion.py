@@ -0,0 +1,41 @@
+import pytest
+
+from analysis_fusion import analysis_confidence, fuse_analyses
+
+@pytest.mark.parametrize('value, expected', [('85', 85), ('85%', 85), (0.85, 85), ('150', 100), ('0', 1), ('n/a', 50),
+                                             (None, 50)])
+def test_confidence_parsing(value, expected):
+    assert analysis_confidence({'confidence': value}) == expected
+
+def test_single_analysis_is_returned_as_a_copy():
+    analysis = {'marca': 'Audi', 'confidence': '80'}
+    fused = fuse_analyses([analysis])
+    assert fused == analysis and fused is not analysis
+
+def test_fields_are_voted_by_confidence():
+    analyses = [
+        {'marca': 'BMW', 'model': '320d', 'emisii_co2': '130', 'confidence': '30', 'culoare': 'negru'},
+        {'marca': 'bmw ', 'model': 'Unknown', 'emisii_co2': '150 g/km', 'confidence': '30'},
+        {'marca': 'Audi', 'model': 'A4', 'emisii_co2': '150', 'confidence': '90', 'culoare': 'alb'},
+    ]
+    fused = fuse_analyses(analyses)
+    # Audi's 90 beats the two BMW answers' combined 60 (compared case-insensitively)
+    assert fused['marca'] == 'Audi'
+    assert fused['field_confidence']['marca'] == 60
+    # 'Unknown' doesn't vote
+    assert fused['model'] == 'A4'
+    assert fused['field_confidence']['model'] == 75
+    # Numeric fields: the weighted mean, agreement from the spread
+    mean = (130 * 30 + 150 * 30 + 150 * 90) / 150
+    assert fused['emisii_co2'] == str(round(mean))
+    assert fused['field_confidence']['emisii_co2'] == round(100 * (1 - 20 / mean))
+    # Other keys come from the most confident answer
+    assert fused['culoare'] == 'alb'
+    assert fused['confidence'] == str(round((30 * 30 + 30 * 30 + 90 * 90) / 150))
+    assert fused['images_analyzed'] == 3
+
+def test_case_variants_pool_their_weight():
+    fused = fuse_analyses([{'marca': 'VW', 'confidence': '40'}, {'marca': 'vw', 'confidence': '45'},
+                           {'marca': 'Skoda', 'confidence': '60'}])
+    assert fused['marca'] == 'vw'
+    assert fused['field_confidence']['marca'] == round(100 * 85 / 145)
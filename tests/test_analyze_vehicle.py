@@ -0,0 +1,25 @@
+import io
+
+from PIL import Image
+
+def photo(color):
+    out = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(out, 'JPEG')
+    return out.getvalue()
+
+def test_unparseable_reply_is_an_error_not_a_default_vehicle(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'get_client', lambda: object())
+    monkeypatch.setattr(app_module, 'analyze_images', lambda prepared: None)
+    for _ in range(2):
+        response = client.post('/api/analyze-vehicle', data=photo((10, 20, 30)), content_type='image/jpeg')
+        assert response.status_code == 502
+        assert response.json == {'error': 'Could not parse the vehicle analysis'}
+
+def test_parsed_reply_is_returned_and_cached(app_module, client, monkeypatch):
+    analysis = {'marca': 'Skoda', 'model': 'Octavia', 'an_fabricatie': '2019', 'confidence': '90'}
+    monkeypatch.setattr(app_module, 'get_client', lambda: object())
+    monkeypatch.setattr(app_module, 'analyze_images', lambda prepared: dict(analysis))
+    first = client.post('/api/analyze-vehicle', data=photo((200, 20, 30)), content_type='image/jpeg')
+    second = client.post('/api/analyze-vehicle', data=photo((200, 20, 30)), content_type='image/jpeg')
+    assert first.status_code == 200 and first.json['marca'] == 'Skoda'
+    assert (first.headers['X-Analysis-Cache'], second.headers['X-Analysis-Cache']) == ('miss', 'hit')
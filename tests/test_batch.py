@@ -0,0 +1,53 @@
+import itertools
+import json
+import random
+
+import numpy as np
+
+from batch import SHIPPING_METHODS, round_cents, shipping_total_array
+from shipping_rates import calculate_shipping_cost
+
+def test_shipping_totals_match_the_rate_card():
+    lengths = (0, 4.5, 5, 5.01, 6.2)
+    heights = (0, 1.5, 2, 2.01, 2.6)
+    for method in SHIPPING_METHODS:
+        grid = list(itertools.product(lengths, heights))
+        totals = shipping_total_array(np.full(len(grid), SHIPPING_METHODS.index(method)),
+                                      [length for length, _ in grid], [height for _, height in grid])
+        expected = [calculate_shipping_cost(method, {'length': length, 'height': height})['total'] for length, height in grid]
+        assert totals.tolist() == expected
+
+def test_round_cents_rounds_like_python():
+    values = [2.675, 1.005, 0.125, 0.375, 1e-3, -0.125] + [random.Random(0).randrange(10**7) / 200 for _ in range(5000)]
+    assert round_cents(values).tolist() == [round(value, 2) for value in values]
+    assert float(round_cents(2.675)) == round(2.675, 2)
+
+def test_batch_rows_match_costs(client):
+    rng = random.Random(4)
+    vehicles = [{'vehicle_price': round(rng.uniform(500, 150000), rng.choice((0, 1, 2))), 'co2': rng.randrange(0, 320),
+                 'year': rng.randrange(2005, 2027), 'fuel_type': rng.choice(('benzina', 'diesel')),
+                 'shipping_method': rng.choice(SHIPPING_METHODS),
+                 'dimensions': {'length': rng.choice((4.2, 5.3)), 'height': rng.choice((1.5, 2.3))},
+                 'marca': 'Batch', 'model': f'M{i}'} for i in range(400)]
+    response = client.post('/api/calculate-costs/batch', json=vehicles)
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['index'] for row in rows] == list(range(len(vehicles)))
+    for row, vehicle in zip(rows, vehicles):
+        single = client.post('/api/calculate-costs', json=vehicle).json
+        for field in ('free_zone', 'standard', 'no_bpm', 'shipping_details', 'recommendation', 'recommendation_text',
+                      'savings_details'):
+            assert row[field] == single[field], (vehicle, field)
+
+def test_malformed_rows_become_error_lines(client):
+    vehicles = [{'vehicle_price': 10000}, {'dimensions': '5x2'}, {'dimensions': [5, 2]}, {'year': 10 ** 30},
+                {'co2': -10 ** 20}, {'co2': float('inf')}, {'shipping_allocation': 'x'}, 'not an object',
+                {'vehicle_price': 12000, 'dimensions': {'length': 5.2}}]
+    response = client.post('/api/calculate-costs/batch', data='\n'.join(json.dumps(v) for v in vehicles),
+                           content_type='application/x-ndjson')
+    assert response.status_code == 200
+    rows = {row['index']: row for row in map(json.loads, response.get_data(as_text=True).splitlines())}
+    assert sorted(rows) == list(range(len(vehicles)))
+    assert [i for i, row in rows.items() if 'error' in row] == [1, 2, 3, 4, 5, 6, 7]
+    assert 'dimensions must be an object' in rows[1]['error']
+    assert 'out of range' in rows[3]['error']
+    assert rows[8]['shipping_details'] == calculate_shipping_cost('roro', {'length': 5.2})
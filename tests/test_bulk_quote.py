@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run(*args):
+    return subprocess.run([sys.executable, os.path.join(ROOT, 'bulk_quote.py'), *args], capture_output=True, text=True,
+                          timeout=120)
+
+def test_malformed_rows_are_recorded_and_the_checkpoint_moves_on(tmp_path):
+    vehicles = [{'vehicle_price': 10000 + i} for i in range(7)]
+    vehicles[2] = {'vehicle_price': 5000, 'dimensions': '5x2'}
+    vehicles[5] = {'year': 10 ** 30}
+    source, output = tmp_path / 'stock.ndjson', tmp_path / 'quotes.ndjson'
+    source.write_text('\n'.join(json.dumps(v) for v in vehicles) + '\n')
+
+    result = run(str(source), '-o', str(output), '--workers', '1', '--chunk-size', '2')
+    assert result.returncode == 0, result.stderr
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert sorted(row['index'] for row in rows) == list(range(len(vehicles)))
+    assert sorted(row['index'] for row in rows if 'error' in row) == [2, 5]
+    checkpoint = json.loads((tmp_path / 'quotes.ndjson.checkpoint.json').read_text())
+    assert (checkpoint['rows'], checkpoint['errors'], checkpoint['done']) == (7, 2, True)
+    assert checkpoint['output_bytes'] == output.stat().st_size
+
+def test_unexpected_row_failure_is_isolated(monkeypatch):
+    import batch
+    import bulk_quote
+    from tariffs import load_tariffs
+
+    quote_chunk = batch.quote_chunk
+
+    def fragile(vehicles, *args, **kwargs):
+        if any(d.get('marca') == 'boom' for _, d in vehicles):
+            raise RuntimeError('boom')
+        return quote_chunk(vehicles, *args, **kwargs)
+    monkeypatch.setattr(batch, 'quote_chunk', fragile)
+    monkeypatch.setattr(bulk_quote, '_tariffs', load_tariffs())
+    body, rows, errors = bulk_quote._quote([(0, {'vehicle_price': 1}), (1, {'marca': 'boom'}), (2, {})], None)
+    lines = [json.loads(line) for line in body.decode().splitlines()]
+    assert (rows, errors) == (3, 1)
+    assert [line['index'] for line in lines] == [0, 1, 2] and lines[1]['error'] == 'Invalid vehicle: boom'
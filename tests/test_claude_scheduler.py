@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+from claude_scheduler import INTERACTIVE, ClaudeBusy, ClaudeScheduler, TokenBudget
+
+class SlowBudget:
+    """A budget whose first reserve() blocks, as if another worker held the SQLite lock"""
+    tokens_per_minute = 1000
+
+    def __init__(self):
+        self.entered, self.release = threading.Event(), threading.Event()
+        self.calls = 0
+
+    def reserve(self, tokens):
+        self.calls += 1
+        if self.calls == 1:
+            self.entered.set()
+            self.release.wait(5)
+        return self.calls, 0
+
+    def settle(self, reservation, tokens):
+        pass
+
+    def used(self):
+        return 0
+
+def test_reserve_runs_outside_the_scheduler_lock():
+    budget = SlowBudget()
+    scheduler = ClaudeScheduler(lambda: None, budget, max_concurrent=1, queue_timeout=5)
+    first = threading.Thread(target=scheduler._acquire, args=(INTERACTIVE, 10))
+    first.start()
+    assert budget.entered.wait(5)
+
+    # While that reservation is stuck, the rest of the process keeps going
+    started = time.monotonic()
+    assert scheduler.snapshot()['active'] == 1
+    assert not scheduler.saturated()
+    assert time.monotonic() - started < 1
+    # ...and the held slot still counts against max_concurrent
+    second = []
+    waiter = threading.Thread(target=lambda: second.append(scheduler._acquire(INTERACTIVE, 10)))
+    waiter.start()
+    time.sleep(0.2)
+    assert second == [] and budget.calls == 1
+
+    budget.release.set()
+    first.join(5)
+    scheduler._release(1, time.monotonic(), None)
+    waiter.join(5)
+    assert second == [2]
+    assert scheduler.snapshot()['active'] == 1
+
+def test_budget_exhaustion_frees_the_slot(tmp_path):
+    budget = TokenBudget(str(tmp_path / 'budget.sqlite3'), tokens_per_minute=100)
+    scheduler = ClaudeScheduler(lambda: None, budget, max_concurrent=2, queue_timeout=1)
+    reservation = scheduler._acquire(INTERACTIVE, 100)
+    with pytest.raises(ClaudeBusy):
+        scheduler._acquire(INTERACTIVE, 50)
+    stats = scheduler.snapshot()
+    assert (stats['active'], stats['waiting'], stats['budget_waits']) == (1, 0, 1)
+    assert reservation is not None
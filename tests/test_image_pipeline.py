@@ -0,0 +1,41 @@
+import io
+
+import pytest
+from PIL import Image
+
+from image_pipeline import ImageTooLarge, preprocess_image
+
+def png(size):
+    out = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(out, 'PNG')
+    return out.getvalue()
+
+def test_downscales_and_reencodes():
+    data, media_type, info = preprocess_image(png((3000, 2000)), max_edge=600)
+    assert media_type == 'image/jpeg'
+    assert Image.open(io.BytesIO(data)).size == (600, 400)
+    assert info['input_size'] == (3000, 2000)
+
+def test_undecodable_bytes_pass_through():
+    data, media_type, info = preprocess_image(b'not an image')
+    assert (data, media_type, info['passthrough']) == (b'not an image', 'image/jpeg', True)
+
+def test_decompression_bomb_is_rejected(monkeypatch):
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+    with pytest.raises(ImageTooLarge):
+        preprocess_image(png((100, 100)))
+
+@pytest.mark.parametrize('path', ['/api/analyze-vehicle', '/api/analyze-vehicle/stream'])
+def test_decompression_bomb_upload_is_a_400(app_module, client, monkeypatch, path):
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+    monkeypatch.setattr(app_module, 'get_client', lambda: object())
+    response = client.post(path, data=png((100, 100)), content_type='image/png')
+    assert response.status_code == 400
+    assert 'Invalid image' in response.json['error']
+
+def test_upload_over_the_request_cap_is_a_413(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'UPLOAD_MAX_BYTES', 1000)
+    response = client.post('/api/analyze-vehicle', data={'images': (io.BytesIO(png((300, 300))), 'car.png')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert 'Upload too large' in response.json['error']
@@ -0,0 +1,17 @@
+from market_cache import MarketEstimateCache, normalize_vehicle_key
+
+def test_expired_rows_are_deleted_on_write(tmp_path):
+    db = str(tmp_path / 'market.sqlite3')
+    cache = MarketEstimateCache(db, purge_interval=0)
+    with cache._connect() as conn:
+        conn.execute("INSERT INTO market_estimates (key, value, expires) VALUES ('old', '{}', 0)")
+    assert cache.get('old') is None
+    cache.set('new', {'avg_price': 2})
+    rows = cache._connect().execute('SELECT key FROM market_estimates').fetchall()
+    assert rows == [('new',)]
+    assert cache.snapshot()['purged'] == 1
+    assert MarketEstimateCache(db).get('new') == {'avg_price': 2}
+
+def test_vehicle_key_normalization():
+    assert normalize_vehicle_key({'marca': ' Mercedes-Benz ', 'model': 'C_Class', 'year': '2019', 'engine': '1998cc',
+                                  'fuel_type': 'Petrol', 'co2': '142.7'}) == 'mercedes benz|c class|2019|2.0|benzina|142'
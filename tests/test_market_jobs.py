@@ -0,0 +1,41 @@
+import os
+
+from market_jobs import MarketEstimateJobs
+
+ESTIMATE = {'min_price': 9000, 'max_price': 11000, 'avg_price': 10000}
+
+def test_jobs_are_visible_to_every_worker(tmp_path):
+    db = str(tmp_path / 'market.sqlite3')
+    jobs = MarketEstimateJobs(db)
+    jobs.create('queued')
+    pid = os.fork()
+    if pid == 0:
+        # Another gunicorn worker: its own process and store object
+        MarketEstimateJobs(db).finish('queued', ESTIMATE)
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert jobs.get('queued') == {'job_id': 'queued', 'status': 'done', 'result': ESTIMATE}
+    jobs.create('known', ESTIMATE)
+    jobs.create('unanswered')
+    jobs.finish('unanswered', None)
+    assert MarketEstimateJobs(db).get('known')['status'] == 'done'
+    assert MarketEstimateJobs(db).get('unanswered') == {'job_id': 'unanswered', 'status': 'failed', 'result': None}
+    assert jobs.get('missing') is None
+
+def test_expired_jobs_are_purged(tmp_path):
+    jobs = MarketEstimateJobs(str(tmp_path / 'market.sqlite3'), ttl=0, purge_interval=0)
+    jobs.create('old')
+    assert jobs.get('old') is None
+    jobs.create('new')
+    assert jobs.snapshot()['stored'] == 1
+
+def test_poll_is_answered_from_the_shared_table(app_module, client):
+    # As if another worker had queued and finished the job
+    other_worker = MarketEstimateJobs(app_module.market_estimate_jobs.db_path)
+    other_worker.create('elsewhere')
+    assert client.get('/api/market-estimate/elsewhere').json['status'] == 'pending'
+    other_worker.finish('elsewhere', ESTIMATE)
+    assert client.get('/api/market-estimate/elsewhere').json['result'] == ESTIMATE
+    stream = client.get('/api/market-estimate/elsewhere/stream').get_data(as_text=True)
+    assert '"status": "done"' in stream
+    assert client.get('/api/market-estimate/nope').status_code == 404
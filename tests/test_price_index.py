@@ -0,0 +1,42 @@
+import csv
+import random
+
+import pytest
+
+from price_index import build_index, load_price_index
+
+@pytest.fixture(scope='module')
+def index(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('price_index')
+    rng = random.Random(7)
+    with open(workdir / 'sales.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['marca', 'model', 'year', 'fuel_type', 'co2', 'price'])
+        writer.writeheader()
+        for _ in range(300):
+            year = rng.randrange(2012, 2024)
+            writer.writerow({'marca': 'Volkswagen', 'model': 'Golf', 'year': year, 'fuel_type': 'benzina',
+                             'co2': rng.randrange(110, 160), 'price': 8000 + 900 * (year - 2012) + rng.randrange(1500)})
+    build_index(str(workdir / 'sales.csv'), str(workdir / 'index'))
+    return load_price_index(str(workdir / 'index'))
+
+def test_estimate_from_comparables(index):
+    estimate = index.estimate({'marca': 'volkswagen', 'model': 'GOLF', 'year': 2018, 'co2': 130})
+    assert estimate['source'] == 'price_index'
+    assert estimate['min_price'] <= estimate['avg_price'] <= estimate['max_price']
+    assert index.estimate({'marca': 'Volkswagen', 'model': 'Polo', 'year': 2018}) is None
+
+@pytest.mark.parametrize('vehicle', [{'year': 70000}, {'year': -70000}, {'co2': 40000}, {'co2': -10 ** 12},
+                                     {'co2': 10 ** 30}])
+def test_out_of_range_year_and_co2_find_no_comparables(index, vehicle):
+    prices, _ = index.comparables(dict({'marca': 'Volkswagen', 'model': 'Golf', 'year': 2018, 'co2': 130}, **vehicle))
+    assert len(prices) == 0
+
+def test_unparseable_year_falls_back_to_the_default(index):
+    assert index.estimate({'marca': 'Volkswagen', 'model': 'Golf', 'year': '1e400'}) == \
+        index.estimate({'marca': 'Volkswagen', 'model': 'Golf', 'year': 2020})
+
+def test_costs_survives_a_typo_with_an_index_loaded(app_module, client, index, monkeypatch):
+    monkeypatch.setattr(app_module, 'price_index', index)
+    response = client.post('/api/calculate-costs', json={'vehicle_price': 15000, 'marca': 'Volkswagen', 'model': 'Golf',
+                                                         'year': 2018, 'co2': 40000})
+    assert response.status_code == 200
@@ -0,0 +1,50 @@
+import time
+
+def test_requote_is_served_from_the_store(client):
+    body = {'vehicle_price': 18500, 'co2': 140, 'year': 2018, 'marca': 'Toyota', 'model': 'Corolla'}
+    first = client.post('/api/calculate-costs', json=body)
+    second = client.post('/api/calculate-costs', json=body)
+    assert (first.headers['X-Quote-Store'], second.headers['X-Quote-Store']) == ('miss', 'hit')
+    assert first.json == second.json
+    assert client.get(f"/api/quotes/{first.json['quote_id']}").json['standard'] == first.json['standard']
+
+def test_make_with_separator_character(client):
+    response = client.post('/api/calculate-costs', json={'vehicle_price': 20000, 'marca': 'Land|Rover', 'model': 'Defender'})
+    assert response.status_code == 200
+    quotes = client.get('/api/quotes?marca=Land|Rover&model=Defender').json['quotes']
+    assert quotes[0]['vehicle'] == {'marca': 'land|rover', 'model': 'defender', 'year': 2020}
+
+def test_history_pages_with_cursor(client):
+    ids = {client.post('/api/calculate-costs', json={'vehicle_price': 1000 + i, 'marca': 'Pager', 'model': 'X'}).json['quote_id']
+           for i in range(5)}
+    seen, cursor = [], None
+    while True:
+        page = client.get('/api/quotes?marca=pager&limit=2' + (f'&cursor={cursor}' if cursor else '')).json
+        seen += [q['quote_id'] for q in page['quotes']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert sorted(seen) == sorted(ids)
+    assert client.get('/api/quotes?cursor=bogus').status_code == 400
+
+def test_queued_estimate_is_attached_to_the_stored_quote(app_module, client, monkeypatch):
+    estimate = {'min_price': 20000, 'max_price': 24000, 'avg_price': 22000}
+    monkeypatch.setattr(app_module, 'get_client', lambda: object())
+    # Answers at once, so the job can't lose a race with the quote being stored
+    monkeypatch.setattr(app_module, 'estimate_market_price_ai', lambda vehicle_data, check_cache=True: estimate)
+    attached = app_module.quote_store.stats['estimates_attached']
+    quote = client.post('/api/calculate-costs', json={'vehicle_price': 21000, 'marca': 'Racer', 'model': 'Fast'}).json
+    assert quote['market_estimate']['status'] == 'pending'
+    app_module.market_estimate_pool.submit(lambda: None).result()
+    for _ in range(50):
+        if app_module.quote_store.stats['estimates_attached'] > attached:
+            break
+        time.sleep(0.02)
+    assert app_module.quote_store.get(quote['quote_id'], count=False)['market_estimate'] == \
+        {'status': 'done', 'result': estimate}
+    assert app_module.quote_store.stats['estimates_attached'] == attached + 1
+
+def test_estimate_for_a_missing_quote_is_not_counted(app_module):
+    attached = app_module.quote_store.stats['estimates_attached']
+    app_module.quote_store.set_market_estimate('no-such-quote', {'avg_price': 1})
+    assert app_module.quote_store.stats['estimates_attached'] == attached
@@ -0,0 +1,53 @@
+import os
+import time
+
+import requests
+
+from rates import ExchangeRateService
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+class FakeSession:
+    def __init__(self, data=None):
+        self.data = data
+
+    def get(self, url, timeout):
+        if self.data is None:
+            raise requests.ConnectionError('upstream down')
+        return FakeResponse(self.data)
+
+def service(path, session):
+    svc = ExchangeRateService('http://rates.invalid', str(path), retry_interval=0)
+    svc._http, svc._http_pid = session, os.getpid()
+    return svc
+
+def test_adopting_another_workers_fetch_clears_the_error(tmp_path):
+    snapshot = tmp_path / 'rates.json'
+    failing = service(snapshot, FakeSession())
+    failing.refresh()
+    assert failing.get()['stale'] is True and failing.get()['error'] == 'upstream down'
+
+    fresh = {'rates': {'EUR': 1, 'AED': 4.0, 'USD': 1.1}, 'time_last_updated': time.time()}
+    service(snapshot, FakeSession(fresh)).refresh()
+    failing.refresh()
+    rates = failing.get()
+    assert rates['stale'] is False and rates['EUR_TO_AED'] == 4.0
+
+def test_rereading_an_old_snapshot_keeps_the_error(tmp_path):
+    snapshot = tmp_path / 'rates.json'
+    old = {'rates': {'EUR': 1, 'AED': 4.0, 'USD': 1.1}, 'time_last_updated': time.time() - 2 * 86400}
+    service(snapshot, FakeSession(old)).refresh()
+    failing = service(snapshot, FakeSession())
+    failing.load_snapshot()
+    failing.refresh(force=True)
+    failing.load_snapshot()
+    assert failing.get()['stale'] is True
+    assert failing._last_error == 'upstream down'
@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+from shipping_planner import CONTAINER_SPECS, LENGTH_CLEARANCE, fits, plan_shipment, vehicle_dimensions
+from shipping_rates import calculate_shipping_cost
+
+def random_fleet(rng, n):
+    return [{'length': round(rng.uniform(3.4, 6.2), 2), 'width': round(rng.uniform(1.6, 2.3), 2),
+             'height': round(rng.uniform(1.3, 2.6), 2), 'weight': rng.randrange(900, 3500)} for _ in range(n)]
+
+@pytest.mark.parametrize('seed', range(20))
+def test_plan_invariants(seed):
+    rng = random.Random(seed)
+    vehicles = random_fleet(rng, rng.randrange(1, 30))
+    plan = plan_shipment(vehicles, calculate_shipping_cost)
+    dims = [vehicle_dimensions(v) for v in vehicles]
+
+    # Every vehicle is shipped exactly once
+    placed = plan['roro'] + [i for c in plan['containers'] for i in c['vehicles']]
+    assert sorted(placed) == list(range(len(vehicles)))
+
+    for container in plan['containers']:
+        spec = CONTAINER_SPECS[container['type']]
+        members = [dims[i] for i in container['vehicles']]
+        used = sum(d['length'] + LENGTH_CLEARANCE for d in members)
+        assert used <= spec['length'] + 1e-9
+        assert sum(d['weight'] for d in members) <= spec['payload']
+        assert all(fits(spec, d) for d in members)
+        assert container['used_length'] == round(used, 2)
+        # The shares add up to the container's price to the cent
+        shares = [plan['allocations'][i] for i in container['vehicles']]
+        assert round(sum(a['total'] for a in shares), 2) == container['total']
+        assert round(sum(a['base_shipping'] for a in shares), 2) == \
+            calculate_shipping_cost(container['type'], {})['base_shipping']
+
+    for i in plan['roro']:
+        assert plan['allocations'][i] == calculate_shipping_cost('roro', vehicles[i])
+    assert plan['total_cost'] == round(sum(a['total'] for a in plan['allocations']), 2)
+    # RoRo is always available per vehicle, so consolidating can't cost more than shipping alone
+    assert plan['savings'] >= 0
+
+def test_vehicles_too_big_for_any_container_go_roro():
+    plan = plan_shipment([{'length': 4.5, 'height': 2.5}, {'length': 12.5}, {'length': 4.5, 'width': 2.3}],
+                         calculate_shipping_cost)
+    assert plan['roro'] == [0, 1, 2] and plan['containers'] == []
+
+def test_a_full_container_beats_roro():
+    plan = plan_shipment([{'length': 3.8}] * 3, calculate_shipping_cost)
+    assert [c['type'] for c in plan['containers']] == ['container_40ft']
+    assert plan['total_cost'] == calculate_shipping_cost('container_40ft', {})['total']
@@ -0,0 +1,30 @@
+import os
+import threading
+
+from sqlite_store import LocalConnection
+
+def test_one_connection_per_thread(tmp_path):
+    connect = LocalConnection(str(tmp_path / 'store.sqlite3'))
+    assert connect() is connect()
+    other = []
+    thread = threading.Thread(target=lambda: other.append(connect()))
+    thread.start()
+    thread.join()
+    assert other[0] is not connect()
+
+def test_wal_and_autocommit(tmp_path):
+    connect = LocalConnection(str(tmp_path / 'store.sqlite3'), autocommit=True)
+    assert connect().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert connect().isolation_level is None
+    assert LocalConnection(str(tmp_path / 'other.sqlite3'))().isolation_level == ''
+
+def test_reopened_after_fork(tmp_path):
+    connect = LocalConnection(str(tmp_path / 'store.sqlite3'))
+    parent = id(connect())
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write, b'1' if id(connect()) != parent and connect().execute('SELECT 1').fetchone() == (1,) else b'0')
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(read, 1) == b'1'
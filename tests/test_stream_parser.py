@@ -0,0 +1,44 @@
+import json
+
+from stream_parser import IncrementalFieldParser, parse_json_object
+
+REPLY = ('Sure, here it is:\n```json\n{"marca": "Mercedes-Benz", "model": "C \\"220\\" {AMG}", "an": 2019, '
+         '"km": 84000.5, "diesel": true, "vin": null, "dotari": ["navi", "}"], '
+         '"meta": {"source": "photo", "nested": [1, {"a": "]"}]}, "note": "caf\\u00e9"}\n```\nAnything else?')
+EXPECTED = json.loads(REPLY[REPLY.index('{'):REPLY.rindex('}') + 1])
+
+def feed_in_chunks(size):
+    parser, pairs = IncrementalFieldParser(), []
+    for i in range(0, len(REPLY), size):
+        pairs += parser.feed(REPLY[i:i + size])
+    return parser, pairs
+
+def test_any_chunking_yields_each_field_once_in_order():
+    for size in (1, 2, 3, 7, 64, len(REPLY)):
+        parser, pairs = feed_in_chunks(size)
+        assert pairs == list(EXPECTED.items()), size
+        assert parser.finished and parser.fields == EXPECTED
+
+def test_number_is_held_back_until_a_delimiter_arrives():
+    parser = IncrementalFieldParser()
+    assert parser.feed('{"an": 20') == []
+    assert parser.feed('19') == []
+    assert parser.feed(', "km"') == [('an', 2019)]
+    assert parser.feed(': 5}') == [('km', 5)]
+
+def test_escape_split_across_chunks():
+    parser = IncrementalFieldParser()
+    assert parser.feed('{"model": "A\\') == []
+    assert parser.feed('"4\\u00') == []
+    assert parser.feed('e9"') == [('model', 'A"4é')]
+
+def test_text_after_the_object_is_ignored():
+    parser = IncrementalFieldParser()
+    parser.feed('{"a": 1} {"b": 2}')
+    assert parser.fields == {'a': 1}
+
+def test_parse_json_object_keeps_complete_fields_of_a_truncated_reply():
+    assert parse_json_object('```json\n{"marca": "VW", "an": 2015, "model": "Gol') == {'marca': 'VW', 'an': 2015}
+    assert parse_json_object('{"marca": "VW", "an": 2015') == {'marca': 'VW', 'an': 2015}
+    assert parse_json_object('no JSON here') is None
+    assert parse_json_object('{}') is None
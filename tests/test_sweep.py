@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+import sweep
+from tariffs import DEFAULT_TARIFF_FILE, load_tariffs
+
+@pytest.mark.parametrize('axis', [
+    {'vehicle_price': {'min': 0, 'max': 1, 'steps': 10**12}},
+    {'vehicle_price': {'min': 0, 'max': 1e12, 'step': 1}},
+    {'co2': {'min': 0, 'max': 1e12}},
+    {'vehicle_price': {'min': 0, 'max': 1, 'step': 1e-300}},
+    {'vehicle_price': {'min': 0, 'max': 'inf', 'step': 1}},
+    {'vehicle_price': [1, 2], 'year': [2015, 2016], 'co2': {'min': 0, 'max': 10**6}, 'shipping_method': 'roro'},
+])
+def test_oversized_axes_are_rejected_before_allocating(client, axis):
+    response = client.post('/api/calculate-costs/sweep', json=axis)
+    assert response.status_code == 400
+    assert 'limit' in response.json['error'] or 'finite' in response.json['error']
+
+def test_axis_at_the_limit_is_accepted(app_module, client):
+    steps = app_module.SWEEP_MAX_CELLS // 3
+    response = client.post('/api/calculate-costs/sweep', json={
+        'vehicle_price': {'min': 0, 'max': 1, 'steps': steps}, 'year': 2020, 'co2': 150})
+    assert response.status_code == 200
+
+def test_free_zone_no_bpm_break_even_is_analytic():
+    result = sweep.sweep({'vehicle_price': {'min': 0, 'max': 1000, 'step': 0.01}, 'year': 2024, 'co2': 250,
+                          'encoding': 'json'}, load_tariffs(DEFAULT_TARIFF_FILE))
+    roro = result['axes']['shipping_method'].index('roro')
+    shipping = result['shipping'][roro]
+    # FREE ZONE: vp + s + 600 + 950; NO BPM: vp + s + 600 + 0.1vp + 0.21(vp + s + 0.1vp) + 550
+    expected = (400 - 0.21 * shipping) / (0.1 + 0.21 * 1.1)
+    assert result['break_even']['FREE ZONE|NO BPM'][roro] == [[round(expected, 2)]]
+    # Below it NO BPM is cheapest, above it FREE ZONE
+    prices = np.array(result['axes']['vehicle_price'])
+    recommendation = np.array(result['recommendation'])[roro, :, 0, 0]
+    assert set(recommendation[prices < expected - 0.01]) == {2}
+    assert set(recommendation[prices > expected + 0.01]) == {0}
+    # Containers cost too much to ship for NO BPM ever to beat FREE ZONE
+    for method in ('container_20ft', 'container_40ft'):
+        assert result['break_even']['FREE ZONE|NO BPM'][result['axes']['shipping_method'].index(method)] == [[None]]
@@ -0,0 +1,43 @@
+import random
+from datetime import date
+
+import numpy as np
+import pytest
+
+from tariffs import load_tariffs
+
+REFERENCE_DATE = date(2025, 6, 1)
+
+def legacy_calculate_bpm(co2, year, fuel_type):
+    """calculate_bpm() as it was before the tariff engine (hard-wired to 2025)"""
+    age = 2025 - year
+    if age >= 5: return 0
+    bpm = 400
+    if co2 > 82:
+        bpm += (min(co2,140)-82)*80
+        if co2 > 140: bpm += (min(co2,180)-140)*120
+        if co2 > 180: bpm += (co2-180)*180
+    if fuel_type.lower()=='diesel' and co2>82: bpm += (co2-82)*90
+    return round(bpm * (1 - min(age*0.2, 1.0)), 2)
+
+@pytest.fixture(scope='module')
+def samples():
+    rng = random.Random(20250601)
+    n = 5000
+    # Past the 600 g/km table edge too, so the computed fallback is covered
+    co2 = [rng.randint(0, 900) for _ in range(n)]
+    year = [rng.randint(2015, 2025) for _ in range(n)]
+    fuel = [rng.choice(('benzina', 'diesel', 'Diesel', 'hybrid', 'electric')) for _ in range(n)]
+    return co2, year, fuel
+
+def test_scalar_lookup_matches_legacy(samples):
+    engine = load_tariffs()
+    for c, y, f in zip(*samples):
+        assert engine.bpm(c, y, f, REFERENCE_DATE) == legacy_calculate_bpm(c, y, f), (c, y, f)
+
+def test_array_lookup_matches_legacy(samples):
+    co2, year, fuel = samples
+    engine = load_tariffs()
+    result = engine.bpm_array(np.array(co2), np.array(year), np.array([f.lower() == 'diesel' for f in fuel]),
+                              REFERENCE_DATE)
+    assert result.tolist() == [legacy_calculate_bpm(c, y, f) for c, y, f in zip(co2, year, fuel)]